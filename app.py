@@ -1,49 +1,484 @@
 """This module contains the Flask app that serves the API endpoints."""
 
+import atexit
+import functools
+import hashlib
+import json
 import os
-import base64
-from flask import Flask, request, send_from_directory, render_template
-from spreadsheet_reader import read_spreadsheet
-from pdf_generator import generate_pdf
+import uuid
+import zipfile
+from flask import (
+    Flask,
+    Response,
+    redirect,
+    request,
+    send_from_directory,
+    render_template,
+    jsonify,
+    url_for,
+    stream_with_context,
+    )
+from werkzeug.utils import secure_filename
+from spreadsheet_reader import read_spreadsheet, read_workbook
+from pdf_generator import generate_pdf, generate_combined_pdf, generate_class_parts
+from pdf_generator import iter_student_pdfs
+from jobs import MAX_WORKERS, WEB_WORKERS, submit_job, add_finished_job, get_job, list_jobs
+from class_table import ClassTable
+from render_cache import DEFAULT_MAX_BYTES as RENDER_CACHE_MAX_BYTES
+from render_cache import RenderCache, fingerprint
+from spreadsheet_cache import DEFAULT_MAX_BYTES, SpreadsheetCache
+from folder_eviction import DEFAULT_UPLOAD_MAX_BYTES, DEFAULT_OUTPUT_MAX_BYTES
+from folder_eviction import evict_entries, get_entry_key, touch_entry
+from metrics import time_stage, increment, flush, flush_if_due, render_metrics
+from zip_stream import STREAM_CHUNK_SIZE, iter_student_zip
 
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads/'
 OUTPUT_FOLDER = 'pdfs/'
 
-# Ensure directories exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# The number of worker processes each job draws the student pages with.
+# Each gunicorn worker runs up to MAX_WORKERS jobs at once, and each job
+# starts its own, so by default the CPUs are shared between all of them
+# rather than each job taking all of them, which gives each job two
+# processes on a machine with enough CPUs
+RENDER_PROCESSES = int(os.environ.get(
+    'RENDER_PROCESSES',
+    max(1, (os.cpu_count() or 1) // (MAX_WORKERS * WEB_WORKERS)),
+    ))
+
+# Either 'matplotlib' or 'reportlab', see pdf_generator.CHART_BACKENDS
+CHART_BACKEND = os.environ.get('CHART_BACKEND', 'matplotlib')
+
+# What has been rendered for each student is kept here, so that only the
+# students whose data changed are rendered again when a sheet is re-uploaded
+RENDER_CACHE = RenderCache(
+    os.environ.get('RENDER_CACHE_FOLDER', 'render_cache/'),
+    int(os.environ.get('RENDER_CACHE_BYTES', RENDER_CACHE_MAX_BYTES)),
+    )
+
+# The classes read from each spreadsheet are kept here, so that the workbook
+# is only parsed once when it is uploaded again with other options
+SPREADSHEET_CACHE = SpreadsheetCache(
+    os.environ.get('SPREADSHEET_CACHE_FOLDER', 'spreadsheet_cache/'),
+    int(os.environ.get('SPREADSHEET_CACHE_BYTES', DEFAULT_MAX_BYTES)),
+    )
+
+# The uploads and report forms are kept by the hash of their content, and
+# once they take more than this on disk, the least recently used are removed
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_BYTES', DEFAULT_UPLOAD_MAX_BYTES))
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_BYTES', DEFAULT_OUTPUT_MAX_BYTES))
+
+# Classes with at least this many students are drawn in the low-memory mode,
+# so that a job's memory does not grow with the size of the class
+LOW_MEMORY_STUDENTS = int(os.environ.get('LOW_MEMORY_STUDENTS', 1000))
+
+def get_class_details(spreadsheet):
+    """This function prepares a class read from a spreadsheet for the PDF generator.
 
-if not os.path.exists(OUTPUT_FOLDER):
-    os.makedirs(OUTPUT_FOLDER)
+    Args:
+        spreadsheet (tuple): A tuple as returned by read_spreadsheet.
+
+    Returns:
+        tuple: The title records, class records, class averages, number of
+            students and class table, as taken by generate_pdf.
+    """
+    # Expecting student_records structure as:
+    # Student ID, Student Name, Gender, English, Kiswahili,
+    # Mathematics, Science, SST/RE, Total, Position
+    (
+        school_name,
+        class_name,
+        term_name,
+        class_records,
+        _,
+    ) = spreadsheet
+
+    title_records = [
+            school_name,
+            class_name,
+            term_name,
+        ]
+
+    # The marks are converted once here, for all the later stages,
+    # and the class statistics are computed from them
+    class_table = ClassTable(class_records[0])
+    class_averages = class_table.class_averages()
+
+    if class_table.unparseable_marks:
+        increment('report_unparseable_marks_total', len(class_table.unparseable_marks))
+
+    return (
+        title_records,
+        class_records,
+        class_averages,
+        len(class_table),
+        class_table,
+        )
+
+def generate_class_pdfs(classes, output_path):
+    """This function generates a PDF for each class in parallel, and zips them up.
+
+    Args:
+        classes (list): The details of each class, see get_class_details.
+        output_path (str): The path to write the ZIP file to.
+
+    Returns:
+        None
+    """
+    class_paths = [
+        f"{os.path.splitext(output_path)[0]}_{class_number}.pdf"
+        for class_number in range(len(classes))
+        ]
+
+    # Each class is drawn by a worker process of its own, with its pages in one part
+    class_parts = generate_class_parts(
+        classes,
+        class_paths,
+        RENDER_PROCESSES,
+        CHART_BACKEND,
+        RENDER_CACHE,
+        low_memory_students=LOW_MEMORY_STUDENTS,
+        )
+
+    # Each class is zipped up as soon as it is finished
+    with zipfile.ZipFile(output_path, 'w') as zip_file:
+        for class_number, (class_path, class_details) in enumerate(zip(class_parts, classes), start=1):
+            class_name = class_details[0][1]
+            zip_file.write(
+                class_path,
+                secure_filename(f"{class_number}_{class_name}.pdf"),
+                )
+            os.remove(class_path)
+
+def generate_student_pdfs(classes, output_dir):
+    """This function writes a PDF for each student into a directory.
+
+    Each PDF is written under a temporary name unique to the job and then
+    renamed, so that a PDF is only ever seen in the directory once it is
+    complete, and the ZIP file can be streamed to users while the rest are
+    being generated. As the directory is shared by every job for the same
+    spreadsheet and options, two jobs writing it at the same time never
+    write the same temporary file, and whichever renames last replaces an
+    identical PDF.
+
+    Args:
+        classes (list): The details of each class, see get_class_details.
+        output_dir (str): The directory to write the PDF files to.
+
+    Returns:
+        None
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    temp_suffix = f".{uuid.uuid4().hex}.part"
+
+    student_number = 0
+    for (
+            title_records,
+            class_records,
+            class_averages,
+            number_of_students,
+            class_table,
+            ) in classes:
+        for student_name, pdf_data in iter_student_pdfs(
+                title_records,
+                class_records,
+                class_averages,
+                number_of_students,
+                processes=RENDER_PROCESSES,
+                chart_backend=CHART_BACKEND,
+                class_table=class_table,
+                render_cache=RENDER_CACHE,
+                # Drawn in parts, so that the PDFs can be streamed as each is finished
+                low_memory=True,
+                ):
+            student_number += 1
+
+            # The number keeps the students in the order of the spreadsheet
+            pdf_path = os.path.join(
+                output_dir,
+                secure_filename(f"{student_number:05d}_{title_records[1]}_{student_name}.pdf"),
+                )
+            temp_path = f"{pdf_path}{temp_suffix}"
+            with open(temp_path, 'wb') as pdf_file:
+                pdf_file.write(pdf_data)
+            os.replace(temp_path, pdf_path)
+
+def hash_file(file_path):
+    """This function returns the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        str: The hash as a hex string.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_output_path(file_hash, all_sheets, per_class, per_student):
+    """This function returns where the report forms of a spreadsheet are written.
+
+    The path is keyed by the hash of the spreadsheet's content and every
+    option that changes the report forms, so that the same upload with the
+    same options can reuse the report forms already generated.
+
+    Args:
+        file_hash (str): The hash of the spreadsheet's content.
+        all_sheets (bool): See generate_report.
+        per_class (bool): See generate_report.
+        per_student (bool): See generate_report.
+
+    Returns:
+        str: The path to the PDF or ZIP file, or to the directory of PDFs for
+            each student.
+    """
+    output_key = fingerprint(
+        file_hash,
+        all_sheets,
+        per_class,
+        per_student,
+        CHART_BACKEND,
+        )
+
+    # The PDF for each student is written into a directory of its own,
+    # which is zipped up as it is downloaded
+    if per_student:
+        return os.path.join(OUTPUT_FOLDER, output_key)
+    if per_class:
+        return os.path.join(OUTPUT_FOLDER, f"{output_key}.zip")
+    return os.path.join(OUTPUT_FOLDER, f"{output_key}.pdf")
+
+def read_manifest(output_path):
+    """This function returns the summary of the classes of finished report forms.
+
+    The manifest is only written once the report forms are complete.
+
+    Args:
+        output_path (str): The path the report forms are written to.
+
+    Returns:
+        dict: The summary of the classes, see summarise_classes, or None if
+            the report forms are not finished.
+    """
+    try:
+        with open(f"{output_path}.json", encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        return {
+            'number_of_students': manifest['number_of_students'],
+            # Manifests written before the marks were reported have none
+            'unparseable_marks': manifest.get('unparseable_marks', []),
+        }
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+def write_manifest(output_path, summary):
+    """This function marks report forms as finished, for read_manifest.
+
+    Args:
+        output_path (str): The path the report forms are written to.
+        summary (dict): The summary of the classes, see summarise_classes.
+
+    Returns:
+        None
+    """
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(summary, manifest_file)
+    os.replace(temp_path, f"{output_path}.json")
+
+def generate_report(file_path, output_path, all_sheets=False, per_class=False, per_student=False):
+    """This function reads a spreadsheet and generates the PDF for all students.
+
+    This runs in a worker process, so that the web workers stay free while
+    the report forms are rendered. Once they are complete, a manifest is
+    written next to them, see read_manifest.
+
+    Args:
+        file_path (str): The path to the uploaded spreadsheet.
+        output_path (str): The path to write the PDF file to, or the ZIP file
+            if there is a PDF for each class.
+        all_sheets (bool): Whether to generate the report forms for every sheet
+            in the workbook, each sheet being a class, or just the active one.
+        per_class (bool): Whether to generate a PDF for each class, zipped up,
+            instead of a single PDF for all classes.
+        per_student (bool): Whether to generate a PDF for each student, written
+            into the directory at output_path.
+
+    Returns:
+        dict: The summary of the classes, see summarise_classes.
+    """
+    # The report forms are written under a name of the job's own, and
+    # renamed when they are complete, so that jobs for the same spreadsheet
+    # never see each other's partly written files
+    if per_student:
+        work_path = output_path
+    else:
+        root, extension = os.path.splitext(output_path)
+        work_path = f"{root}.{uuid.uuid4().hex}.part{extension}"
+
+    try:
+        summary = generate_report_pdf(
+            file_path,
+            work_path,
+            all_sheets,
+            per_class,
+            per_student,
+            )
+        if work_path != output_path:
+            os.replace(work_path, output_path)
+        write_manifest(output_path, summary)
+        return summary
+    finally:
+        if work_path != output_path and os.path.exists(work_path):
+            os.remove(work_path)
+
+        # What the job rendered may have taken the cache over its size
+        RENDER_CACHE.evict()
+
+        # The metrics of the worker process are only seen once written
+        flush()
+
+def read_classes(file_path, all_sheets):
+    """This function reads the classes of a spreadsheet, unless they were read before.
+
+    The classes are cached by the spreadsheet's content, so the same
+    spreadsheet uploaded again, even under another name, is not parsed again.
+
+    Args:
+        file_path (str): The path to the uploaded spreadsheet.
+        all_sheets (bool): See generate_report.
+
+    Returns:
+        list: A read_spreadsheet tuple for each class.
+    """
+    key = fingerprint(
+        hash_file(file_path),
+        os.path.splitext(file_path)[1].lower(),
+        all_sheets,
+        )
+
+    spreadsheets = SPREADSHEET_CACHE.get(key)
+    if spreadsheets is not None:
+        increment('report_spreadsheet_cache_hits_total')
+        return spreadsheets
+
+    if all_sheets:
+        spreadsheets = read_workbook(file_path)
+    else:
+        spreadsheets = [
+            read_spreadsheet(
+                file_path,
+                streaming=True,
+                )
+            ]
+
+    SPREADSHEET_CACHE.put(key, spreadsheets)
+    return spreadsheets
+
+def generate_report_pdf(file_path, output_path, all_sheets, per_class, per_student):
+    """This function generates the PDF for generate_report, timing each stage.
+
+    Args:
+        file_path (str): The path to the uploaded spreadsheet.
+        output_path (str): See generate_report.
+        all_sheets (bool): See generate_report.
+        per_class (bool): See generate_report.
+        per_student (bool): See generate_report.
+
+    Returns:
+        dict: The summary of the classes, see summarise_classes.
+    """
+    with time_stage('parse'):
+        spreadsheets = read_classes(file_path, all_sheets)
+
+    with time_stage('stats'):
+        classes = [get_class_details(spreadsheet) for spreadsheet in spreadsheets]
+
+    if per_student:
+        generate_student_pdfs(
+            classes,
+            output_path,
+            )
+        return summarise_classes(classes)
+
+    if per_class:
+        generate_class_pdfs(
+            classes,
+            output_path,
+            )
+    elif len(classes) == 1:
+        generate_pdf(
+            *classes[0][:3],
+            output_path,
+            classes[0][3],
+            processes=RENDER_PROCESSES,
+            chart_backend=CHART_BACKEND,
+            class_table=classes[0][4],
+            render_cache=RENDER_CACHE,
+            low_memory=classes[0][3] >= LOW_MEMORY_STUDENTS,
+            )
+    else:
+        generate_combined_pdf(
+            classes,
+            output_path,
+            processes=RENDER_PROCESSES,
+            chart_backend=CHART_BACKEND,
+            render_cache=RENDER_CACHE,
+            low_memory=sum(class_details[3] for class_details in classes) >= LOW_MEMORY_STUDENTS,
+            )
+
+    # Check if the PDF has any size to it
+    if os.path.getsize(output_path) == 0:
+        raise RuntimeError('PDF is empty. Something went wrong.')
 
-def convert_pdf_to_base64(pdf_file_path):
-    """This function converts a PDF file to a base64 string.
+    return summarise_classes(classes)
+
+def summarise_classes(classes):
+    """This function returns what users are told about the classes of a job.
 
     Args:
-        pdf_file_path (str): The path to the PDF file.
+        classes (list): The details of each class, see get_class_details.
 
     Returns:
-        str: A base64 string representation of the PDF file.
+        dict: The number of students in all the classes, and the class,
+            student, subject and cell value of each mark that was not a
+            number and was taken as 0.
     """
-    with open(pdf_file_path, "rb") as pdf_file:
-        encoded_string = base64.b64encode(pdf_file.read()).decode('utf-8')
-    return encoded_string
+    return {
+        'number_of_students': sum(class_details[3] for class_details in classes),
+        'unparseable_marks': [
+            {
+                'class_name': str(title_records[1]),
+                'student_id': str(student_id),
+                'student_name': str(student_name),
+                'subject': str(subject),
+                'value': str(value),
+            }
+            for title_records, _, _, _, class_table in classes
+            for student_id, student_name, subject, value in class_table.unparseable_marks
+            ],
+    }
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """This function uploads a spreadsheet and generates PDFs for each student.
+    """This function uploads a spreadsheet and enqueues a job to generate the PDF.
 
     The spreadsheet is assumed to have the headers in the first row and the
     data in the subsequent rows. Users would need to ensure that the spreadsheet
-    is in this format.
+    is in this format. With the all_sheets form field set, every sheet in the
+    workbook is read as a class, and with output set to per_class or
+    per_student, a ZIP file with a PDF for each class or for each student is
+    generated instead of a single PDF.
 
     Args:
         None
 
     Returns:
-        str: A string indicating whether the PDFs were generated successfully.
+        str: A page that polls the job's status, along with the job ID.
     """
     if 'file' not in request.files:
         return 'No file uploaded', 400
@@ -52,63 +487,318 @@ def upload_file():
     if file.filename == '':
         return 'No file selected', 400
 
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(file_path)
+    # The upload is saved under a name of its own, and then renamed after
+    # the hash of its content, so that concurrent uploads never overwrite
+    # each other, and the same spreadsheet is only stored once
+    # The directories are created when first needed, not on import
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+    temp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.part")
+    with time_stage('upload_save'):
+        file.save(temp_path)
+    increment('report_uploads_total')
+
+    file_hash = hash_file(temp_path)
+    extension = os.path.splitext(secure_filename(file.filename))[1].lower()
+    file_path = os.path.join(UPLOAD_FOLDER, f"{file_hash}{extension}")
+    os.replace(temp_path, file_path)
+
+    # Every sheet of the workbook can be a class of its own,
+    # with either a single PDF or a PDF for each class or student
+    all_sheets = request.form.get('all_sheets') == 'on'
+    per_class = request.form.get('output') == 'per_class'
+    per_student = request.form.get('output') == 'per_student'
+
+    output_path = get_output_path(
+        file_hash,
+        all_sheets,
+        per_class,
+        per_student,
+        )
 
-    # Expecting student_records structure as:
-    # Student ID, Student Name, Gender, English, Kiswahili,
-    # Mathematics, Science, SST/RE, Total, Position
-    (
-        school_name,
-        class_name,
-        term_name,
-        class_records,
-        number_of_students,
-    ) = read_spreadsheet(file_path)
+    # The job is named after the report forms it generates, so that any
+    # worker process can find it, and the same upload finds the same job
+    job_id = get_entry_key(os.path.basename(output_path))
+
+    # The same spreadsheet with the same options gives the same report forms
+    summary = read_manifest(output_path)
+    if summary is not None:
+        increment('report_output_cache_hits_total')
+
+        # Reused report forms are the last to be evicted
+        touch_entry(output_path)
+        touch_entry(f"{output_path}.json")
+
+        add_finished_job(
+            job_id,
+            summary,
+            output_path=output_path,
+            upload_path=file_path,
+            per_student=per_student,
+            )
+
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(get_job_details(find_job(job_id)))
+
+        return redirect(url_for('job_result', job_id=job_id))
+
+    # Nothing is submitted if the same job is already queued or running
+    future = submit_job(
+        job_id,
+        generate_report,
+        file_path,
+        output_path,
+        all_sheets,
+        per_class,
+        per_student,
+        output_path=output_path,
+        upload_path=file_path,
+        per_student=per_student,
+        )
+    if future is not None:
+        future.add_done_callback(record_job_outcome)
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(get_job_details(find_job(job_id))), 202
+
+    return render_template(
+        'job_pending.html',
+        job_id=job_id,
+        ), 202
+
+def record_job_outcome(future):
+    """This function counts a finished job, and the students it was for.
+
+    What the job wrote may have taken the uploads or the report forms over
+    their sizes, so they are evicted here too, see evict_files.
+
+    Args:
+        future (concurrent.futures.Future): The future of the job.
+
+    Returns:
+        None
+    """
+    if future.cancelled() or future.exception() is not None:
+        increment('report_jobs_total', status='failed')
+    else:
+        increment('report_jobs_total', status='done')
+        increment('report_students_total', future.result()['number_of_students'])
+    flush()
+
+    evict_files()
 
-    # We generate a single PDF now with all student records
-    output_path = os.path.join(
+def evict_files():
+    """This function removes the least recently used uploads and report forms.
+
+    The files of the jobs finished under JOB_TTL_SECONDS ago are kept, so
+    that they can still be downloaded, and so are those of the jobs still
+    running, see list_jobs.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    jobs = list_jobs()
+    evict_entries(
+        UPLOAD_FOLDER,
+        UPLOAD_MAX_BYTES,
+        keep=[job['upload_path'] for job in jobs if 'upload_path' in job],
+        )
+    evict_entries(
         OUTPUT_FOLDER,
-        "all_students_report.pdf",
+        OUTPUT_MAX_BYTES,
+        keep=[job['output_path'] for job in jobs if 'output_path' in job],
         )
 
-    title_records = [
-            school_name,
-            class_name,
-            term_name,
-        ]
+def find_job(job_id):
+    """This function returns a job, as done as soon as its report forms are.
 
-    class_averages_with_total = list(class_records[0][-3][3:15])
+    The job's record is written by the process running it, and the manifest
+    of its report forms once they are complete, so a job is done once either
+    says so, even if its process exited before writing the record.
 
-    mean = sum(list(class_records[0][-3][3:14])) / 11
+    Args:
+        job_id (str): The ID of the job.
 
-    class_averages_with_mean = list(list(class_records[0][-3][3:14]) + [mean])
+    Returns:
+        dict: The job, as returned by get_job, or None if it does not exist.
+    """
+    job = get_job(job_id)
+    if job is None or job['status'] == 'done':
+        return job
 
-    class_averages = [
-        class_averages_with_total,
-        class_averages_with_mean,
-        ]
+    summary = read_manifest(job['output_path'])
+    if summary is not None:
+        job.update(status='done', result=summary)
 
-    generate_pdf(
-        title_records,
-        class_records,
-        class_averages,
-        output_path,
-        number_of_students,
-        )
+    return job
 
-    # Check if the PDF has any size to it
-    if os.path.getsize(output_path) == 0:
-        return 'PDF is empty. Something went wrong.', 500
+def get_job_details(job):
+    """This function returns the details of a job that can be shown to users.
+
+    Args:
+        job (dict): The job, as returned by find_job.
+
+    Returns:
+        dict: The job's ID, status, URLs, and the number of students and the
+            marks that were not numbers, or the error, if any.
+    """
+    job_id = get_entry_key(os.path.basename(job['output_path']))
+
+    details = {
+        'job_id': job_id,
+        'status': job['status'],
+        'status_url': url_for('job_status', job_id=job_id),
+        'download_url': url_for('job_pdf', job_id=job_id),
+    }
+
+    if job['status'] == 'done':
+        details.update(job['result'])
+    elif job['status'] == 'failed':
+        details['error'] = job['error']
+
+    return details
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """This function returns the status of a report-generation job.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        str: A JSON object with the job's details.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return 'Job not found', 404
+
+    return jsonify(get_job_details(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """This function serves the results page of a finished job.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        str: The results page, or an error if the job is not finished.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return 'Job not found', 404
+
+    if job['status'] == 'failed':
+        return 'PDF could not be generated. Something went wrong.', 500
+
+    if job['status'] != 'done':
+        return render_template(
+            'job_pending.html',
+            job_id=job_id,
+            ), 202
+
+    # The PDF is only referred to by its URL, and streamed from the disk
+    # when it is viewed, rather than inlined into the page
+    if job['output_path'].endswith('.pdf'):
+        view_url = url_for('job_pdf', job_id=job_id, inline=1)
+    else:
+        view_url = None
 
-    # Convert the PDF to Base64
-    pdf_base64_data = convert_pdf_to_base64(output_path)
     return render_template(
         'show_pdf.html',
-        pdf_base64_data=pdf_base64_data,
-        number_of_students=number_of_students,
+        view_url=view_url,
+        download_url=url_for('job_pdf', job_id=job_id),
+        **job['result'],
         )
 
+@app.route('/jobs/<job_id>/pdf', methods=['GET'])
+def job_pdf(job_id):
+    """This function serves the PDF file of a finished job.
+
+    The file is streamed from the disk, with support for Range requests,
+    so that PDF viewers can load the pages they show first. With the inline
+    query parameter, the PDF is shown in the browser instead of downloaded.
+    With a PDF for each student, the ZIP file is streamed as the PDFs are
+    generated, so it can be downloaded before the job has finished.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        str: The PDF file, or an error if the job is not finished.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return 'Job not found', 404
+
+    if job['status'] == 'failed':
+        return 'PDF could not be generated. Something went wrong.', 500
+
+    # The files are named after the hash of the spreadsheet,
+    # so they are downloaded under a name users can recognise
+    if job.get('per_student'):
+        return Response(
+            stream_with_context(iter_student_zip(
+                job['output_path'],
+                functools.partial(find_job, job_id),
+                )),
+            mimetype='application/zip',
+            headers={
+                'Content-Disposition': 'attachment; filename="student_reports.zip"',
+            },
+            )
+
+    if job['status'] != 'done':
+        return f"Job is {job['status']}", 409
+
+    if job['output_path'].endswith('.zip'):
+        download_name = 'class_reports.zip'
+    else:
+        download_name = 'all_students_report.pdf'
+
+    return send_from_directory(
+        OUTPUT_FOLDER,
+        os.path.basename(job['output_path']),
+        as_attachment='inline' not in request.args,
+        download_name=download_name,
+        conditional=True,
+        )
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """This function serves the counters and stage latencies for Prometheus.
+
+    Args:
+        None
+
+    Returns:
+        str: The metrics of the app and its workers, in the text format.
+    """
+    return Response(
+        render_metrics(),
+        mimetype='text/plain; version=0.0.4',
+        )
+
+@app.after_request
+def flush_metrics(response):
+    """This function writes the metrics recorded while handling requests, every few seconds.
+
+    Args:
+        response (flask.Response): The response to the request.
+
+    Returns:
+        flask.Response: The same response.
+    """
+    flush_if_due()
+    return response
+
+# The metrics of a worker's last requests are written when it exits
+atexit.register(flush)
+
 @app.route('/pdfs/<filename>', methods=['GET'])
 def serve_pdf(filename):
     """This function serves a PDF file.
@@ -0,0 +1,23 @@
+"""Tests for what app.py imports"""
+
+import unittest
+
+from benchmark import measure_import
+
+
+class TestDeferredImports(unittest.TestCase):
+    """Tests for the modules the app only imports when a report is generated."""
+
+    def test_import_app(self):
+        """Test that the app imports without the plotting libraries.
+
+        How long the import takes depends on the machine, so it is checked
+        against IMPORT_BUDGET_SECONDS by benchmark.py instead.
+        """
+        app_import = measure_import('app')
+
+        self.assertEqual(app_import['deferred_modules_imported'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,397 @@
+"""This module benchmarks the report generation on synthetic class workbooks.
+
+The workbooks are generated in the layout used by Kenyan primary schools,
+with the school, class and term in the first rows, a row of column heads,
+a row for each student, and the averages, the headteacher's remarks and
+the class teacher's name at the bottom.
+
+Each stage is run in a fresh worker process, so that the peak memory of one
+stage does not hide the peak memory of the next. The results are written to
+a JSON file, e.g.
+
+    python benchmark.py --sizes 10 100 1000 10000 --output benchmark_results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import openpyxl
+
+
+SIZES = (10, 100, 1000, 10000)
+
+STAGES = (
+    'read_spreadsheet',
+    'class_table',
+    'create_student_plot_buffer',
+    'generate_pdf',
+    'generate_pdf_cached',
+    )
+
+# How long importing the app may take in a fresh process, in seconds,
+# so that new instances are ready to serve requests quickly
+IMPORT_BUDGET_SECONDS = 1.0
+
+# The modules that should only be imported when a report is generated
+DEFERRED_MODULES = ('matplotlib', 'matplotlib.pyplot', 'reportlab.platypus')
+
+SUBJECTS = (
+    "English", "Kiswahili", "Mathematics", "Sci & Tech", "Art & Craft", "Music",
+    "Home Science", "Agriculture", "Religious Ed.", "Social Studies", "Physical Ed",
+    )
+
+FIRST_NAMES = (
+    "Wanjiru", "Otieno", "Achieng", "Kamau", "Njeri", "Kiprop", "Chebet",
+    "Omondi", "Wafula", "Akinyi", "Mutua", "Nyambura", "Kipchoge", "Auma",
+    )
+
+LAST_NAMES = (
+    "Mwangi", "Odhiambo", "Kariuki", "Wambui", "Kiptoo", "Onyango", "Njoroge",
+    "Barasa", "Cheruiyot", "Muthoni", "Ochieng", "Kimani", "Wekesa", "Jepkosgei",
+    )
+
+HEADTEACHER_REMARKS = (
+    "Parents, please review this report with your child, offering guidance "
+    "and support in areas needing improvement. School reopens on 2nd May."
+    )
+
+
+def write_class_workbook(file_path: str, number_of_students: int, seed: int = 0) -> None:
+    """This function writes a synthetic class workbook in the expected layout.
+
+    The totals, positions and averages are filled in, as they would be in a
+    workbook saved by a spreadsheet program.
+
+    Args:
+        file_path (str): The path to write the workbook to.
+        number_of_students (int): The number of students in the class.
+        seed (int): The seed for the random marks and names.
+
+    Returns:
+        None
+    """
+    rng = random.Random(seed)
+
+    students = []
+    for index in range(number_of_students):
+        marks = [rng.randint(15, 99) for _ in SUBJECTS]
+        students.append([
+            index + 1,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+            rng.choice(("Male", "Female")),
+            *marks,
+            sum(marks),
+            ])
+
+    # Students with the same total share a position
+    totals = sorted((student[-1] for student in students), reverse=True)
+    positions = {}
+    for position, total in enumerate(totals, start=1):
+        positions.setdefault(total, position)
+
+    averages = [
+        round(sum(student[column] for student in students) / max(number_of_students, 1), 2)
+        for column in range(3, 3 + len(SUBJECTS) + 1)
+        ]
+
+    # The write-only mode keeps the large workbooks quick to write
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Grade 6")
+    sheet.append(["Sample Primary School"])
+    sheet.append(["Grade 6"])
+    sheet.append(["Term 1 2024"])
+    sheet.append(["Student ID", "Student Name", "Gender", *SUBJECTS, "Total", "Position"])
+    for student in students:
+        sheet.append(student + [positions[student[-1]]])
+    sheet.append(["Averages", None, None, *averages])
+    sheet.append([HEADTEACHER_REMARKS])
+    sheet.append(["Mr. Kennedy Otieno"])
+    workbook.save(file_path)
+
+def measure_import(module: str = 'app') -> dict:
+    """This function measures how long a module takes to import in a fresh process.
+
+    Args:
+        module (str): The name of the module, e.g. 'app'.
+
+    Returns:
+        dict: The import time in seconds, whether it is within
+            IMPORT_BUDGET_SECONDS, and which of DEFERRED_MODULES were imported
+            along with it.
+    """
+    completed = subprocess.run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            f"import sys, {module}; print(' '.join(sys.modules))",
+            ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+    # Each line is "import time: self [us] | cumulative | imported package"
+    import_time = None
+    for line in completed.stderr.splitlines():
+        columns = line.split('|')
+        if len(columns) == 3 and columns[2].strip() == module:
+            import_time = int(columns[1]) / 1e6
+
+    imported_modules = set(completed.stdout.split())
+
+    return {
+        'module': module,
+        'import_time_s': import_time,
+        'budget_s': IMPORT_BUDGET_SECONDS,
+        'within_budget': import_time is not None and import_time < IMPORT_BUDGET_SECONDS,
+        'deferred_modules_imported': [
+            name for name in DEFERRED_MODULES if name in imported_modules
+            ],
+    }
+
+def get_peak_memory_mib() -> float:
+    """This function returns the peak resident memory of the process so far.
+
+    Returns:
+        float: The peak memory in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def read_class(file_path: str) -> tuple:
+    """This function reads a class workbook, as the app does for an upload.
+
+    Args:
+        file_path (str): The path to the workbook.
+
+    Returns:
+        tuple: The title records, class records, class averages, number of
+            students and class table, as taken by generate_pdf.
+    """
+    from spreadsheet_reader import read_spreadsheet  # pylint: disable=import-outside-toplevel
+    from class_table import ClassTable  # pylint: disable=import-outside-toplevel
+
+    school_name, class_name, term_name, class_records, _ = read_spreadsheet(
+        file_path,
+        streaming=True,
+        )
+    class_table = ClassTable(class_records[0])
+
+    return (
+        [school_name, class_name, term_name],
+        class_records,
+        class_table.class_averages(),
+        len(class_table),
+        class_table,
+        )
+
+def run_stage(stage: str, file_path: str, options: dict) -> dict:
+    """This function runs a stage of the report generation once and measures it.
+
+    Anything the stage needs, e.g. the class read from the workbook, is
+    prepared before the clock is started.
+
+    Args:
+        stage (str): One of STAGES.
+        file_path (str): The path to the workbook.
+        options (dict): The chart backend, the number of processes, the
+            number of plots to sample, whether to use the low-memory mode and
+            the output directory.
+
+    Returns:
+        dict: The wall time, the peak memory before and after the stage, and
+            the size of what the stage produced.
+    """
+    # pylint: disable=import-outside-toplevel
+    from class_table import ClassTable
+    from pdf_generator import create_student_plot_buffer, generate_pdf
+    from render_cache import RenderCache
+    from spreadsheet_reader import read_spreadsheet
+
+    result = {}
+
+    class_details = None
+    if stage != 'read_spreadsheet':
+        class_details = read_class(file_path)
+
+    baseline_memory = get_peak_memory_mib()
+    start_time = time.perf_counter()
+
+    if stage == 'read_spreadsheet':
+        class_records = read_spreadsheet(file_path, streaming=True)[3]
+        result['output_rows'] = len(class_records[0])
+
+    elif stage == 'class_table':
+        class_table = ClassTable(class_details[1][0])
+        class_table.class_averages()
+        result['output_rows'] = len(class_table)
+
+    elif stage == 'create_student_plot_buffer':
+        students = list(class_details[4].rows())[:options['plot_sample']]
+        output_bytes = 0
+        for student in students:
+            output_bytes += len(create_student_plot_buffer(
+                student[:15],
+                class_details[2][1],
+                list(class_details[1][0][0]),
+                ).getvalue())
+        result['output_bytes'] = output_bytes
+        result['plots'] = len(students)
+
+    elif stage in ('generate_pdf', 'generate_pdf_cached'):
+        output_path = os.path.join(
+            options['output_dir'],
+            f"{os.path.basename(file_path)}.pdf",
+            )
+
+        # As app.generate_report_pdf calls it, with an empty render cache,
+        # as for a spreadsheet uploaded for the first time
+        if stage == 'generate_pdf_cached':
+            render_cache = RenderCache(tempfile.mkdtemp(dir=options['output_dir']))
+        else:
+            render_cache = None
+
+        generate_pdf(
+            *class_details[:3],
+            output_path,
+            class_details[3],
+            processes=options['processes'],
+            chart_backend=options['chart_backend'],
+            class_table=class_details[4],
+            render_cache=render_cache,
+            low_memory=options.get('low_memory', False),
+            )
+        result['output_bytes'] = os.path.getsize(output_path)
+        os.remove(output_path)
+        if render_cache is not None:
+            shutil.rmtree(render_cache.folder)
+
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    result['wall_time_s'] = time.perf_counter() - start_time
+    result['baseline_memory_mib'] = baseline_memory
+    result['peak_memory_mib'] = get_peak_memory_mib()
+
+    return result
+
+def run_benchmarks(sizes, stages, options: dict) -> dict:
+    """This function benchmarks each stage on a workbook of each size.
+
+    Args:
+        sizes (list): The numbers of students to generate workbooks for.
+        stages (list): The stages to run, see STAGES.
+        options (dict): See run_stage.
+
+    Returns:
+        dict: The environment, the options and a result for each stage and size.
+    """
+    results = []
+
+    for number_of_students in sizes:
+        file_path = os.path.join(
+            options['output_dir'],
+            f"class_{number_of_students}.xlsx",
+            )
+        write_class_workbook(file_path, number_of_students)
+
+        for stage in stages:
+            # A fresh process for each stage, so the peak memory is its own
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_stage, stage, file_path, options).result()
+
+            result.update(
+                stage=stage,
+                students=number_of_students,
+                input_bytes=os.path.getsize(file_path),
+                )
+            results.append(result)
+
+            print(
+                f"{stage:>28} {number_of_students:>6} students: "
+                f"{result['wall_time_s']:8.3f} s, {result['peak_memory_mib']:7.1f} MiB",
+                file=sys.stderr,
+                )
+
+        os.remove(file_path)
+
+    app_import = measure_import('app')
+    print(
+        f"{'import app':>28}: {app_import['import_time_s']:8.3f} s "
+        f"(budget {IMPORT_BUDGET_SECONDS} s"
+        f"{'' if app_import['within_budget'] else ', over budget'})",
+        file=sys.stderr,
+        )
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+        },
+        'options': {
+            key: value for key, value in options.items() if key != 'output_dir'
+        },
+        'import': app_import,
+        'results': results,
+    }
+
+def main(argv=None) -> None:
+    """This function runs the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--chart-backend', default='matplotlib')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument(
+        '--plot-sample',
+        type=int,
+        default=20,
+        help='The number of students to time create_student_plot_buffer on.',
+        )
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='Generate the PDF files in the low-memory mode.',
+        )
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        report = run_benchmarks(
+            args.sizes,
+            args.stages,
+            {
+                'chart_backend': args.chart_backend,
+                'processes': args.processes,
+                'plot_sample': args.plot_sample,
+                'low_memory': args.low_memory,
+                'output_dir': output_dir,
+            },
+            )
+
+    with open(args.output, 'w', encoding='utf-8') as results_file:
+        json.dump(report, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Tests for benchmark.py"""
+
+import os
+import tempfile
+import unittest
+
+from benchmark import SUBJECTS, write_class_workbook
+from class_table import ClassTable
+from spreadsheet_reader import read_spreadsheet
+
+
+class TestWriteClassWorkbook(unittest.TestCase):
+    """Tests for the synthetic class workbooks."""
+
+    def setUp(self):
+        handle, self.file_path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def test_workbook_is_read_as_a_class(self):
+        """Test that the workbook is in the layout the reader expects."""
+        write_class_workbook(self.file_path, 25)
+
+        school_name, class_name, term_name, class_records, _ = read_spreadsheet(
+            self.file_path,
+            )
+        class_table = ClassTable(class_records[0])
+
+        self.assertEqual(
+            (school_name, class_name, term_name),
+            ("Sample Primary School", "Grade 6", "Term 1 2024"),
+            )
+        self.assertEqual(len(class_table), 25)
+        self.assertEqual(class_table.subjects, list(SUBJECTS))
+
+        # The totals and positions in the sheet match the computed ones
+        students = class_records[0][1:-3]
+        self.assertEqual([student[14] for student in students], class_table.totals.tolist())
+        self.assertEqual([student[15] for student in students], class_table.positions.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+"""This module contains the columnar table of a class's student records."""
+
+import math
+import re
+
+import numpy as np
+
+
+# The columns of the student records in the spreadsheet
+ID_COLUMN = 0
+NAME_COLUMN = 1
+GENDER_COLUMN = 2
+SUBJECT_COLUMNS = slice(3, 14)
+POSITION_COLUMN = 15
+
+MARK_PATTERN = re.compile(r"^\d+(\.\d+)?$")
+
+
+def parse_mark(value) -> int:
+    """This function converts a cell of the spreadsheet to a whole mark, if it is one.
+
+    Floats are truncated to integers, and strings containing a float or
+    integer are converted accordingly. Empty cells have no marks, i.e. 0.
+
+    Args:
+        value: The value of the cell.
+
+    Returns:
+        int: The mark, or None if the cell holds something other than a mark,
+            e.g. 'absent'.
+    """
+    if value is None:
+        return 0
+
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, int):
+        return value
+
+    if isinstance(value, float):
+        return int(value) if math.isfinite(value) else None
+
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return 0
+        if MARK_PATTERN.match(value):
+            return int(float(value))
+
+    return None
+
+def to_mark(value) -> int:
+    """This function converts a cell of the spreadsheet to a whole mark.
+
+    This is the one place marks are normalised: the marks of a class are
+    converted when its ClassTable is built, and everything drawn on the
+    report forms uses those.
+
+    Args:
+        value: The value of the cell.
+
+    Returns:
+        int: The mark, or 0 if the cell holds something other than a mark,
+            see parse_mark.
+    """
+    mark = parse_mark(value)
+    return 0 if mark is None else mark
+
+def to_student_id(value):
+    """This function converts a cell of the spreadsheet to a student ID.
+
+    Args:
+        value: The value of the cell.
+
+    Returns:
+        The student ID, with floats converted to integers and None to 0.
+    """
+    if value is None:
+        return 0
+
+    if isinstance(value, float):
+        return int(value)
+
+    return value
+
+class ClassTable:
+    """This class holds the student records of a class as columns.
+
+    The table is built once when the spreadsheet is read, so that the marks
+    are only converted once, rather than each time a student row is used.
+    The class statistics are computed from the marks, rather than taken from
+    the totals, positions and averages in the sheet, whose values may be
+    missing when the sheet was not saved by a spreadsheet program.
+
+    Args:
+        class_records (list): The column heads, student records and trailer
+            rows, as the first item of the class records from read_spreadsheet.
+
+    Attributes:
+        column_heads (list): The column heads of the student records.
+        subjects (list): The names of the subjects.
+        ids (numpy.ndarray): The student IDs.
+        names (numpy.ndarray): The student names.
+        genders (numpy.ndarray): The student genders.
+        marks (numpy.ndarray): The marks, with a row for each student and a
+            column for each subject.
+        totals (numpy.ndarray): The total marks of each student.
+        positions (numpy.ndarray): The position of each student in the class,
+            students with the same total sharing the same position.
+        subject_means (numpy.ndarray): The class average of each subject.
+        mean_total (float): The class average of the total marks.
+        mean_of_means (float): The average of the subject averages.
+        unparseable_marks (list): The ID, name and subject of each student
+            whose mark is not a number, e.g. 'absent', with the cell's value.
+            These marks are taken as 0.
+        averages_row (tuple): The row with the class averages in the sheet.
+        head_teacher (str): The headteacher's remarks.
+        class_teacher (str): The class teacher's name.
+    """
+
+    def __init__(self, class_records):
+        self.column_heads = list(class_records[0])
+        self.subjects = self.column_heads[SUBJECT_COLUMNS]
+
+        # Pad short rows, so that every student has all the columns
+        students = [
+            tuple(student) + (None,) * (POSITION_COLUMN + 1 - len(student))
+            for student in class_records[1:-3]
+            ]
+
+        self.ids = np.array(
+            [to_student_id(student[ID_COLUMN]) for student in students],
+            dtype=object,
+            )
+        self.names = np.array(
+            [student[NAME_COLUMN] or '' for student in students],
+            dtype=object,
+            )
+        self.genders = np.array(
+            [student[GENDER_COLUMN] or '' for student in students],
+            dtype=object,
+            )
+
+        # A mark that is not a number is taken as 0, and reported
+        subjects = self.subjects + [None] * (SUBJECT_COLUMNS.stop - SUBJECT_COLUMNS.start)
+        marks = []
+        self.unparseable_marks = []
+        for student_id, name, student in zip(self.ids, self.names, students):
+            student_marks = []
+            for subject, value in zip(subjects, student[SUBJECT_COLUMNS]):
+                mark = parse_mark(value)
+                if mark is None:
+                    self.unparseable_marks.append((student_id, name, subject, value))
+                    mark = 0
+                student_marks.append(mark)
+            marks.append(student_marks)
+
+        self.marks = np.array(
+            marks,
+            dtype=np.int64,
+            ).reshape(len(students), SUBJECT_COLUMNS.stop - SUBJECT_COLUMNS.start)
+
+        self.compute_statistics()
+
+        self.averages_row = class_records[-3]
+        self.head_teacher = class_records[-2][0]
+        self.class_teacher = class_records[-1][0]
+
+    def compute_statistics(self):
+        """This function computes the totals, positions and class averages.
+
+        Everything is computed in one vectorised pass over the marks matrix.
+        Students with the same total share a position, and the next position
+        is skipped, e.g. 1, 2, 2, 4.
+        """
+        self.totals = self.marks.sum(axis=1)
+
+        # Each student's position is one more than the number of higher totals
+        descending_totals = np.sort(-self.totals)
+        self.positions = np.searchsorted(
+            descending_totals,
+            -self.totals,
+            side='left',
+            ) + 1
+
+        if len(self.totals):
+            self.subject_means = self.marks.mean(axis=0)
+            self.mean_total = float(self.totals.mean())
+        else:
+            self.subject_means = np.zeros(self.marks.shape[1])
+            self.mean_total = 0.0
+
+        self.mean_of_means = float(self.subject_means.mean())
+
+    def class_averages(self) -> list:
+        """This function returns the class averages, as taken by generate_pdf.
+
+        Returns:
+            list: The subject averages followed by the average total, for the
+                table, and the subject averages followed by the average of
+                the subject averages, for the chart.
+        """
+        subject_means = self.subject_means.tolist()
+
+        return [
+            subject_means + [self.mean_total],
+            subject_means + [self.mean_of_means],
+            ]
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self):
+        """Yield each student as a row, in the same layout as the spreadsheet.
+
+        The columns are converted to Python values in bulk, rather than one
+        value at a time.
+
+        Yields:
+            list: The student ID, name, gender, marks, total and position.
+        """
+        for (
+                student_id,
+                name,
+                gender,
+                marks,
+                total,
+                position,
+                ) in zip(
+                    self.ids.tolist(),
+                    self.names.tolist(),
+                    self.genders.tolist(),
+                    self.marks.tolist(),
+                    self.totals.tolist(),
+                    self.positions.tolist(),
+                    ):
+            yield [student_id, name, gender, *marks, total, position]
@@ -0,0 +1,120 @@
+"""Tests for class_table.py"""
+
+import unittest
+
+from class_table import ClassTable, parse_mark, to_mark, to_student_id
+
+
+COLUMN_HEADS = (
+    "Student ID", "Student Name", "Gender",
+    "English", "Kiswahili", "Mathematics", "Sci & Tech", "Art & Craft", "Music",
+    "Home Science", "Agriculture", "Religious Ed.", "Social Studies", "Physical Ed",
+    "Total", "Position",
+    )
+
+CLASS_RECORDS = [
+    COLUMN_HEADS,
+    (1.0, "John Doe", "Male", 78, 82, 90, 85, 88, 34, 54, 45, 0, 0, 67, 623, 2.0),
+    ("002", "Jane Doe", "Female", "85", 80.5, None, "", " ", 56, 34, 34, 87, 98, 78, 778, 1),
+    ("Averages", None, None, 81.5, 81.25, 45, 42.5, 44, 45, 44, 39.5, 43.5, 49, 72.5, 700.5),
+    ("Headteacher's remarks",),
+    ("Class Teacher",),
+    ]
+
+
+class TestToMark(unittest.TestCase):
+    """Tests for converting cells to marks."""
+
+    def test_to_mark(self):
+        """Test the different kinds of cells."""
+        self.assertEqual(to_mark(85), 85)
+        self.assertEqual(to_mark(85.9), 85)
+        self.assertEqual(to_mark("85"), 85)
+        self.assertEqual(to_mark(" 85.5 "), 85)
+        self.assertEqual(to_mark(None), 0)
+        self.assertEqual(to_mark(""), 0)
+        self.assertEqual(to_mark("absent"), 0)
+
+    def test_parse_mark(self):
+        """Test that empty cells are told apart from cells that are not marks."""
+        self.assertEqual(parse_mark(" 85.5 "), 85)
+        self.assertEqual(parse_mark(None), 0)
+        self.assertEqual(parse_mark(" "), 0)
+        self.assertIsNone(parse_mark("absent"))
+        self.assertIsNone(parse_mark("-5"))
+        self.assertIsNone(parse_mark(float('nan')))
+        self.assertIsNone(parse_mark(True))
+
+    def test_to_student_id(self):
+        """Test that IDs keep their text, but floats become integers."""
+        self.assertEqual(to_student_id(1.0), 1)
+        self.assertEqual(to_student_id("002"), "002")
+        self.assertEqual(to_student_id(None), 0)
+
+
+class TestClassTable(unittest.TestCase):
+    """Tests for the ClassTable class."""
+
+    def setUp(self):
+        self.table = ClassTable(CLASS_RECORDS)
+
+    def test_columns(self):
+        """Test that the records are split into columns."""
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.subjects, list(COLUMN_HEADS[3:14]))
+        self.assertEqual(self.table.marks.shape, (2, 11))
+        self.assertEqual(self.table.marks[1, :5].tolist(), [85, 80, 0, 0, 0])
+        self.assertEqual(self.table.totals.tolist(), [623, 552])
+        self.assertEqual(self.table.positions.tolist(), [1, 2])
+        self.assertEqual(self.table.head_teacher, "Headteacher's remarks")
+        self.assertEqual(self.table.class_teacher, "Class Teacher")
+
+    def test_unparseable_marks(self):
+        """Test that marks which are not numbers are reported, and taken as 0."""
+        self.assertEqual(self.table.unparseable_marks, [])
+
+        student = (3, "Baraka Otieno", "Male", "absent", 70, "7O")
+        table = ClassTable([COLUMN_HEADS, student, *CLASS_RECORDS[-3:]])
+
+        self.assertEqual(
+            table.unparseable_marks,
+            [
+                (3, "Baraka Otieno", "English", "absent"),
+                (3, "Baraka Otieno", "Mathematics", "7O"),
+                ],
+            )
+        self.assertEqual(table.marks[0, :3].tolist(), [0, 70, 0])
+
+    def test_rows(self):
+        """Test that the rows have the same layout as the spreadsheet."""
+        rows = list(self.table.rows())
+        self.assertEqual(rows[0], [1, "John Doe", "Male", *CLASS_RECORDS[1][3:15], 1])
+        self.assertTrue(all(isinstance(mark, int) for mark in rows[1][3:]))
+
+    def test_statistics(self):
+        """Test that the class averages are computed from the marks."""
+        self.assertEqual(self.table.subject_means[:3].tolist(), [81.5, 81.0, 45.0])
+        self.assertEqual(self.table.mean_total, 587.5)
+        self.assertAlmostEqual(self.table.mean_of_means, 587.5 / 11)
+
+        class_averages = self.table.class_averages()
+        self.assertEqual(class_averages[0][-1], 587.5)
+        self.assertAlmostEqual(class_averages[1][-1], 587.5 / 11)
+        self.assertEqual(class_averages[0][:11], class_averages[1][:11])
+
+    def test_tied_positions(self):
+        """Test that students with the same total share a position."""
+        marks = [(i, f"Student {i}", "Male", total) for i, total in enumerate([50, 70, 50, 90, 30])]
+        table = ClassTable([COLUMN_HEADS, *marks, *CLASS_RECORDS[-3:]])
+        self.assertEqual(table.positions.tolist(), [3, 2, 3, 1, 5])
+
+    def test_empty_class(self):
+        """Test a class without any students."""
+        table = ClassTable([COLUMN_HEADS, *CLASS_RECORDS[-3:]])
+        self.assertEqual(table.marks.shape, (0, 11))
+        self.assertEqual(list(table.rows()), [])
+        self.assertEqual(table.class_averages()[0], [0.0] * 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
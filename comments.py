@@ -1,18 +1,48 @@
 """This module contains functions that provide comments that are added to the report forms."""
 
+import math
+
+import numpy as np
+
+from class_table import to_mark
+
+# The lower edges of the mark bands, from "Below Average" up to "Excellent";
+# marks below the first edge are negative
+COMMENT_BAND_EDGES = np.array([0, 50, 60, 75, 80])
+
+# The comments for each band, starting with negative marks
+SUBJECT_COMMENTS = np.array([
+    "Marks < 0, please double check.",
+    "Below Average, let's work harder.",
+    "Average, strive to do better next time.",
+    "Good, there's room for improvement.",
+    "Very Good, aim higher!",
+    "Excellent, keep it up!",
+    ], dtype=object)
+
+SWAHILI_COMMENTS = np.array([
+    "Alama zimepungua 0, tafadhali angalia.",
+    "Chini ya wastani, tufanye kazi kwa bidii.",
+    "Wastani, jitahidi kufanya vizuri zaidi.",
+    "Vizuri, kuna fursa ya kuimarika.",
+    "Vema kabisa, lenga juu zaidi!",
+    "Bora, endelea na bidii hiyohiyo!",
+    ], dtype=object)
+
+NO_MARKS_COMMENT = "No marks entered, please double check."
+SWAHILI_NO_MARKS_COMMENT = "Hakuna alama zilizoingizwa, tafadhali angalia."
+
 def format_student_marks(student_marks: list) -> list:
-    """Format the student marks."""
-    formatted_student_marks = []
-
-    for marks in student_marks:
-        if marks is None or marks == "" or marks == " ":
-            formatted_student_marks.append(0)
-        elif isinstance(marks, str):
-            formatted_student_marks.append(int(marks))
-        else:
-            formatted_student_marks.append(marks)
+    """Format the student marks, keeping numbers as they are, fractions included.
 
-    return formatted_student_marks
+    Any other cell is converted as the marks of a ClassTable are, see to_mark.
+    """
+    return [
+        marks
+        if isinstance(marks, (int, float)) and not isinstance(marks, bool) and math.isfinite(marks)
+        else to_mark(marks)
+        for marks in student_marks
+        ]
 
 def generate_subject_comments(marks_list: list) -> list:
     """This function returns a list of comments based on the marks.
@@ -53,6 +83,42 @@ def generate_subject_comments(marks_list: list) -> list:
 
     return comments
 
+def generate_class_subject_comments(class_marks) -> list:
+    """This function returns the subject comments for all the students of a class.
+
+    The comments are looked up from the mark bands for the whole class at once,
+    and are the same as generate_subject_comments would give for each student.
+
+    Args:
+        class_marks (numpy.ndarray): The marks, with a row for each student and
+            a column for each subject, the last column being the total marks.
+
+    Returns:
+        list: A list of comments for each student.
+    """
+    class_marks = np.array(class_marks, dtype=float, ndmin=2)
+
+    # The total marks are compared as a mean over the subjects
+    totals = class_marks[:, -1]
+    class_marks[:, -1] = np.where(totals > 100, totals / 11, totals)
+
+    bands = np.searchsorted(COMMENT_BAND_EDGES, class_marks, side='right')
+
+    comments = SUBJECT_COMMENTS[bands]
+    comments[class_marks == 0] = NO_MARKS_COMMENT
+
+    # Kiswahili gets its comments in Kiswahili,
+    # with marks over 100 scaled down as in _generate_swahili_comments
+    swahili_marks = class_marks[:, 1]
+    swahili_marks = np.where(swahili_marks > 100, swahili_marks / 5, swahili_marks)
+
+    comments[:, 1] = SWAHILI_COMMENTS[
+        np.searchsorted(COMMENT_BAND_EDGES, swahili_marks, side='right')
+        ]
+    comments[swahili_marks == 0, 1] = SWAHILI_NO_MARKS_COMMENT
+
+    return comments.tolist()
+
 def _generate_swahili_comments(marks: int) -> str:
     """This function returns a comment based on the swahili marks.
 
@@ -1,7 +1,11 @@
 """Tests for comments.py"""
 
 import unittest
+
+import numpy as np
+
 from comments import generate_subject_comments, _generate_swahili_comments, generate_overall_comment
+from comments import generate_class_subject_comments, format_student_marks
 
 class TestGenerateSubjectComments(unittest.TestCase):
     """Tests for the generate_subject_comments function."""
@@ -38,6 +42,20 @@ class TestGenerateSubjectComments(unittest.TestCase):
             expected_comments
             )
 
+    def test_fractional_marks(self):
+        """Test that fractional marks are kept as they are, not truncated."""
+        self.assertEqual(format_student_marks([67.5, None, "85", " "]), [67.5, 0, 85, 0])
+
+        # A total just over 100 is compared as a mean over the subjects
+        self.assertEqual(
+            generate_subject_comments([67.5, 80, 100.5]),
+            [
+                "Good, there's room for improvement.",
+                "Bora, endelea na bidii hiyohiyo!",
+                "Below Average, let's work harder.",
+                ],
+            )
+
     def test_edge_cases(self):
         """Test edge cases."""
         # Empty list
@@ -326,5 +344,24 @@ class TestGenerateOverallComment(unittest.TestCase):
             )
 
 
+class TestGenerateClassSubjectComments(unittest.TestCase):
+    """Tests for the generate_class_subject_comments function."""
+
+    def test_matches_single_student_comments(self):
+        """Test that the comments match those generated for each student."""
+        class_marks = [
+            [85, 77, 65, 52, 45, 0, -1, 80, 75, 60, 50, 880],
+            [0, 0, 100, 79, 74, 59, 49, 1, 0, 0, 0, 0],
+            [50, 120, 60, 75, 80, 90, 10, 20, 30, 40, 99, 1100],
+            ]
+        self.assertEqual(
+            generate_class_subject_comments(np.array(class_marks)),
+            [generate_subject_comments(marks) for marks in class_marks],
+            )
+
+    def test_empty_class(self):
+        """Test a class without any students."""
+        self.assertEqual(generate_class_subject_comments(np.zeros((0, 12))), [])
+
 if __name__ == "__main__":
     unittest.main()
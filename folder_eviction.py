@@ -0,0 +1,123 @@
+"""This module contains the eviction of the uploads and report forms kept on disk.
+
+Uploads and report forms are named after the hash of their content, so
+that the same spreadsheet is only stored and rendered once. Each name is
+the key followed by its extensions, and everything sharing a key, e.g. a
+PDF file and its manifest, or a directory of PDF files and its partly
+written files, is one entry, used and removed together.
+"""
+
+import os
+import shutil
+import time
+
+
+# How much the uploads and the report forms may each take on disk, in bytes
+DEFAULT_UPLOAD_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_OUTPUT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Entries written to this recently are never removed, as a request or a job
+# may still be writing them before any job refers to them
+EVICTION_GRACE_SECONDS = 60
+
+
+def get_entry_key(name: str) -> str:
+    """This function returns the key of a file or directory, its name up to the first dot.
+
+    Args:
+        name (str): The name of the file or directory.
+
+    Returns:
+        str: The key of the entry it belongs to.
+    """
+    return name.split('.', 1)[0]
+
+def get_entry_usage(path: str) -> tuple:
+    """This function returns when a file or directory was last written, and its size.
+
+    Args:
+        path (str): The path to the file or directory.
+
+    Returns:
+        tuple: The latest modification time and the total size in bytes.
+    """
+    stat = os.stat(path)
+    last_used, total_bytes = stat.st_mtime, stat.st_size
+    if os.path.isdir(path):
+        total_bytes = 0
+        for directory, _, file_names in os.walk(path):
+            for file_name in file_names:
+                try:
+                    stat = os.stat(os.path.join(directory, file_name))
+                except FileNotFoundError:
+                    continue
+                last_used = max(last_used, stat.st_mtime)
+                total_bytes += stat.st_size
+    return last_used, total_bytes
+
+def touch_entry(path: str) -> None:
+    """This function marks an entry as used, so that it is removed last.
+
+    Args:
+        path (str): The path to a file or directory of the entry.
+
+    Returns:
+        None
+    """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+def evict_entries(folder: str, max_bytes: int, keep=()) -> None:
+    """This function removes the least recently used entries of a folder, until the rest fit.
+
+    An entry's manifest, the file ending in '.json', is removed first, so
+    that a request finding no manifest never serves an entry being removed.
+
+    Args:
+        folder (str): The folder of the uploads or of the report forms.
+        max_bytes (int): How much the entries may take, in bytes.
+        keep (iterable): The paths of the entries that must not be removed,
+            e.g. the uploads and report forms of the jobs not yet forgotten.
+
+    Returns:
+        None
+    """
+    if not os.path.isdir(folder):
+        return
+
+    kept_keys = {get_entry_key(os.path.basename(os.path.normpath(path))) for path in keep}
+
+    entries = {}
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            last_used, size = get_entry_usage(path)
+        except FileNotFoundError:
+            continue
+
+        entry = entries.setdefault(get_entry_key(name), {'last_used': 0, 'bytes': 0, 'paths': []})
+        entry['last_used'] = max(entry['last_used'], last_used)
+        entry['bytes'] += size
+        entry['paths'].append(path)
+
+    total_bytes = sum(entry['bytes'] for entry in entries.values())
+    cutoff = time.time() - EVICTION_GRACE_SECONDS
+    for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+        if total_bytes <= max_bytes:
+            break
+
+        if key in kept_keys or entry['last_used'] > cutoff:
+            continue
+
+        for path in sorted(entry['paths'], key=lambda path: not path.endswith('.json')):
+            # Another thread may have removed it already
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        total_bytes -= entry['bytes']
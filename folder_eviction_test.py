@@ -0,0 +1,89 @@
+"""Tests for folder_eviction.py"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from folder_eviction import evict_entries, touch_entry
+
+
+class TestEvictEntries(unittest.TestCase):
+    """Tests for removing the least recently used uploads and report forms."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_path(self, name):
+        """Return a path in the temporary folder."""
+        return os.path.join(self.temp_dir.name, name)
+
+    def write_file(self, name, size, age):
+        """Write a file of the given size, last written age seconds ago."""
+        path = self.get_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as written_file:
+            written_file.write(b'x' * size)
+        used_at = time.time() - age
+        os.utime(path, (used_at, used_at))
+        if os.path.dirname(path) != self.temp_dir.name:
+            os.utime(os.path.dirname(path), (used_at, used_at))
+
+    def test_least_recently_used_evicted(self):
+        """Test that the oldest report forms go with their manifests, until the rest fit."""
+        self.write_file('old.pdf', 100, 3000)
+        self.write_file('old.pdf.json', 10, 3000)
+        self.write_file('student_pdfs/00001_Grade 6_Amina.pdf', 100, 2000)
+        self.write_file('student_pdfs.json', 10, 2000)
+        self.write_file('new.zip', 100, 1000)
+        self.write_file('new.zip.json', 10, 1000)
+
+        evict_entries(self.temp_dir.name, 250)
+
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)),
+            ['new.zip', 'new.zip.json', 'student_pdfs', 'student_pdfs.json'],
+            )
+
+        # A directory is removed with all its files
+        evict_entries(self.temp_dir.name, 150)
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ['new.zip', 'new.zip.json'])
+
+    @mock.patch('folder_eviction.EVICTION_GRACE_SECONDS', 0)
+    def test_touched_entry_kept(self):
+        """Test that an entry that is used again is removed last."""
+        self.write_file('first.pdf', 100, 3000)
+        self.write_file('second.pdf', 100, 2000)
+        touch_entry(self.get_path('first.pdf'))
+
+        evict_entries(self.temp_dir.name, 100)
+
+        self.assertEqual(os.listdir(self.temp_dir.name), ['first.pdf'])
+
+    def test_kept_and_recent_entries(self):
+        """Test that the entries of jobs and the ones being written are never removed."""
+        self.write_file('job.xlsx', 100, 3000)
+        self.write_file('0123abcd.part', 100, 0)
+        self.write_file('old.xlsx', 100, 2000)
+
+        evict_entries(self.temp_dir.name, 0, keep=[self.get_path('job.xlsx')])
+
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)),
+            ['0123abcd.part', 'job.xlsx'],
+            )
+
+    def test_missing_folder(self):
+        """Test that nothing happens before anything was uploaded."""
+        evict_entries(self.get_path('uploads'), 0)
+
+        self.assertFalse(os.path.exists(self.get_path('uploads')))
+
+
+if __name__ == '__main__':
+    unittest.main()
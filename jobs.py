@@ -0,0 +1,245 @@
+"""This module contains a small local worker pool for report-generation jobs.
+
+Each job is recorded in a file named after its ID, in a folder shared by
+every process of the app, so that any gunicorn worker can tell a job's
+status, and the app can be served by several of them. Whether a job's
+process is still running is only known on the machine running it, so the
+app is served by a single instance, see app.yaml. The ID is chosen by
+the caller from what the job generates, e.g. the hash of the spreadsheet
+and the options, so that submitting the same job again finds the one
+already recorded. A job's record is written when it is submitted, when a
+worker process starts it, and when it finishes, along with its result or
+error. A queued or running job whose process has exited is failed.
+
+Only the process that submitted a job holds its future. The jobs finished
+JOB_TTL_SECONDS ago or more are no longer listed by list_jobs, so that
+their files can be evicted; their records stay until then.
+"""
+
+import fcntl
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import is_process_running
+
+
+# The number of gunicorn workers, each with a worker pool of its own, read
+# from the variable gunicorn takes its number of workers from, see app.yaml
+WEB_WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+# The number of jobs each gunicorn worker runs at once can be tuned per
+# deployment. By default the jobs of all the gunicorn workers take half the
+# CPUs, so that each job can draw its pages with two processes, see
+# RENDER_PROCESSES in app.py
+MAX_WORKERS = int(os.environ.get(
+    'REPORT_WORKERS',
+    max(1, (os.cpu_count() or 1) // (2 * WEB_WORKERS)),
+    ))
+
+# How long a finished job is kept from being evicted, in seconds
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 60 * 60))
+
+# The folder of the job records, by default next to the report forms, so
+# that a job's record is evicted along with them, see folder_eviction
+JOBS_FOLDER = os.environ.get('JOBS_FOLDER', 'pdfs/')
+
+# The error of a job whose process exited before it finished
+INTERRUPTED_ERROR = 'The job was interrupted. Please upload the spreadsheet again.'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# The file locked while a job is checked and submitted, so that a job
+# submitted twice at once, by any process of the app, is only run once
+SUBMIT_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'report_jobs_submit.lock')
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """This function returns the shared worker pool, creating it on first use.
+
+    The pool is created lazily so that each gunicorn worker gets its own pool
+    after it has been forked. Its processes are started by a fork server,
+    rather than forked from the web worker, whose other threads may hold a
+    lock, e.g. the metrics lock, that would never be released in the child.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    global _executor  # pylint: disable=global-statement
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver'),
+                )
+    return _executor
+
+def get_job_path(job_id: str) -> str:
+    """This function returns the path of a job's record.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        str: The path to the record.
+    """
+    return os.path.join(JOBS_FOLDER, f"{job_id}.job.json")
+
+def write_job(job_path: str, job: dict) -> None:
+    """This function writes a job's record.
+
+    The record is written under a temporary name and then renamed, so that
+    other processes never read a partly written record.
+
+    Args:
+        job_path (str): The path to the record, see get_job_path.
+        job (dict): The job's metadata, status and process ID.
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(job_path) or '.', exist_ok=True)
+
+    temp_path = f"{job_path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, 'w', encoding='utf-8') as job_file:
+        json.dump(job, job_file)
+    os.replace(temp_path, job_path)
+
+def read_job(job_id: str) -> dict:
+    """This function reads a job's record, or returns None if there is none.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        dict: The job, as written by write_job.
+    """
+    # The ID is part of a path, so only plain names are looked up
+    if not job_id.isalnum():
+        return None
+
+    try:
+        with open(get_job_path(job_id), encoding='utf-8') as job_file:
+            return json.load(job_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def submit_job(job_id: str, func, *args, **metadata):
+    """This function enqueues a job on the worker pool, unless it is already queued or running.
+
+    Args:
+        job_id (str): The ID of the job, e.g. the key of what it generates.
+        func (callable): A picklable, module-level function to run.
+        *args: The arguments to call the function with.
+        **metadata: Extra details recorded alongside the job, e.g. the output path.
+
+    Returns:
+        concurrent.futures.Future: The future of the job, or None if the same
+            job was already queued or running.
+    """
+    # A lock on a file of its own is held by one thread of one process at a time
+    with open(SUBMIT_LOCK_PATH, 'a', encoding='utf-8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        job = get_job(job_id)
+        if job is not None and job['status'] in ('queued', 'running'):
+            return None
+
+        # Recorded before it is submitted, so the worker process's record is the latest
+        job_path = get_job_path(job_id)
+        write_job(job_path, dict(metadata, status='queued', pid=os.getpid()))
+
+        return get_executor().submit(run_job, job_path, metadata, func, *args)
+
+def run_job(job_path: str, metadata: dict, func, *args):
+    """This function runs a job in a worker process, recording its status.
+
+    Args:
+        job_path (str): The path to the job's record, see get_job_path.
+        metadata (dict): See submit_job.
+        func (callable): The function to run.
+        *args: The arguments to call the function with.
+
+    Returns:
+        The result of the function.
+    """
+    write_job(job_path, dict(metadata, status='running', pid=os.getpid()))
+
+    try:
+        result = func(*args)
+    except Exception as error:
+        write_job(
+            job_path,
+            dict(metadata, status='failed', error=str(error), finished_at=time.time()),
+            )
+        raise
+
+    write_job(job_path, dict(metadata, status='done', result=result, finished_at=time.time()))
+    return result
+
+def add_finished_job(job_id: str, result, **metadata) -> None:
+    """This function records a job that has already finished, e.g. from a cache.
+
+    Args:
+        job_id (str): The ID of the job.
+        result: The result of the job.
+        **metadata: Extra details recorded alongside the job, e.g. the output path.
+
+    Returns:
+        None
+    """
+    write_job(
+        get_job_path(job_id),
+        dict(metadata, status='done', result=result, finished_at=time.time()),
+        )
+
+def get_job(job_id: str) -> dict:
+    """This function returns a job's details, or None if it does not exist.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        dict: The job's metadata and status, one of 'queued', 'running',
+            'done' or 'failed', and its result or error once finished.
+    """
+    job = read_job(job_id)
+    if job is None:
+        return None
+
+    if job['status'] in ('queued', 'running') and not is_process_running(job['pid']):
+        job.update(status='failed', error=INTERRUPTED_ERROR)
+
+    return job
+
+def list_jobs() -> list:
+    """This function returns the jobs not finished, or finished under JOB_TTL_SECONDS ago.
+
+    Returns:
+        list: The details of each job, as returned by get_job.
+    """
+    if not os.path.isdir(JOBS_FOLDER):
+        return []
+
+    cutoff = time.time() - JOB_TTL_SECONDS
+    jobs = []
+    for name in os.listdir(JOBS_FOLDER):
+        if not name.endswith('.job.json'):
+            continue
+
+        job = get_job(name[:-len('.job.json')])
+        if job is None:
+            continue
+
+        if job['status'] in ('queued', 'running') or job.get('finished_at', 0) >= cutoff:
+            jobs.append(job)
+
+    return jobs
@@ -0,0 +1,121 @@
+"""Tests for jobs.py"""
+
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import jobs
+from jobs import submit_job, add_finished_job, get_job, get_job_path, list_jobs, write_job
+
+
+class TestJobs(unittest.TestCase):
+    """Tests for the report-generation job queue."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_path = os.path.join(self.temp_dir.name, 'submit.lock')
+        for patcher in (
+                mock.patch.object(jobs, 'JOBS_FOLDER', self.temp_dir.name),
+                mock.patch.object(jobs, 'SUBMIT_LOCK_PATH', self.lock_path),
+                ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def wait_for(self, job_id):
+        """Wait until the job has finished and return its details."""
+        for _ in range(100):
+            job = get_job(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.1)
+        self.fail('Job did not finish in time.')
+
+    def test_submit_job(self):
+        """Test that a job runs and its result is recorded."""
+        future = submit_job('powjob', pow, 2, 10, output_path='fake_path.pdf')
+        self.assertEqual(future.result(), 1024)
+
+        job = self.wait_for('powjob')
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result'], 1024)
+        self.assertEqual(job['output_path'], 'fake_path.pdf')
+
+    def test_failed_job(self):
+        """Test that a job raising an error is recorded as failed, with its error."""
+        submit_job('intjob', int, 'not a number')
+        job = self.wait_for('intjob')
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('not a number', job['error'])
+
+    def test_job_submitted_once(self):
+        """Test that a job already queued or running is not submitted again."""
+        write_job(get_job_path('samejob'), {'status': 'running', 'pid': os.getpid()})
+
+        self.assertIsNone(submit_job('samejob', pow, 2, 10))
+        self.assertEqual(get_job('samejob')['status'], 'running')
+
+    def test_job_submitted_once_across_processes(self):
+        """Test that a job is checked only once another process has finished submitting it."""
+        results = []
+        with open(self.lock_path, 'a', encoding='utf-8') as lock_file:
+            # As another gunicorn worker would, while submitting the same job
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            thread = threading.Thread(
+                target=lambda: results.append(submit_job('racejob', pow, 2, 10)),
+                )
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+
+            write_job(get_job_path('racejob'), {'status': 'queued', 'pid': os.getpid()})
+
+        thread.join()
+        self.assertEqual(results, [None])
+
+    def test_interrupted_job(self):
+        """Test that a job whose process has exited without finishing it is failed."""
+        write_job(get_job_path('lostjob'), {'status': 'running', 'pid': 2 ** 22 + 1})
+
+        with mock.patch('jobs.is_process_running', return_value=False):
+            job = get_job('lostjob')
+
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], jobs.INTERRUPTED_ERROR)
+
+    def test_finished_job(self):
+        """Test that a job added with its result is done straight away."""
+        add_finished_job('cachedjob', 30, output_path='cached_path.pdf')
+        job = get_job('cachedjob')
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result'], 30)
+        self.assertEqual(job['output_path'], 'cached_path.pdf')
+
+    def test_unknown_job(self):
+        """Test that an unknown job ID, or one that is not a plain name, returns None."""
+        self.assertIsNone(get_job('nonexistent'))
+        self.assertIsNone(get_job('../nonexistent'))
+
+    def test_finished_jobs_not_listed(self):
+        """Test that jobs finished over the TTL ago are not listed, and running ones are."""
+        with mock.patch.object(jobs, 'JOB_TTL_SECONDS', 0.1):
+            add_finished_job('oldjob', 30)
+            write_job(get_job_path('runningjob'), {'status': 'running', 'pid': os.getpid()})
+
+            time.sleep(0.2)
+            add_finished_job('newjob', 31)
+
+            listed = sorted(str(job.get('result', job['status'])) for job in list_jobs())
+
+        self.assertEqual(listed, ['31', 'running'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,409 @@
+"""This module contains the counters and latency histograms served on /metrics.
+
+The report forms are generated in worker processes, and the app itself may
+run in several gunicorn workers, so each process keeps its own metrics and
+writes them to a file of its own. The files of all the processes are added
+up when the metrics are scraped, and the files of the processes that have
+exited are merged into one, so that the worker processes started for each
+job do not leave a file each behind. Each of those files is claimed, by
+renaming it, before it is merged, so that a new process given the same ID
+never has its file merged, or removed, instead.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+METRICS_FOLDER = os.environ.get(
+    'METRICS_FOLDER',
+    os.path.join(tempfile.gettempdir(), 'report_metrics'),
+    )
+
+# The file the metrics of the processes that have exited are merged into
+AGGREGATE_FILE_NAME = 'exited.json'
+
+# The file locked while the files of exited processes are merged,
+# so that no two scrapes merge the same file
+MERGE_LOCK_FILE_NAME = 'merge.lock'
+
+# The start of the name a file of an exited process is renamed to, until it is merged
+CLAIMED_FILE_PREFIX = 'exited-'
+
+# How often the metrics recorded while handling requests are written, in
+# seconds, so that polling a job does not write them on every request
+FLUSH_INTERVAL_SECONDS = 5
+
+# The upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+    )
+
+METRICS = {
+    'report_uploads_total': (
+        'counter',
+        'The number of spreadsheets uploaded.',
+        ),
+    'report_output_cache_hits_total': (
+        'counter',
+        'The number of uploads whose report forms were already generated.',
+        ),
+    'report_spreadsheet_cache_hits_total': (
+        'counter',
+        'The number of spreadsheets whose classes were already read.',
+        ),
+    'report_jobs_total': (
+        'counter',
+        'The number of report-generation jobs finished, by status.',
+        ),
+    'report_students_total': (
+        'counter',
+        'The number of students report forms were generated for.',
+        ),
+    'report_unparseable_marks_total': (
+        'counter',
+        'The number of marks in the spreadsheets that were not numbers, and were taken as 0.',
+        ),
+    'report_stage_duration_seconds': (
+        'histogram',
+        'The time spent in each stage of generating the report forms.',
+        ),
+}
+
+_lock = threading.Lock()
+_state = {'pid': None, 'metrics': {}, 'changed': False, 'flushed_at': None}
+
+
+def get_metrics() -> dict:
+    """This function returns this process's metrics, by name and labels.
+
+    A process forked from another starts with no metrics, rather than the
+    ones of its parent, so that nothing is counted twice. A file already
+    written with its process ID was left by a process that has exited, and
+    is claimed to be merged, rather than written over.
+
+    Returns:
+        dict: The value of each counter and the buckets, sum and count of
+            each histogram.
+    """
+    if _state['pid'] != os.getpid():
+        _state.update(pid=os.getpid(), metrics={}, changed=False, flushed_at=None)
+        claim_metrics_file(get_metrics_path())
+    return _state['metrics']
+
+def get_metrics_path(pid: int = None) -> str:
+    """This function returns the path a process's metrics are written to.
+
+    Args:
+        pid (int): The ID of the process, this process if not given.
+
+    Returns:
+        str: The path to the metrics file.
+    """
+    return os.path.join(METRICS_FOLDER, f"{pid or os.getpid()}.json")
+
+def claim_metrics_file(path: str) -> str:
+    """This function renames the file of an exited process, so that only the caller merges it.
+
+    Args:
+        path (str): The path to the metrics file.
+
+    Returns:
+        str: The path the file was renamed to, or None if it was not there,
+            e.g. because another process claimed it first.
+    """
+    claimed_path = os.path.join(METRICS_FOLDER, f"{CLAIMED_FILE_PREFIX}{uuid.uuid4().hex}.json")
+    try:
+        os.rename(path, claimed_path)
+    except FileNotFoundError:
+        return None
+    return claimed_path
+
+def read_metrics_file(path: str) -> dict:
+    """This function reads the metrics a process has written.
+
+    Args:
+        path (str): The path to the metrics file.
+
+    Returns:
+        dict: The metrics, or an empty dict if there are none.
+    """
+    try:
+        with open(path, encoding='utf-8') as metrics_file:
+            return json.load(metrics_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def format_labels(**labels) -> str:
+    """This function formats labels as they appear in the text format.
+
+    Args:
+        **labels: The label names and values.
+
+    Returns:
+        str: The labels, e.g. 'stage="parse"'.
+    """
+    return ','.join(
+        f'{name}="{value}"' for name, value in sorted(labels.items())
+        )
+
+def increment(name: str, amount: float = 1, **labels) -> None:
+    """This function adds to a counter.
+
+    Args:
+        name (str): The name of the counter, one of METRICS.
+        amount (float): How much to add.
+        **labels: The labels of the counter, e.g. status='done'.
+
+    Returns:
+        None
+    """
+    with _lock:
+        values = get_metrics().setdefault(name, {})
+        label_text = format_labels(**labels)
+        values[label_text] = values.get(label_text, 0) + amount
+        _state['changed'] = True
+
+def observe(name: str, value: float, **labels) -> None:
+    """This function records an observation in a histogram.
+
+    Args:
+        name (str): The name of the histogram, one of METRICS.
+        value (float): The observed value, e.g. a duration in seconds.
+        **labels: The labels of the histogram, e.g. stage='parse'.
+
+    Returns:
+        None
+    """
+    with _lock:
+        values = get_metrics().setdefault(name, {})
+        histogram = values.setdefault(
+            format_labels(**labels),
+            {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0},
+            )
+
+        for index, upper_bound in enumerate(LATENCY_BUCKETS):
+            if value <= upper_bound:
+                histogram['buckets'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+        _state['changed'] = True
+
+@contextmanager
+def time_stage(stage: str):
+    """This function times a stage of generating the report forms.
+
+    Args:
+        stage (str): The name of the stage, e.g. 'parse' or 'chart'.
+
+    Yields:
+        None
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(
+            'report_stage_duration_seconds',
+            time.perf_counter() - start_time,
+            stage=stage,
+            )
+
+def flush() -> None:
+    """This function writes this process's metrics to its file.
+
+    Returns:
+        None
+    """
+    with _lock:
+        data = json.dumps(get_metrics())
+        _state.update(changed=False, flushed_at=time.monotonic())
+
+    write_metrics_file(get_metrics_path(), data)
+
+def flush_if_due() -> None:
+    """This function writes this process's metrics to its file, if they have changed.
+
+    They are written at most every FLUSH_INTERVAL_SECONDS, and are always
+    written when the metrics are scraped, see collect_metrics.
+
+    Returns:
+        None
+    """
+    with _lock:
+        get_metrics()
+        is_due = (
+            _state['changed']
+            and (
+                _state['flushed_at'] is None
+                or time.monotonic() - _state['flushed_at'] >= FLUSH_INTERVAL_SECONDS
+                )
+            )
+
+    if is_due:
+        flush()
+
+def write_metrics_file(path: str, data: str) -> None:
+    """This function writes metrics to a file in METRICS_FOLDER.
+
+    The file is written under a temporary name and then renamed, so that
+    the metrics are never read while they are partly written.
+
+    Args:
+        path (str): The path to the metrics file.
+        data (str): The metrics, as JSON.
+
+    Returns:
+        None
+    """
+    os.makedirs(METRICS_FOLDER, exist_ok=True)
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=METRICS_FOLDER, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w', encoding='utf-8') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+def add_metrics(collected: dict, metrics: dict) -> None:
+    """This function adds the metrics of a process to those collected so far.
+
+    Args:
+        collected (dict): The metrics collected so far, updated in place.
+        metrics (dict): The metrics of a process, as returned by get_metrics.
+
+    Returns:
+        None
+    """
+    for name, values in metrics.items():
+        collected_values = collected.setdefault(name, {})
+        for label_text, value in values.items():
+            if isinstance(value, dict):
+                histogram = collected_values.setdefault(
+                    label_text,
+                    {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0},
+                    )
+                histogram['buckets'] = [
+                    count + other
+                    for count, other in zip(histogram['buckets'], value['buckets'])
+                    ]
+                histogram['sum'] += value['sum']
+                histogram['count'] += value['count']
+            else:
+                collected_values[label_text] = collected_values.get(label_text, 0) + value
+
+def is_process_running(pid: int) -> bool:
+    """This function checks whether a process is still running.
+
+    Args:
+        pid (int): The ID of the process.
+
+    Returns:
+        bool: Whether a process with that ID exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, but belongs to another user
+        return True
+    return True
+
+def merge_exited_processes() -> None:
+    """This function merges the files of the processes that have exited into one.
+
+    Each file is claimed before it is read, so that the file of a new
+    process given the same ID is never merged in its place. The claimed
+    files are still counted, and the merged metrics are written before they
+    are removed, so that a scrape in between never misses them.
+
+    Returns:
+        None
+    """
+    os.makedirs(METRICS_FOLDER, exist_ok=True)
+
+    lock_path = os.path.join(METRICS_FOLDER, MERGE_LOCK_FILE_NAME)
+    with open(lock_path, 'a', encoding='utf-8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        for file_name in os.listdir(METRICS_FOLDER):
+            pid_text = file_name[:-len('.json')]
+            if not file_name.endswith('.json') or not pid_text.isdigit():
+                continue
+
+            if not is_process_running(int(pid_text)):
+                claim_metrics_file(os.path.join(METRICS_FOLDER, file_name))
+
+        # Along with the files claimed by processes given an exited one's ID, see get_metrics
+        exited_paths = [
+            os.path.join(METRICS_FOLDER, file_name)
+            for file_name in os.listdir(METRICS_FOLDER)
+            if file_name.startswith(CLAIMED_FILE_PREFIX) and file_name.endswith('.json')
+            ]
+        if not exited_paths:
+            return
+
+        aggregate_path = os.path.join(METRICS_FOLDER, AGGREGATE_FILE_NAME)
+        aggregate = read_metrics_file(aggregate_path)
+        for path in exited_paths:
+            add_metrics(aggregate, read_metrics_file(path))
+        write_metrics_file(aggregate_path, json.dumps(aggregate))
+
+        for path in exited_paths:
+            os.remove(path)
+
+def collect_metrics() -> dict:
+    """This function adds up the metrics written by all the processes.
+
+    Returns:
+        dict: The metrics, as returned by get_metrics.
+    """
+    flush()
+    merge_exited_processes()
+
+    collected = {}
+    for file_name in sorted(os.listdir(METRICS_FOLDER)):
+        if file_name.endswith('.json'):
+            add_metrics(collected, read_metrics_file(os.path.join(METRICS_FOLDER, file_name)))
+
+    return collected
+
+def render_metrics() -> str:
+    """This function renders the metrics in the Prometheus text format.
+
+    Returns:
+        str: The metrics of all the processes.
+    """
+    collected = collect_metrics()
+    lines = []
+
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        for label_text, value in sorted(collected.get(name, {}).items()):
+            label_block = f"{{{label_text}}}" if label_text else ''
+
+            if metric_type == 'counter':
+                lines.append(f"{name}{label_block} {value}")
+                continue
+
+            # The buckets are cumulative in the text format
+            separator = ',' if label_text else ''
+            cumulative_count = 0
+            for upper_bound, count in zip(LATENCY_BUCKETS, value['buckets']):
+                cumulative_count += count
+                lines.append(
+                    f'{name}_bucket{{{label_text}{separator}le="{upper_bound}"}} {cumulative_count}'
+                    )
+            lines.append(f'{name}_bucket{{{label_text}{separator}le="+Inf"}} {value["count"]}')
+            lines.append(f"{name}_sum{label_block} {value['sum']}")
+            lines.append(f"{name}_count{label_block} {value['count']}")
+
+    return '\n'.join(lines) + '\n'
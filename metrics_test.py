@@ -0,0 +1,145 @@
+"""Tests for metrics.py"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for the counters and latency histograms."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(metrics, 'METRICS_FOLDER', self.temp_dir.name),
+            mock.patch.object(
+                metrics,
+                '_state',
+                {'pid': None, 'metrics': {}, 'changed': False, 'flushed_at': None},
+                ),
+            ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.temp_dir.cleanup()
+
+    def test_render_counters_and_histograms(self):
+        """Test the text format of the counters and the cumulative buckets."""
+        metrics.increment('report_jobs_total', status='done')
+        metrics.increment('report_jobs_total', status='done')
+        metrics.increment('report_students_total', 30)
+        metrics.observe('report_stage_duration_seconds', 0.003, stage='parse')
+        metrics.observe('report_stage_duration_seconds', 0.2, stage='parse')
+
+        lines = metrics.render_metrics().splitlines()
+
+        self.assertIn('# TYPE report_jobs_total counter', lines)
+        self.assertIn('report_jobs_total{status="done"} 2', lines)
+        self.assertIn('report_students_total 30', lines)
+        self.assertIn('report_stage_duration_seconds_bucket{stage="parse",le="0.001"} 0', lines)
+        self.assertIn('report_stage_duration_seconds_bucket{stage="parse",le="0.005"} 1', lines)
+        self.assertIn('report_stage_duration_seconds_bucket{stage="parse",le="0.25"} 2', lines)
+        self.assertIn('report_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 2', lines)
+        self.assertIn('report_stage_duration_seconds_count{stage="parse"} 2', lines)
+
+    def test_time_stage(self):
+        """Test that timing a stage records an observation, even if it fails."""
+        with self.assertRaises(ValueError):
+            with metrics.time_stage('chart'):
+                raise ValueError('Chart could not be drawn.')
+
+        histogram = metrics.get_metrics()['report_stage_duration_seconds']['stage="chart"']
+        self.assertEqual(histogram['count'], 1)
+
+    def test_collect_from_other_processes(self):
+        """Test that the metrics written by other processes are added up."""
+        with open(os.path.join(self.temp_dir.name, '1.json'), 'w', encoding='utf-8') as file:
+            json.dump({'report_uploads_total': {'': 3}}, file)
+
+        metrics.increment('report_uploads_total')
+
+        self.assertEqual(
+            metrics.collect_metrics()['report_uploads_total'],
+            {'': 4},
+            )
+
+    def test_exited_processes_merged(self):
+        """Test that the files of exited processes are merged into one, and still counted."""
+        exited_pids = []
+        for _ in range(2):
+            process = subprocess.Popen([sys.executable, '-c', ''])
+            process.wait()
+            exited_pids.append(process.pid)
+
+        for pid in exited_pids:
+            with open(os.path.join(self.temp_dir.name, f'{pid}.json'), 'w', encoding='utf-8') as file:
+                json.dump({'report_uploads_total': {'': 2}}, file)
+
+        metrics.increment('report_uploads_total')
+
+        self.assertEqual(
+            metrics.collect_metrics()['report_uploads_total'],
+            {'': 5},
+            )
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.temp_dir.name) if name.endswith('.json')),
+            sorted([f'{os.getpid()}.json', metrics.AGGREGATE_FILE_NAME]),
+            )
+
+        # Merging again adds nothing twice
+        self.assertEqual(
+            metrics.collect_metrics()['report_uploads_total'],
+            {'': 5},
+            )
+
+    def test_reused_process_id(self):
+        """Test that a process given an exited one's ID claims its file, rather than adding to it."""
+        with open(metrics.get_metrics_path(), 'w', encoding='utf-8') as file:
+            json.dump({'report_uploads_total': {'': 2}}, file)
+
+        metrics.increment('report_uploads_total')
+
+        self.assertEqual(metrics.get_metrics(), {'report_uploads_total': {'': 1}})
+        self.assertEqual(
+            metrics.collect_metrics()['report_uploads_total'],
+            {'': 3},
+            )
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.temp_dir.name) if name.endswith('.json')),
+            sorted([f'{os.getpid()}.json', metrics.AGGREGATE_FILE_NAME]),
+            )
+
+    def test_flush_if_due(self):
+        """Test that the metrics are only written once changed, and at most once an interval."""
+        metrics_path = metrics.get_metrics_path()
+
+        metrics.increment('report_uploads_total')
+        metrics.flush_if_due()
+        self.assertEqual(metrics.read_metrics_file(metrics_path), {'report_uploads_total': {'': 1}})
+
+        # Not yet written again within the interval
+        metrics.increment('report_uploads_total')
+        metrics.flush_if_due()
+        self.assertEqual(metrics.read_metrics_file(metrics_path), {'report_uploads_total': {'': 1}})
+
+        with mock.patch.object(metrics, 'FLUSH_INTERVAL_SECONDS', 0):
+            metrics.flush_if_due()
+            self.assertEqual(metrics.read_metrics_file(metrics_path), {'report_uploads_total': {'': 2}})
+
+            # Nothing changed, so nothing is written
+            os.remove(metrics_path)
+            metrics.flush_if_due()
+            self.assertFalse(os.path.exists(metrics_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
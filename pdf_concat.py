@@ -0,0 +1,366 @@
+"""This module contains a writer that joins PDF files made by ReportLab into one.
+
+ReportLab holds the whole document in memory until it is saved, so a very
+large class is drawn in parts, each saved to a file of its own, and the
+parts are appended to the output one at a time as they are finished. The
+same is used to splice the cached PDF file of each student into a class's,
+and split_pages cuts a part into the PDF file of each student to cache.
+
+Only the layout ReportLab writes is read, with an xref table rather than
+compressed object streams; anything else raises PdfFormatError, so that
+the caller can draw the document directly instead.
+"""
+
+import hashlib
+import io
+import re
+
+
+# ReportLab writes an xref table at the end of each file,
+# followed by the trailer and the offset of the xref table
+STARTXREF_PATTERN = re.compile(rb'startxref\s+(\d+)\s+%%EOF\s*$')
+XREF_ENTRY_PATTERN = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+REFERENCE_PATTERN = re.compile(rb'(\d+) 0 R\b')
+OBJECT_HEADER_PATTERN = re.compile(rb'^(\d+) 0 obj')
+ROOT_PATTERN = re.compile(rb'/Root (\d+) 0 R')
+INFO_PATTERN = re.compile(rb'/Info (\d+) 0 R')
+PAGES_PATTERN = re.compile(rb'/Pages (\d+) 0 R')
+OUTLINES_PATTERN = re.compile(rb'/Outlines (\d+) 0 R')
+KIDS_PATTERN = re.compile(rb'/Kids \[([^\]]*)\]')
+PAGE_PATTERN = re.compile(rb'/Type /Page\b')
+
+# The objects written when the output is closed
+PAGES_NUMBER = 1
+CATALOG_NUMBER = 2
+
+
+class PdfFormatError(ValueError):
+    """This error is raised for a PDF file not laid out as ReportLab writes them."""
+
+
+def read_objects(pdf_data: bytes) -> tuple:
+    """This function splits a PDF file made by ReportLab into its objects.
+
+    Args:
+        pdf_data (bytes): The contents of the PDF file.
+
+    Returns:
+        tuple: The objects, by number, and the trailer.
+    """
+    match = STARTXREF_PATTERN.search(pdf_data)
+    if match is None:
+        raise PdfFormatError('PDF file has no cross-reference table.')
+
+    xref_offset = int(match.group(1))
+    if not pdf_data.startswith(b'xref', xref_offset) or b'trailer' not in pdf_data[xref_offset:]:
+        raise PdfFormatError('PDF file has a compressed cross-reference table.')
+    xref, trailer = pdf_data[xref_offset:].split(b'trailer', 1)
+
+    offsets = sorted(
+        (int(offset), number)
+        for number, (offset, _, kind) in enumerate(XREF_ENTRY_PATTERN.findall(xref))
+        if kind == b'n'
+        )
+
+    # Each object runs up to the next one, or the xref table for the last
+    objects = {}
+    for index, (offset, number) in enumerate(offsets):
+        end = offsets[index + 1][0] if index + 1 < len(offsets) else xref_offset
+        objects[number] = pdf_data[offset:end]
+
+    return objects, trailer
+
+def read_header(pdf_data: bytes) -> bytes:
+    """This function returns the version and the binary marker a PDF file starts with.
+
+    Args:
+        pdf_data (bytes): The contents of the PDF file.
+
+    Returns:
+        bytes: The first two lines of the PDF file.
+    """
+    return pdf_data[:pdf_data.index(b'\n', pdf_data.index(b'\n') + 1) + 1]
+
+def read_page_tree(objects: dict, trailer: bytes) -> tuple:
+    """This function finds the catalog, the page tree and the pages of a PDF file.
+
+    Args:
+        objects (dict): The objects of the PDF file, by number, see read_objects.
+        trailer (bytes): The trailer of the PDF file.
+
+    Returns:
+        tuple: The number of the catalog, of the page tree, and of each page.
+    """
+    root_number = get_reference(ROOT_PATTERN, trailer)
+    pages_number = get_reference(PAGES_PATTERN, objects.get(root_number, b''))
+    kids = KIDS_PATTERN.search(objects.get(pages_number, b''))
+    if kids is None:
+        raise PdfFormatError('PDF file has no page tree.')
+
+    page_numbers = [int(number) for number in REFERENCE_PATTERN.findall(kids.group(1))]
+    if any(number not in objects for number in page_numbers):
+        raise PdfFormatError('PDF file has pages outside its xref table.')
+
+    return root_number, pages_number, page_numbers
+
+def get_reference(pattern: re.Pattern, data: bytes) -> int:
+    """This function returns the object number a key of a dictionary refers to.
+
+    Args:
+        pattern (re.Pattern): The pattern of the key, e.g. ROOT_PATTERN.
+        data (bytes): The dictionary.
+
+    Returns:
+        int: The object number, or None if the key is not there.
+    """
+    match = pattern.search(data)
+    return int(match.group(1)) if match else None
+
+class PdfConcatenator:
+    """This class writes the pages of several PDF files into one, a file at a time.
+
+    Only the part being appended is held in memory. The objects of each part
+    are renumbered after the ones already written, and the pages of all the
+    parts share one page tree, written when the output is closed. An object
+    that is the same as one already written, e.g. a font, the page frame or
+    the school logo that every part has, is not written again, and refers
+    to the one already written instead; only the digests of the objects
+    written are kept for this.
+
+    Args:
+        output_path (str): The path to write the joined PDF file to, or a
+            binary file object, e.g. io.BytesIO, which is left open.
+    """
+
+    def __init__(self, output_path):
+        if isinstance(output_path, str):
+            self.output_path = output_path
+            self.output_file = open(output_path, 'wb')  # pylint: disable=consider-using-with
+        else:
+            self.output_path = None
+            self.output_file = output_path
+        self.offsets = {}
+        self.page_numbers = []
+        self.next_number = CATALOG_NUMBER + 1
+        self.header_written = False
+        self.written_numbers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        elif self.output_path is not None:
+            self.output_file.close()
+
+    def write(self, data: bytes) -> None:
+        """Write data to the output, e.g. an object or the header."""
+        self.output_file.write(data)
+
+    def write_object(self, number: int, body: bytes) -> None:
+        """Write an object to the output, noting its offset for the xref table."""
+        self.offsets[number] = self.output_file.tell()
+        self.write(b'%d 0 obj\n' % number + body)
+
+    def append(self, pdf_path: str) -> None:
+        """This function appends the pages of a PDF file made by ReportLab.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            None
+        """
+        with open(pdf_path, 'rb') as pdf_file:
+            self.append_data(pdf_file.read())
+
+    def append_data(self, pdf_data: bytes) -> None:
+        """This function appends the pages of a PDF file made by ReportLab, from memory.
+
+        Args:
+            pdf_data (bytes): The contents of the PDF file.
+
+        Returns:
+            None
+        """
+        header = read_header(pdf_data)
+        objects, trailer = read_objects(pdf_data)
+        del pdf_data
+
+        self.append_objects(header, objects, trailer)
+
+    def append_objects(
+            self,
+            header: bytes,
+            objects: dict,
+            trailer: bytes,
+            pages: list = None,
+            ) -> None:
+        """This function appends the pages of a PDF file already split into its objects.
+
+        Args:
+            header (bytes): The first lines of the PDF file, see read_header.
+            objects (dict): The objects of the PDF file, by number, as returned
+                by read_objects; the ones written are removed from it.
+            trailer (bytes): The trailer of the PDF file.
+            pages (list): The indexes of the pages to append, with only the
+                objects they refer to, or None for every page and object.
+
+        Returns:
+            None
+        """
+        if not self.header_written:
+            # The version and the binary marker of the first part
+            self.write(header)
+            self.header_written = True
+
+        # The catalog, the page tree and the document info of each part
+        # are replaced by the ones written when the output is closed
+        root_number, pages_number, page_numbers = read_page_tree(objects, trailer)
+
+        numbers = {pages_number: PAGES_NUMBER}
+        if pages is None:
+            skipped = {
+                root_number,
+                pages_number,
+                get_reference(INFO_PATTERN, trailer),
+                get_reference(OUTLINES_PATTERN, objects[root_number]),
+                }
+            for number in sorted(objects):
+                if number not in skipped and number not in numbers:
+                    self.write_part_object(number, objects, numbers, set())
+        else:
+            page_numbers = [page_numbers[index] for index in pages]
+            for number in page_numbers:
+                if number not in numbers:
+                    self.write_part_object(number, objects, numbers, set())
+
+        self.page_numbers.extend(numbers[number] for number in page_numbers)
+
+    def write_part_object(self, number: int, objects: dict, numbers: dict, pending: set) -> int:
+        """This function writes an object of the part being appended, after the ones it refers to.
+
+        The objects an object refers to are written first, so that its body
+        holds their numbers in the output, and can be compared with the
+        objects already written. Pages are always written, as each page of
+        the page tree must be an object of its own.
+
+        Args:
+            number (int): The number of the object in the part.
+            objects (dict): The objects of the part not yet written, by number.
+            numbers (dict): The number in the output of each object of the
+                part written so far, updated in place.
+            pending (set): The objects whose references are being written,
+                so that an object referring back to one of them gets a
+                number without waiting for it.
+
+        Returns:
+            int: The number of the object in the output.
+        """
+        if number in pending:
+            numbers[number] = self.next_number
+            self.next_number += 1
+            return numbers[number]
+
+        if number not in objects:
+            raise PdfFormatError(f'PDF file refers to object {number}, not in its xref table.')
+
+        pending.add(number)
+        body = OBJECT_HEADER_PATTERN.sub(b'', objects.pop(number), count=1)
+
+        def renumber(match):
+            referenced = int(match.group(1))
+            if referenced not in numbers:
+                self.write_part_object(referenced, objects, numbers, pending)
+            return b'%d 0 R' % numbers[referenced]
+
+        # Only the dictionary is renumbered, never the stream after it
+        dictionary, stream_marker, stream = body.partition(b'\nstream')
+        body = REFERENCE_PATTERN.sub(renumber, dictionary) + stream_marker + stream
+        pending.discard(number)
+
+        # An object referred back to while its references were written
+        # already has its number, and so cannot be shared
+        if number in numbers:
+            self.write_object(numbers[number], body)
+            return numbers[number]
+
+        is_page = PAGE_PATTERN.search(dictionary) is not None
+        digest = hashlib.sha256(body).digest()
+        if not is_page and digest in self.written_numbers:
+            numbers[number] = self.written_numbers[digest]
+            return numbers[number]
+
+        numbers[number] = self.next_number
+        self.next_number += 1
+        self.write_object(numbers[number], body)
+        if not is_page:
+            self.written_numbers[digest] = numbers[number]
+
+        return numbers[number]
+
+    def close(self) -> None:
+        """This function writes the page tree, the catalog and the xref table.
+
+        Returns:
+            None
+        """
+        if not self.header_written:
+            self.write(b'%PDF-1.4\n')
+
+        kids = b' '.join(b'%d 0 R' % number for number in self.page_numbers)
+        self.write_object(
+            PAGES_NUMBER,
+            b'<<\n/Count %d /Kids [ %s ] /Type /Pages\n>>\nendobj\n' % (
+                len(self.page_numbers),
+                kids,
+                ),
+            )
+        self.write_object(
+            CATALOG_NUMBER,
+            b'<<\n/PageMode /UseNone /Pages %d 0 R /Type /Catalog\n>>\nendobj\n' % PAGES_NUMBER,
+            )
+
+        xref_offset = self.output_file.tell()
+        size = self.next_number
+        self.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for number in range(1, size):
+            self.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.write(
+            b'trailer\n<<\n/Root %d 0 R\n/Size %d\n>>\nstartxref\n%d\n%%%%EOF\n' % (
+                CATALOG_NUMBER,
+                size,
+                xref_offset,
+                )
+            )
+
+        if self.output_path is not None:
+            self.output_file.close()
+
+def split_pages(pdf_data: bytes) -> list:
+    """This function splits a PDF file made by ReportLab into a PDF file for each page.
+
+    Each PDF file only holds its page and the objects the page refers to,
+    e.g. the fonts and the forms it draws, so that appending them one after
+    another gives the same PDF file as appending the whole file at once.
+
+    Args:
+        pdf_data (bytes): The contents of the PDF file.
+
+    Returns:
+        list: The contents of the PDF file of each page, in order.
+    """
+    header = read_header(pdf_data)
+    objects, trailer = read_objects(pdf_data)
+    del pdf_data
+
+    page_files = []
+    for index in range(len(read_page_tree(objects, trailer)[2])):
+        page_file = io.BytesIO()
+        with PdfConcatenator(page_file) as concatenator:
+            # The objects written are removed, so each page is given a copy
+            concatenator.append_objects(header, dict(objects), trailer, [index])
+        page_files.append(page_file.getvalue())
+
+    return page_files
@@ -0,0 +1,350 @@
+"""Tests for pdf_concat.py"""
+
+import base64
+import os
+import re
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import pdf_generator
+from benchmark import read_class, write_class_workbook
+from pdf_concat import PdfConcatenator, PdfFormatError, read_objects, read_page_tree
+from pdf_concat import get_reference, split_pages, ROOT_PATTERN
+from pdf_generator import generate_combined_pdf, generate_pdf, iter_student_pdfs
+from render_cache import RenderCache
+
+
+def write_pdf(file_path, page_texts):
+    """Write a PDF file with a page for each text, sharing a form."""
+    canvass = canvas.Canvas(file_path, pagesize=letter)
+    canvass.beginForm('frame')
+    canvass.rect(50, 50, 500, 700)
+    canvass.endForm()
+    for text in page_texts:
+        canvass.doForm('frame')
+        canvass.drawString(100, 700, text)
+        canvass.showPage()
+    canvass.save()
+
+def read_page_texts(pdf_data):
+    """Read the strings drawn on each page of a PDF file made by ReportLab, in order."""
+    objects, trailer = read_objects(pdf_data)
+    page_texts = []
+    for page_number in read_page_tree(objects, trailer)[2]:
+        contents_number = int(re.search(rb'/Contents (\d+) 0 R', objects[page_number]).group(1))
+        stream = objects[contents_number].partition(b'stream\n')[2].partition(b'~>')[0]
+        content = zlib.decompress(base64.a85decode(stream))
+        page_texts.append(re.findall(rb'\((.*?)\) Tj', content))
+    return page_texts
+
+
+class TestPdfConcatenator(unittest.TestCase):
+    """Tests for joining PDF files made by ReportLab."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_path(self, file_name):
+        """Return a path in the temporary directory."""
+        return os.path.join(self.temp_dir.name, file_name)
+
+    def test_append_parts(self):
+        """Test that the pages of all the parts end up in one page tree, in order."""
+        write_pdf(self.get_path('first.pdf'), ['Page 1', 'Page 2'])
+        write_pdf(self.get_path('second.pdf'), ['Page 3'])
+
+        with PdfConcatenator(self.get_path('joined.pdf')) as concatenator:
+            concatenator.append(self.get_path('first.pdf'))
+            concatenator.append(self.get_path('second.pdf'))
+
+        with open(self.get_path('joined.pdf'), 'rb') as pdf_file:
+            pdf_data = pdf_file.read()
+
+        self.assertTrue(pdf_data.startswith(b'%PDF-1.3'))
+        objects, trailer = read_objects(pdf_data)
+        catalog = objects[get_reference(ROOT_PATTERN, trailer)]
+        self.assertIn(b'/Type /Catalog', catalog)
+
+        pages = [body for body in objects.values() if b'/Type /Page\n' in body]
+        self.assertEqual(len(pages), 3)
+        self.assertIn(b'/Count 3', objects[1])
+
+        # Every reference points at an object that was written
+        for body in objects.values():
+            dictionary = body.partition(b'\nstream')[0]
+            for number in dictionary.split(b' 0 R')[:-1]:
+                self.assertIn(int(number.split()[-1]), objects)
+
+    def test_identical_objects_written_once(self):
+        """Test that the form and fonts both parts have are only written once."""
+        write_pdf(self.get_path('first.pdf'), ['Page 1'])
+        write_pdf(self.get_path('second.pdf'), ['Page 2'])
+
+        with PdfConcatenator(self.get_path('joined.pdf')) as concatenator:
+            concatenator.append(self.get_path('first.pdf'))
+            concatenator.append(self.get_path('second.pdf'))
+
+        with open(self.get_path('joined.pdf'), 'rb') as pdf_file:
+            objects, _ = read_objects(pdf_file.read())
+
+        forms = [body for body in objects.values() if b'/Subtype /Form' in body]
+        pages = [body for body in objects.values() if b'/Type /Page\n' in body]
+        self.assertEqual(len(forms), 1)
+        self.assertEqual(len(pages), 2)
+
+    def test_split_pages(self):
+        """Test that the pages of a PDF file split apart join up into the same pages."""
+        write_pdf(self.get_path('whole.pdf'), ['Page 1', 'Page 2', 'Page 3'])
+        with open(self.get_path('whole.pdf'), 'rb') as pdf_file:
+            page_files = split_pages(pdf_file.read())
+
+        self.assertEqual(len(page_files), 3)
+        for page_data in page_files:
+            objects, _ = read_objects(page_data)
+            pages = [body for body in objects.values() if b'/Type /Page\n' in body]
+            self.assertEqual(len(pages), 1)
+
+        with PdfConcatenator(self.get_path('joined.pdf')) as concatenator:
+            for page_data in page_files:
+                concatenator.append_data(page_data)
+
+        with open(self.get_path('joined.pdf'), 'rb') as pdf_file:
+            objects, _ = read_objects(pdf_file.read())
+        forms = [body for body in objects.values() if b'/Subtype /Form' in body]
+        self.assertEqual(len(forms), 1)
+        self.assertIn(b'/Count 3', objects[1])
+
+    def test_no_parts(self):
+        """Test that an empty page tree is written when nothing is appended."""
+        PdfConcatenator(self.get_path('empty.pdf')).close()
+
+        with open(self.get_path('empty.pdf'), 'rb') as pdf_file:
+            objects, _ = read_objects(pdf_file.read())
+
+        self.assertIn(b'/Count 0', objects[1])
+
+    def test_classes_drawn_in_parallel(self):
+        """Test that classes drawn by worker processes are joined in order, as if drawn together."""
+        classes = []
+        for number_of_students in (3, 5):
+            file_path = self.get_path(f'class_{number_of_students}.xlsx')
+            write_class_workbook(file_path, number_of_students)
+            classes.append(read_class(file_path))
+
+        for processes in (1, 2):
+            output_path = self.get_path(f'combined_{processes}.pdf')
+            generate_combined_pdf(
+                classes,
+                output_path,
+                processes=processes,
+                chart_backend='reportlab',
+                )
+
+            with open(output_path, 'rb') as pdf_file:
+                objects, _ = read_objects(pdf_file.read())
+            pages = [body for body in objects.values() if b'/Type /Page\n' in body]
+
+            # A page for each student, after the blank page the PDF file starts with
+            self.assertEqual(len(pages), 9)
+
+        # The file of each class is removed once it is joined
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.temp_dir.name) if name.endswith('.pdf')),
+            ['combined_1.pdf', 'combined_2.pdf'],
+            )
+
+    def test_cached_pages_spliced(self):
+        """Test that a combined PDF from cached pages is the same as when they were drawn."""
+        classes = []
+        for number_of_students in (3, 5):
+            file_path = self.get_path(f'class_{number_of_students}.xlsx')
+            write_class_workbook(file_path, number_of_students)
+            classes.append(read_class(file_path))
+        render_cache = RenderCache(self.get_path('render_cache'))
+
+        generate_combined_pdf(
+            classes,
+            self.get_path('drawn.pdf'),
+            chart_backend='reportlab',
+            render_cache=render_cache,
+            )
+
+        # The second time, no student's page is drawn
+        with mock.patch('pdf_generator.draw_student_page', side_effect=AssertionError):
+            generate_combined_pdf(
+                classes,
+                self.get_path('spliced.pdf'),
+                chart_backend='reportlab',
+                render_cache=render_cache,
+                )
+
+        with open(self.get_path('drawn.pdf'), 'rb') as pdf_file:
+            drawn_data = pdf_file.read()
+        with open(self.get_path('spliced.pdf'), 'rb') as pdf_file:
+            spliced_data = pdf_file.read()
+
+        self.assertEqual(spliced_data, drawn_data)
+        objects, _ = read_objects(spliced_data)
+        pages = [body for body in objects.values() if b'/Type /Page\n' in body]
+        self.assertEqual(len(pages), 9)
+
+    def test_changed_pages_drawn_together(self):
+        """Test that only the pages not cached are drawn, on one canvas, without the other plots."""
+        file_path = self.get_path('class_5.xlsx')
+        write_class_workbook(file_path, 5)
+        class_details = read_class(file_path)
+        render_cache = RenderCache(self.get_path('render_cache'))
+
+        def generate(file_name):
+            generate_pdf(
+                *class_details[:3],
+                self.get_path(file_name),
+                class_details[3],
+                class_table=class_details[4],
+                render_cache=render_cache,
+                )
+            with open(self.get_path(file_name), 'rb') as pdf_file:
+                return pdf_file.read()
+
+        drawn_data = generate('drawn.pdf')
+
+        # Two of the pages are no longer cached
+        pages_dir = os.path.join(render_cache.folder, 'pages')
+        page_paths = sorted(
+            os.path.join(directory, file_name)
+            for directory, _, file_names in os.walk(pages_dir)
+            for file_name in file_names
+            )
+        for page_path in page_paths[:2]:
+            os.remove(page_path)
+
+        with mock.patch(
+                'pdf_generator.register_page_frame',
+                wraps=pdf_generator.register_page_frame,
+                ) as register_page_frame, mock.patch.object(
+                    render_cache,
+                    'get',
+                    wraps=render_cache.get,
+                    ) as cache_get:
+            spliced_data = generate('spliced.pdf')
+
+        self.assertEqual(register_page_frame.call_count, 1)
+        plots_read = [call for call in cache_get.call_args_list if call.args[0] == 'plots']
+        self.assertEqual(len(plots_read), 2)
+        self.assertEqual(spliced_data, drawn_data)
+
+    def test_pages_drawn_in_parallel(self):
+        """Test that pages drawn in parts by worker processes are spliced in order."""
+        file_path = self.get_path('class_5.xlsx')
+        write_class_workbook(file_path, 5)
+        class_details = read_class(file_path)
+
+        pdf_files = []
+        for processes in (1, 2):
+            output_path = self.get_path(f'class_{processes}.pdf')
+            generate_pdf(
+                *class_details[:3],
+                output_path,
+                class_details[3],
+                processes=processes,
+                chart_backend='reportlab',
+                class_table=class_details[4],
+                render_cache=RenderCache(self.get_path(f'render_cache_{processes}')),
+                )
+            with open(output_path, 'rb') as pdf_file:
+                pdf_files.append(pdf_file.read())
+
+        self.assertEqual(pdf_files[1], pdf_files[0])
+
+    def test_class_report_round_trip(self):
+        """Test that a class report split into pages and joined again has the same text."""
+        file_path = self.get_path('class_5.xlsx')
+        write_class_workbook(file_path, 5)
+        class_details = read_class(file_path)
+
+        generate_pdf(
+            *class_details[:3],
+            self.get_path('direct.pdf'),
+            class_details[3],
+            class_table=class_details[4],
+            )
+        generate_pdf(
+            *class_details[:3],
+            self.get_path('spliced.pdf'),
+            class_details[3],
+            class_table=class_details[4],
+            render_cache=RenderCache(self.get_path('render_cache')),
+            )
+
+        with open(self.get_path('direct.pdf'), 'rb') as pdf_file:
+            direct_data = pdf_file.read()
+        with PdfConcatenator(self.get_path('joined.pdf')) as concatenator:
+            for page_data in split_pages(direct_data):
+                concatenator.append_data(page_data)
+
+        direct_texts = read_page_texts(direct_data)
+        self.assertEqual(len(direct_texts), 6)
+        self.assertIn(b'STUDENT NAME:', b' '.join(direct_texts[1]))
+        for file_name in ('joined.pdf', 'spliced.pdf'):
+            with open(self.get_path(file_name), 'rb') as pdf_file:
+                self.assertEqual(read_page_texts(pdf_file.read()), direct_texts)
+
+    def test_unsplittable_pdf_drawn_directly(self):
+        """Test that PDF files the concatenator cannot read are drawn directly instead."""
+        file_path = self.get_path('class_3.xlsx')
+        write_class_workbook(file_path, 3)
+        class_details = read_class(file_path)
+        generate_pdf(
+            *class_details[:3],
+            self.get_path('direct.pdf'),
+            class_details[3],
+            chart_backend='reportlab',
+            class_table=class_details[4],
+            )
+
+        pdf_generator.can_split_pages.cache_clear()
+        self.addCleanup(pdf_generator.can_split_pages.cache_clear)
+        with mock.patch(
+                'pdf_concat.read_objects',
+                side_effect=PdfFormatError('PDF file has a compressed cross-reference table.'),
+                ):
+            for low_memory in (False, True):
+                generate_pdf(
+                    *class_details[:3],
+                    self.get_path(f'fallback_{low_memory}.pdf'),
+                    class_details[3],
+                    chart_backend='reportlab',
+                    class_table=class_details[4],
+                    render_cache=RenderCache(self.get_path(f'render_cache_{low_memory}')),
+                    low_memory=low_memory,
+                    )
+
+            student_pdfs = list(iter_student_pdfs(
+                *class_details[:4],
+                chart_backend='reportlab',
+                class_table=class_details[4],
+                ))
+
+        with open(self.get_path('direct.pdf'), 'rb') as pdf_file:
+            direct_texts = read_page_texts(pdf_file.read())
+        for low_memory in (False, True):
+            with open(self.get_path(f'fallback_{low_memory}.pdf'), 'rb') as pdf_file:
+                self.assertEqual(read_page_texts(pdf_file.read()), direct_texts)
+
+        # Each student's PDF file is drawn on a canvas of its own
+        self.assertEqual(
+            [read_page_texts(pdf_data) for _, pdf_data in student_pdfs],
+            [[page_texts] for page_texts in direct_texts[1:]],
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
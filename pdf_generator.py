@@ -1,51 +1,192 @@
 """This module contains the function for generating a PDF file for all the students."""
 
+import functools
 import io
 
-import re
+import math
+
+import os
 
 import tempfile
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 
-from reportlab.platypus import Table, TableStyle
 
+from class_table import MARK_PATTERN, ClassTable
+from render_cache import RenderCache, fingerprint, fingerprint_image
+from metrics import flush, time_stage
+from pdf_concat import PdfConcatenator, PdfFormatError, split_pages
+from text_layout import wrap_words
 from comments import generate_subject_comments
+from comments import generate_class_subject_comments
 from comments import generate_overall_comment
 
-import matplotlib
-import matplotlib.pyplot as plt
+import numpy as np
 
 from PIL import Image
 
-secondary_logo_img = Image.open('harambee.png')
+# The backends that can draw the student charts
+CHART_BACKENDS = ('matplotlib', 'reportlab')
 
+# The number of students drawn into each part of the PDF file in the
+# low-memory mode, which bounds how many pages ReportLab holds at once
+LOW_MEMORY_PART_SIZE = 100
 
-matplotlib.use('Agg')  # Set the backend to Agg
+# The most memory drawing the pages takes in the low-memory mode, in MiB,
+# on top of the class's records, whatever the number of students or worker
+# processes; most of it is matplotlib itself, when the charts are rendered with it
+LOW_MEMORY_CEILING_MIB = {
+    'matplotlib': 100,
+    'reportlab': 15,
+    }
 
+# The number of students whose plots a worker process renders at a time, and
+# how many such batches each worker process may be given ahead of the pages,
+# which bounds how many rendered plots wait to be drawn
+PLOT_BATCH_SIZE = 8
+PLOT_BATCHES_PER_PROCESS = 2
 
-def start_new_page(
+# How many parts of the pages each worker process may be given ahead of the
+# parts being spliced, which bounds how many drawn pages wait to be spliced
+PAGE_PARTS_PER_PROCESS = 2
+
+# How far the legend of a chart drawn by ReportLab is inside the plot's frame
+LEGEND_MARGIN = 3
+
+# The width the overall comment and the headteacher's remarks are wrapped to
+COMMENT_WIDTH = 430
+
+# How far the student details are below the title details
+STUDENT_DETAILS_OFFSET = 70
+
+# The layout of the table of each student's marks, in points: the bottom
+# left corner relative to the student details, the column widths, and the
+# heights and bottom paddings of the row of headings and of each subject's row
+MARKS_TABLE_POSITION = (80, -244)
+MARKS_TABLE_COLUMN_WIDTHS = (80, 80, 80, 210)
+MARKS_TABLE_ROW_HEIGHTS = (25,) + (20,) * 12
+MARKS_TABLE_BOTTOM_PADDINGS = (12,) + (3,) * 12
+MARKS_TABLE_HEADINGS = ("Subject", "Student's Mark", "Class Avg.", "Comment")
+MARKS_TABLE_FONT_SIZE = 10
+MARKS_TABLE_LEADING = 12
+
+# The logo in the top right corner, next to the school's logo
+SECONDARY_LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'harambee.png')
+
+
+@functools.lru_cache(maxsize=None)
+def get_secondary_logo() -> Image.Image:
+    """This function loads the secondary logo the first time it is drawn.
+
+    The logo is found next to this module, rather than in the working
+    directory, and is not loaded when the module is imported.
+
+    Returns:
+        Image.Image: The secondary logo.
+    """
+    secondary_logo = Image.open(SECONDARY_LOGO_PATH)
+    secondary_logo.load()
+    return secondary_logo
+
+def get_pyplot():
+    """This function imports pyplot the first time a plot is rendered.
+
+    Matplotlib takes longer to import than the rest of the app, and is not
+    needed at all when the charts are drawn with ReportLab, so it is only
+    imported when a plot is rendered with it.
+
+    Returns:
+        module: matplotlib.pyplot, with the Agg backend.
+    """
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('Agg')  # Set the backend to Agg
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def register_logos(
         canvass: canvas.Canvas,
         width: int,
         height: int,
-        title_details: list,
         school_logo: list,
+        prefix: str = '',
+        ) -> list:
+    """This function stores the logos once in the PDF file, to be reused on every page.
+
+    Each logo is encoded once and saved as a form, which every page then refers
+    to, instead of embedding the logos again on each page.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        width (int): The width of the PDF file.
+        height (int): The height of the PDF file.
+        school_logo (list): Any images found in the spreadsheet.
+        prefix (str): A prefix for the school logo's form name, to tell the
+            classes apart when several are in the same PDF file.
+
+    Returns:
+        list: The names of the logo forms.
+    """
+    logos = []
+
+    # Check if there are images in school_logo
+    if school_logo:
+        # Use the first image from the list
+        canvass.beginForm(f'{prefix}school_logo')
+        canvass.drawImage(
+            ImageReader(school_logo[0]),
+            45,
+            height - 80,
+            width=75,
+            height=75,
+            mask='auto',
+            )
+        canvass.endForm()
+        logos.append(f'{prefix}school_logo')
+
+    # This is the position of the harambee logo,
+    # which is the same for all classes
+    if not canvass.hasForm('secondary_logo'):
+        canvass.beginForm('secondary_logo')
+        canvass.drawImage(
+            ImageReader(get_secondary_logo()),
+            width - 143,
+            height - 79,
+            width=98,
+            height=73,
+            )
+        canvass.endForm()
+    logos.append('secondary_logo')
+
+    return logos
+
+def draw_page_header(
+        canvass: canvas.Canvas,
+        width: int,
+        height: int,
+        title_details: list,
+        logos: list,
         ) -> int:
-    """This function starts a new page in the PDF file.
+    """This function draws the title details, rules and logos on top of a page.
 
     Args:
         c (canvas.Canvas): The canvas object for the PDF file.
         width (int): The width of the PDF file.
         height (int): The height of the PDF file.
         title_details (list): The details to be displayed on top of the report form.
+        logos (list): The names of the logo forms, see register_logos.
 
     Returns:
         int: The y position of the next line, so that student details can be placed.
     """
-    canvass.showPage()
     canvass.setFont("Helvetica-Bold", 22)
 
     # Set the starting position (from the top of the page)
@@ -130,39 +271,157 @@ def start_new_page(
         y_position + 10,
         )
 
-    # Check if there are images in school_logo
-    if school_logo:
-        # Use the first image from the list
-        logo_img = school_logo[0]
-
-        # Convert PIL Image to a format usable by ReportLab (PNG)
-        with tempfile.NamedTemporaryFile(
-            delete=True,
-            suffix='.png',
-            ) as temp:
-            logo_img.save(
-                temp.name,
-                format="PNG",
-                )
+    # Draw the logos, which are only stored once in the PDF file
+    for logo in logos:
+        canvass.doForm(logo)
 
-            # Draw the logo on the canvas
-            canvass.drawImage(
-                temp.name,
-                45,
-                height - 80,
-                width=75,
-                height=75,
-                mask='auto',
-                )
+    return y_position
 
-    # This is the position of the harambee logo
-    canvass.drawInlineImage(
-        secondary_logo_img,
-        width - 143,
-        height - 79,
-        width=98,
-        height=73,
-    )
+def draw_page_borders(canvass: canvas.Canvas) -> None:
+    """This function draws the comment boxes and the borders of a page.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+
+    Returns:
+        None
+    """
+    # draw rectangle around the overall comment
+    canvass.rect(
+        80,
+        189,
+        450,
+        -63,
+        )
+
+    # draw rectangle around the headteacher's remarks
+    canvass.rect(
+        80,
+        121,
+        450,
+        -63,
+        )
+
+    # draw two vertical lines
+    canvass.line(
+        50,
+        53,
+        50,
+        704,
+        )
+    canvass.line(
+        562,
+        53,
+        562,
+        704,
+        )
+
+    # draw the thinner horizontal line
+    canvass.line(
+        50,
+        53,
+        562,
+        53,
+        )
+
+    # Drawing the thicker line.
+    canvass.setLineWidth(3)
+    canvass.line(
+        50,
+        50,
+        562,
+        50,
+        )
+
+    # get the line width back to normal
+    canvass.setLineWidth(1)
+
+def register_page_frame(
+        canvass: canvas.Canvas,
+        width: int,
+        height: int,
+        title_details: list,
+        school_logo: list,
+        prefix: str = '',
+        marks_table: 'MarksTable' = None,
+        ) -> tuple:
+    """This function stores the parts of a page that are the same for every student.
+
+    The title details, rules, logos, comment boxes, borders and the grid of
+    the marks table are drawn once into a form, which every page then refers to.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        width (int): The width of the PDF file.
+        height (int): The height of the PDF file.
+        title_details (list): The details to be displayed on top of the report form.
+        school_logo (list): Any images found in the spreadsheet.
+        prefix (str): A prefix for the form names, to tell the classes apart
+            when several are in the same PDF file.
+        marks_table (MarksTable): The table of the students' marks, if any.
+
+    Returns:
+        tuple: The name of the form and the y position below the title details.
+    """
+    logos = register_logos(
+        canvass,
+        width,
+        height,
+        school_logo,
+        prefix,
+        )
+
+    canvass.beginForm(f'{prefix}page_frame')
+
+    y_position = draw_page_header(
+        canvass,
+        width,
+        height,
+        title_details,
+        logos,
+        )
+
+    draw_page_borders(canvass)
+
+    if marks_table is not None:
+        marks_table.draw_frame(
+            canvass,
+            y_position - STUDENT_DETAILS_OFFSET,
+            )
+
+    canvass.endForm()
+
+    return f'{prefix}page_frame', y_position
+
+def start_new_page(
+        canvass: canvas.Canvas,
+        page_frame: tuple,
+        show_page: bool = True,
+        ) -> int:
+    """This function starts a new page in the PDF file.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        page_frame (tuple): The form name and y position from register_page_frame.
+        show_page (bool): Whether to finish the current page first, rather than
+            drawing on it.
+
+    Returns:
+        int: The y position of the next line, so that student details can be placed.
+    """
+    if show_page:
+        canvass.showPage()
+
+    frame_name, y_position = page_frame
+    canvass.doForm(frame_name)
+
+    # The boxes drawn for each student use the same lines as the frame
+    canvass.setStrokeColorRGB(
+        0.45,
+        0.45,
+        0.45,
+        )  # mid-gray
+    canvass.setLineWidth(1)
 
     return y_position
 
@@ -177,6 +436,9 @@ def draw_7x4_table(canvass, _x, _y):
     Returns:
         None
     """
+    # Platypus is only imported when a table is drawn with it
+    from reportlab.platypus import Table, TableStyle  # pylint: disable=import-outside-toplevel
+
     data = [
         [
             'Header 1',
@@ -271,7 +533,7 @@ def format_class_average(class_average: str) -> str:
         return '0.00'
 
     # Check if class_average string contains a float or integer value
-    if re.match(r"^\d+\.\d+$", class_average_str) or re.match(r"^\d+$", class_average_str):
+    if MARK_PATTERN.match(class_average_str):
         return f"{float(class_average_str):.2f}"
 
     # It contains non-float or non-int at this point
@@ -318,6 +580,145 @@ def abbreviate_name(name: str, threshold: int) -> str:
     # If the name is a single word, just return it truncated to the threshold
     return name[:threshold]
 
+class MarksTable:
+    """This class draws the table of a student's marks straight onto the canvas.
+
+    The columns, the rows and the style of the table are the same for every
+    student, so the position of each cell's text is worked out once for the
+    class. The grid, the headings, the subjects and the class averages are
+    drawn once, into the page frame, and only the student's marks and
+    comments are drawn on each page.
+
+    The table looks as it did when drawn with a platypus Table, with text
+    centred in each cell above the cell's bottom padding.
+
+    Args:
+        subjects (list): The subjects, ending with the total.
+        class_averages (list): The class average of each subject.
+    """
+
+    def __init__(self, subjects, class_averages):
+        # The column edges from the left, and the row edges from the top,
+        # relative to the y offset of the student details
+        left = MARKS_TABLE_POSITION[0]
+        self.x_positions = [left]
+        for column_width in MARKS_TABLE_COLUMN_WIDTHS:
+            self.x_positions.append(self.x_positions[-1] + column_width)
+
+        top = MARKS_TABLE_POSITION[1] + sum(MARKS_TABLE_ROW_HEIGHTS)
+        self.y_positions = [top]
+        for row_height in MARKS_TABLE_ROW_HEIGHTS:
+            self.y_positions.append(self.y_positions[-1] - row_height)
+
+        self.text_x = [
+            (column_left + column_right) / 2
+            for column_left, column_right in zip(self.x_positions, self.x_positions[1:])
+            ]
+
+        # The headings sit higher in their taller row
+        self.text_y = [
+            row_bottom + bottom_padding + MARKS_TABLE_LEADING - MARKS_TABLE_FONT_SIZE
+            for row_bottom, bottom_padding in zip(
+                self.y_positions[1:],
+                MARKS_TABLE_BOTTOM_PADDINGS,
+                )
+            ]
+
+        # The total, in the last row, is in bold
+        self.fonts = ['Helvetica'] * (len(subjects) - 1) + ['Helvetica-Bold']
+
+        self.frame_cells = [
+            (font, text_y, [
+                (self.text_x[0], str(subject)),
+                (self.text_x[2], str(format_class_average(class_average))),
+                ])
+            for font, text_y, subject, class_average in zip(
+                self.fonts,
+                self.text_y[1:],
+                subjects,
+                class_averages,
+                )
+            ]
+
+    def draw_frame(self, canvass: canvas.Canvas, y_offset: int) -> None:
+        """This function draws the parts of the table that are the same for every student.
+
+        Args:
+            canvass (canvas.Canvas): The canvas, or the form of the page frame.
+            y_offset (int): The y offset of the student details.
+
+        Returns:
+            None
+        """
+        canvass.saveState()
+
+        # The headings, in white on gray
+        canvass.setFillColor(colors.gray)
+        canvass.rect(
+            self.x_positions[0],
+            y_offset + self.y_positions[1],
+            self.x_positions[-1] - self.x_positions[0],
+            MARKS_TABLE_ROW_HEIGHTS[0],
+            stroke=0,
+            fill=1,
+            )
+
+        canvass.setFillColor(colors.whitesmoke)
+        canvass.setFont('Helvetica-Bold', MARKS_TABLE_FONT_SIZE)
+        for text_x, heading in zip(self.text_x, MARKS_TABLE_HEADINGS):
+            canvass.drawCentredString(text_x, y_offset + self.text_y[0], heading)
+
+        # The subjects and the class averages
+        canvass.setFillColor(colors.black)
+        for font, text_y, cells in self.frame_cells:
+            canvass.setFont(font, MARKS_TABLE_FONT_SIZE)
+            for text_x, text in cells:
+                canvass.drawCentredString(text_x, y_offset + text_y, text)
+
+        # The grid, with round caps and joins as a platypus Table has
+        canvass.setStrokeColor(colors.black)
+        canvass.setLineWidth(1)
+        canvass.setLineCap(1)
+        canvass.setLineJoin(1)
+        y_positions = [y_offset + y_position for y_position in self.y_positions]
+        canvass.grid(self.x_positions, y_positions)
+
+        # The outer frame is stroked again, as a Table's BOX over its GRID
+        canvass.grid(
+            [self.x_positions[0], self.x_positions[-1]],
+            [y_positions[0], y_positions[-1]],
+            )
+
+        canvass.restoreState()
+
+    def draw_student(
+            self,
+            canvass: canvas.Canvas,
+            y_offset: int,
+            marks: list,
+            comments: list,
+            ) -> None:
+        """This function draws a student's marks and comments into the table.
+
+        Args:
+            canvass (canvas.Canvas): The canvas object for the PDF file.
+            y_offset (int): The y offset of the student details.
+            marks (list): The student's marks, ending with the total.
+            comments (list): The student's subject comments.
+
+        Returns:
+            None
+        """
+        canvass.saveState()
+        canvass.setFillColor(colors.black)
+
+        for font, text_y, mark, comment in zip(self.fonts, self.text_y[1:], marks, comments):
+            canvass.setFont(font, MARKS_TABLE_FONT_SIZE)
+            canvass.drawCentredString(self.text_x[1], y_offset + text_y, str(mark))
+            canvass.drawCentredString(self.text_x[3], y_offset + text_y, str(comment))
+
+        canvass.restoreState()
+
 
 def generate_student_report(
         canvass: canvas.Canvas,
@@ -325,6 +726,8 @@ def generate_student_report(
         student: list,
         class_averages: set,
         number_number_column_heads: tuple,
+        comments: list = None,
+        marks_table: MarksTable = None,
         ) -> int:
     """This function generates a report for a single student.
 
@@ -337,6 +740,10 @@ def generate_student_report(
             number of students: the number of students in this class.
             column heads: the column heads in this sheet.
             class teacher's name: the class teacher of this class.
+        comments (list): The student's subject comments, if already generated
+            for the whole class with generate_class_subject_comments.
+        marks_table (MarksTable): The class's marks table, whose grid is already
+            drawn in the page frame. The whole table is drawn if not given.
 
     Returns:
         int: The y offset for the next line.
@@ -439,162 +846,24 @@ def generate_student_report(
     # Creating a table for subjects and marks
     subjects = number_number_column_heads[1][3:15]
 
-    comments = generate_subject_comments(
-        list(student[3:15])
-        )
-
-    data = [[
-        "Subject",
-        "Student's Mark",
-        "Class Avg.",
-        "Comment",
-        ]]
-
-    for i, subject in enumerate(subjects):
-        data.append([
-            subject,
-            format_mark(student[i + 3]),
-            format_class_average(class_averages[i]),
-            comments[i],
-            ]
+    if comments is None:
+        comments = generate_subject_comments(
+            list(student[3:15])
             )
 
-    # Adjusting size:
-    # Define the column widths
-    col_widths = [80, 80, 80, 210]
-    # Define the row heights
-    row_heights = [
-        25,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20,
-        20
-        ]
-
-    bold_last_row_index = len(data) - 1
-
-    table = Table(
-        data,
-        colWidths=col_widths,
-        rowHeights=row_heights,
-        )
-
-    table.setStyle(TableStyle([
-        (
-        'BACKGROUND',
-        (0, 0),
-        (-1, 0),
-        colors.gray,
-        ),
-        (
-        'TEXTCOLOR',
-        (0, 0),
-        (-1, 0),
-        colors.whitesmoke,
-        ),
-        (
-        'ALIGN',
-        (0, 0),
-        (-1, -1),
-        'CENTER',
-        ),
-        (
-        'FONTNAME',
-        (0, 0),
-        (-1, 0),
-        'Helvetica-Bold',
-        ),
-
-        # Set font to bold for the last row
-        (
-            'FONTNAME',
-            (0, bold_last_row_index),
-            (-1, bold_last_row_index),
-            'Helvetica-Bold',
-            ),
-
-        (
-        'BOTTOMPADDING',
-        (0, 0),
-        (-1, 0),
-        12,
-        ),
-        # ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        (
-        'GRID',
-        (0, 0),
-        (-1, -1),
-        1,
-        colors.black,
-        ),     # Inside lines
-        (
-        'BOX',
-        (0, 0),
-        (-1, -1),
-        1,
-        colors.black,
-        ),     # Outer frame
-    ]))
-
-    # Drawing the table on the canvas
-    table.wrapOn(
-        canvass,
-        100,
-        200,
-        )
+    if marks_table is None:
+        marks_table = MarksTable(subjects, class_averages)
+        marks_table.draw_frame(canvass, y_offset)
 
-    # Adjust the offsets accordingly
-    table.drawOn(
+    marks_table.draw_student(
         canvass,
-        80,
-        y_offset - 244,
+        y_offset,
+        student[3:15],
+        comments,
         )
 
     return y_offset - 200  # Adjust this value as needed
 
-def format_mark(mark) -> int:
-    """This function formats the results to be displayed on the report form.
-
-    This takes decimals and converts them to integers.
-    If there's a NoneType object, it replaces it with an empty string.
-    If there's a float, it converts it to an integer.
-    If there's a string containing a float or integer, it converts them accordingly.
-    Else, returns 0.
-    """
-
-    # Check if mark is None or empty string
-    if mark is None or mark == "" or mark == " ":
-        return 0
-
-    # Convert float to integer
-    if isinstance(mark, float):
-        return int(mark)
-
-    # Return mark if it's an integer
-    if isinstance(mark, int):
-        return mark
-
-    # Check if string contains float or integer and convert to integer
-    #if isinstance(mark, str)
-
-    # Float regex pattern
-    if re.match(r"^\d+\.\d+$", mark):
-        return int(float(mark))
-
-    # Integer regex pattern
-    if re.match(r"^\d+$", mark):
-        return int(mark)
-
-    return 0
-
 def create_student_plot_buffer(
         student_marks,
         class_averages,
@@ -614,16 +883,16 @@ def create_student_plot_buffer(
     student_marks = list(student_marks[3:15])
     # class_averages = list(class_averages)
 
-    student_marks[-1] = int(student_marks[-1]) / 11
+    # The marks are whole numbers from the ClassTable, and the total is
+    # shown as a mean over the subjects, also as a whole number
+    student_marks[-1] = int(student_marks[-1] / 11)
 
+    plt = get_pyplot()
     fig, axis = plt.subplots(figsize=(2.5, 1.1))
 
     # Add or remove subjects as per your data
     subjects = column_heads[3:14] + ['TOT']
 
-    for index, mark in enumerate(student_marks):
-        student_marks[index] = format_mark(mark)
-
     # change all the subjects to three characters long
     # these should be capitalized as well
     for index, subject in enumerate(subjects):
@@ -705,46 +974,580 @@ def create_student_plot_buffer(
 
     return buf
 
-def get_subject_marks(
-        subjects: str,
-        student_records: list,
-        ) -> dict:
-    """This function returns a dictionary of subject marks.
+class StudentPlotRenderer:
+    """This class renders the student plots of a class, reusing a single figure.
 
-    Args:
-        student_records (list): A list of student records.
+    The figure, axes, tick labels, class averages line and legend are the same
+    for all students, so they are only created once. For each student, only the
+    bar heights, the title and the legend label are updated, and the layout is
+    worked out again for them, before saving, so that each plot is laid out
+    just as create_student_plot_buffer lays it out.
 
-    Returns:
-        dict: A dictionary of subject to marks.
+    Args:
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
     """
-    student_subject_marks = {}
 
-    for index, subject in enumerate(subjects):
-        student_subject_marks[
-            subject
-            ] = format_mark(
-            student_records[index + 3]
+    def __init__(self, class_averages, column_heads):
+        self.key = (tuple(class_averages), tuple(column_heads))
+
+        self.fig = get_pyplot().Figure(figsize=(2.5, 1.1))
+        axis = self.fig.add_subplot()
+        self.axis = axis
+
+        # The margins a new figure starts with, which tight_layout starts from
+        self.default_margins = {
+            name: getattr(self.fig.subplotpars, name)
+            for name in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')
+            }
+
+        # change all the subjects to three characters long
+        # these should be capitalized as well
+        subjects = [subject[:3].upper() for subject in column_heads[3:14]] + ['TOT']
+
+        # The heights of the bars are set for each student
+        self.bars = axis.bar(
+            subjects,
+            [100] * len(subjects),
+            label="Student's Marks",
+            width=0.4,
+            color="gray",
             )
 
-    return student_subject_marks
+        axis.plot(
+            subjects,
+            class_averages,
+            label="Class Averages",
+            color="red",
+            marker='o',
+            markersize=1.3,
+            linewidth=0.5,
+            )
 
-def add_overall_comments(
-        canvass: canvas.Canvas,
-        y_position: int,
-        subjects: list,
-        student_records: list,
-        head_teacher: str,
-        ) -> None:
-    """Add an overall comment to the canvas.
+        axis.set_ylabel(
+            'Performance',
+            fontsize=4,
+            )
 
-    Args:
-        canvass (canvas.Canvas): The canvas object for the PDF file.
-        y_position (int): The y position to start writing comments.
-        subjects (list): A list of subjects.
-        student_records (list): The student's marks.
-        head_teacher (str): Headteacher's information to be displayed on the report form.
+        axis.tick_params(
+            axis='y',
+            which='major',
+            labelsize=3,
+            )
 
-    Returns:
+        axis.set_xticks(subjects)
+
+        axis.set_xticklabels(
+            subjects,
+            fontsize=4,
+            )
+
+        axis.tick_params(
+            axis='x',
+            which='major',
+            pad=1,
+            )
+
+        self.title = axis.set_title(
+            "Student's Marks vs Class Averages",
+            fontsize=4.5,
+            y=0.95,
+            color='#000000',
+            )
+
+        legend = axis.legend(fontsize=3)
+
+        # Keep the legend text of the bars, to be renamed for each student
+        _, labels = axis.get_legend_handles_labels()
+        self.bars_label = legend.get_texts()[labels.index("Student's Marks")]
+
+        # Adjusting the thickness of the frame/spines
+        for spine in axis.spines.values():
+            spine.set_linewidth(0.3)
+
+    def render(self, student_marks) -> io.BytesIO:
+        """This function renders the plot for a single student.
+
+        Args:
+            student_marks (list): A list of the student's marks.
+
+        Returns:
+            io.BytesIO: A buffer containing the plot.
+        """
+        student_name = student_marks[1].split(' ')[0].title()
+        marks = list(student_marks[3:15])
+
+        marks[-1] = int(marks[-1] / 11)
+
+        for bar, mark in zip(self.bars, marks):
+            bar.set_height(mark)
+
+        # Rescale the y axis to the new bars
+        self.axis.relim()
+        self.axis.autoscale_view()
+
+        self.title.set_text(f"{student_name}'s Marks vs Class Averages")
+        self.bars_label.set_text(f"{student_name}'s Marks")
+
+        # The y tick labels and the title depend on the student, so the
+        # margins are fitted to them for each plot, from where a new figure's
+        # margins start, rather than from the last student's
+        self.fig.subplots_adjust(**self.default_margins)
+        self.fig.tight_layout(
+            pad=0.2,
+            w_pad=0.3,
+            h_pad=0.5,
+            )
+
+        buf = io.BytesIO()
+        self.fig.savefig(
+            buf,
+            format='png',
+            dpi=600,
+            )
+
+        buf.seek(0)
+
+        return buf
+
+_plot_renderer = None
+
+def render_student_plot(
+        student_marks,
+        class_averages,
+        column_heads,
+        ):
+    """This function renders a student plot, reusing the figure of the last class.
+
+    This is used by the worker processes, so that each process keeps its own
+    renderer for the class being generated.
+
+    Args:
+        student_marks (list): A list of the student's marks.
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
+
+    Returns:
+        io.BytesIO: A buffer containing the plot.
+    """
+    global _plot_renderer  # pylint: disable=global-statement
+
+    key = (tuple(class_averages), tuple(column_heads))
+    if _plot_renderer is None or _plot_renderer.key != key:
+        _plot_renderer = StudentPlotRenderer(
+            class_averages,
+            column_heads,
+            )
+
+    return _plot_renderer.render(student_marks)
+
+def render_student_plots(
+        students_marks,
+        class_averages,
+        column_heads,
+        ):
+    """This function renders the plots of a batch of students in a worker process.
+
+    Args:
+        students_marks (list): A list of each student's marks.
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
+
+    Returns:
+        list: A buffer containing the plot for each student.
+    """
+    return [
+        render_student_plot(student_marks, class_averages, column_heads)
+        for student_marks in students_marks
+        ]
+
+def get_chart_ticks(max_value: float, min_value: float = 0) -> list:
+    """This function returns evenly spaced ticks for the y axis of a chart.
+
+    Args:
+        max_value (float): The top of the y axis.
+        min_value (float): The bottom of the y axis, below zero for negative marks.
+
+    Returns:
+        list: The tick values from the bottom up to the top of the y axis,
+            one of them zero.
+    """
+    span = max_value - min_value
+    if span <= 0:
+        return [0, 1]
+
+    # Pick the smallest 'nice' step giving at most six ticks
+    magnitude = 10 ** math.floor(math.log10(span))
+    for step in (0.1, 0.2, 0.25, 0.5, 1, 2, 2.5, 5, 10):
+        step *= magnitude
+        if span / step <= 5:
+            break
+
+    return [
+        index * step
+        for index in range(math.ceil(min_value / step), math.floor(max_value / step) + 1)
+        ]
+
+def get_legend_position(
+        plot_box: tuple,
+        legend_size: tuple,
+        bar_boxes: list,
+        points: list,
+        ) -> tuple:
+    """This function picks the corner of a chart to put its legend in.
+
+    Like matplotlib's 'best' location, the corner covering the fewest bars
+    and class average markers is picked, trying the upper right, upper left,
+    lower left and lower right corners in turn.
+
+    Args:
+        plot_box (tuple): The left, bottom, right and top of the plot.
+        legend_size (tuple): The width and height of the legend.
+        bar_boxes (list): The left, bottom, right and top of each bar.
+        points (list): The x and y of each class average marker.
+
+    Returns:
+        tuple: The x and y of the bottom left corner of the legend.
+    """
+    left, bottom, right, top = plot_box
+    legend_width, legend_height = legend_size
+
+    def count_covered(position):
+        legend_x, legend_y = position
+        covered_bars = sum(
+            1 for bar_left, bar_bottom, bar_right, bar_top in bar_boxes
+            if bar_left < legend_x + legend_width and legend_x < bar_right
+            and bar_bottom < legend_y + legend_height and legend_y < bar_top
+            )
+        covered_points = sum(
+            1 for point_x, point_y in points
+            if legend_x <= point_x <= legend_x + legend_width
+            and legend_y <= point_y <= legend_y + legend_height
+            )
+        return covered_bars + covered_points
+
+    corners = [
+        (right - LEGEND_MARGIN - legend_width, top - LEGEND_MARGIN - legend_height),
+        (left + LEGEND_MARGIN, top - LEGEND_MARGIN - legend_height),
+        (left + LEGEND_MARGIN, bottom + LEGEND_MARGIN),
+        (right - LEGEND_MARGIN - legend_width, bottom + LEGEND_MARGIN),
+        ]
+
+    # The first corner wins a tie
+    return min(corners, key=count_covered)
+
+def draw_student_chart(
+        canvass: canvas.Canvas,
+        position: tuple,
+        student_marks: list,
+        class_averages: list,
+        column_heads: list,
+        ) -> None:
+    """This function draws a chart of student marks directly on the canvas.
+
+    This draws the same chart as create_student_plot_buffer, but with vector
+    graphics, which is faster than rendering an image and keeps the PDF small.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        position (tuple): The x, y, width and height of the chart.
+        student_marks (list): A list of the student's marks.
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
+
+    Returns:
+        None
+    """
+    _x, _y, width, height = position
+
+    student_name = student_marks[1].split(' ')[0].title()
+    marks = list(student_marks[3:15])
+
+    marks[-1] = int(marks[-1] / 11)
+
+    class_averages = [
+        float(average) if isinstance(average, (int, float)) else 0
+        for average in class_averages
+        ]
+
+    # change all the subjects to three characters long
+    subjects = [subject[:3].upper() for subject in column_heads[3:14]] + ['TOT']
+
+    # Leave room for the title, the axis label and the tick labels
+    plot_left = _x + 30
+    plot_bottom = _y + 14
+    plot_width = width - 34
+    plot_height = height - 36
+
+    # Leave a margin above the tallest bar, and below the lowest
+    # negative mark, like matplotlib does
+    y_max = max(marks + class_averages + [1]) * 1.05
+    y_min = min(marks + class_averages + [0]) * 1.05
+    ticks = get_chart_ticks(y_max, y_min)
+    y_scale = plot_height / (y_max - y_min)
+    zero_y = plot_bottom - y_min * y_scale
+    slot_width = plot_width / len(subjects)
+
+    canvass.saveState()
+
+    # Draw the y axis ticks and labels
+    canvass.setFont("Helvetica", 7)
+    canvass.setLineWidth(0.7)
+    canvass.setStrokeColor(colors.black)
+    for tick in ticks:
+        tick_y = zero_y + tick * y_scale
+        canvass.line(plot_left - 3, tick_y, plot_left, tick_y)
+        canvass.drawRightString(plot_left - 4, tick_y - 2.5, f"{tick:g}")
+
+    # Draw the y axis title
+    canvass.saveState()
+    canvass.translate(_x + 6, plot_bottom + plot_height / 2)
+    canvass.rotate(90)
+    canvass.setFont("Helvetica", 9.5)
+    canvass.drawCentredString(0, 0, 'Performance')
+    canvass.restoreState()
+
+    # Draw the student's bars and the subject labels, a negative
+    # mark as a bar down from zero
+    bar_boxes = []
+    canvass.setFillColor(colors.gray)
+    for index, mark in enumerate(marks):
+        centre = plot_left + slot_width * (index + 0.5)
+        canvass.rect(
+            centre - slot_width * 0.2,
+            zero_y,
+            slot_width * 0.4,
+            mark * y_scale,
+            stroke=0,
+            fill=1,
+            )
+        bar_boxes.append((
+            centre - slot_width * 0.2,
+            min(zero_y, zero_y + mark * y_scale),
+            centre + slot_width * 0.2,
+            max(zero_y, zero_y + mark * y_scale),
+            ))
+    canvass.setFillColor(colors.black)
+    canvass.setFont("Helvetica", 9.5)
+    for index, subject in enumerate(subjects):
+        centre = plot_left + slot_width * (index + 0.5)
+        canvass.drawCentredString(centre, plot_bottom - 10, subject)
+
+    # Draw the class averages as a red line with markers
+    points = [
+        (plot_left + slot_width * (index + 0.5), zero_y + average * y_scale)
+        for index, average in enumerate(class_averages)
+        ]
+    canvass.setStrokeColor(colors.red)
+    canvass.setFillColor(colors.red)
+    canvass.setLineWidth(1.2)
+    canvass.lines([
+        (*start, *end) for start, end in zip(points, points[1:])
+        ])
+    for point_x, point_y in points:
+        canvass.circle(point_x, point_y, 1.5, stroke=0, fill=1)
+
+    # Draw the frame around the plot
+    canvass.setStrokeColor(colors.black)
+    canvass.setLineWidth(0.7)
+    canvass.rect(plot_left, plot_bottom, plot_width, plot_height)
+
+    # Draw the title
+    canvass.setFillColor(colors.black)
+    canvass.setFont("Helvetica", 10.5)
+    canvass.drawCentredString(
+        plot_left + plot_width / 2,
+        plot_bottom + plot_height + 4,
+        f"{student_name}'s Marks vs Class Averages",
+        )
+
+    # Draw the legend on a white box, in the corner it covers the least of
+    labels = (f"{student_name}'s Marks", "Class Averages")
+    legend_size = (
+        max(canvass.stringWidth(label, "Helvetica", 7) for label in labels) + 20,
+        22,
+        )
+    legend_x, legend_y = get_legend_position(
+        (plot_left, plot_bottom, plot_left + plot_width, plot_bottom + plot_height),
+        legend_size,
+        bar_boxes,
+        points,
+        )
+    canvass.setFillColor(colors.white)
+    canvass.setStrokeColor(colors.lightgrey)
+    canvass.setLineWidth(0.5)
+    canvass.rect(legend_x, legend_y, *legend_size, stroke=1, fill=1)
+    canvass.setFont("Helvetica", 7)
+    canvass.setFillColor(colors.gray)
+    canvass.rect(legend_x + 4, legend_y + 13, 10, 5, stroke=0, fill=1)
+    canvass.setStrokeColor(colors.red)
+    canvass.setLineWidth(1.2)
+    canvass.line(legend_x + 4, legend_y + 6, legend_x + 14, legend_y + 6)
+    canvass.setFillColor(colors.black)
+    canvass.drawString(legend_x + 18, legend_y + 13, labels[0])
+    canvass.drawString(legend_x + 18, legend_y + 4, labels[1])
+
+    canvass.restoreState()
+
+def iter_student_plot_buffers(
+        students: list,
+        class_averages: list,
+        column_heads: list,
+        processes: int = 1,
+        ):
+    """This function yields a plot buffer for each student, in the original order.
+
+    When more than one process is given, the plots are rendered in parallel in
+    worker processes, since rendering the plots takes most of the time. Only
+    PLOT_BATCHES_PER_PROCESS batches of PLOT_BATCH_SIZE students per process
+    are handed to the workers ahead of the plots being taken, so that the
+    rendered plots waiting to be drawn do not grow with the size of the class.
+
+    Args:
+        students (list): A list of the students' formatted records.
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
+        processes (int): The number of worker processes to render the plots with.
+
+    Yields:
+        io.BytesIO: A buffer containing the plot for each student.
+    """
+    student_marks = [student[:15] for student in students]
+
+    if not student_marks:
+        return
+
+    if processes <= 1:
+        renderer = StudentPlotRenderer(
+            class_averages,
+            column_heads,
+            )
+        for marks in student_marks:
+            yield renderer.render(marks)
+        return
+
+    max_pending = processes * PLOT_BATCHES_PER_PROCESS
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        for start in range(0, len(student_marks), PLOT_BATCH_SIZE):
+            if len(pending) == max_pending:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(
+                render_student_plots,
+                student_marks[start:start + PLOT_BATCH_SIZE],
+                class_averages,
+                column_heads,
+                ))
+
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_cached_plot_buffers(
+        students: list,
+        class_averages: list,
+        column_heads: list,
+        processes: int = 1,
+        render_cache: RenderCache = None,
+        ):
+    """This function yields a plot for each student, only rendering the changed ones.
+
+    Each plot is keyed by the fingerprint of the student's marks, the class
+    averages and the column heads. The plots already in the cache are not
+    rendered again. They are read from the cache as they are needed, and a
+    plot removed from the cache in the meantime is rendered after all.
+
+    Args:
+        students (list): A list of the students' formatted records.
+        class_averages (list): A list of the class averages.
+        column_heads (list): A list of the column heads.
+        processes (int): The number of worker processes to render the plots with.
+        render_cache (RenderCache): The cache of rendered plots, if any.
+
+    Yields:
+        io.BytesIO: A buffer containing the plot for each student.
+    """
+    if render_cache is None:
+        yield from iter_student_plot_buffers(
+            students,
+            class_averages,
+            column_heads,
+            processes,
+            )
+        return
+
+    keys = [
+        fingerprint(student[:15], class_averages, column_heads)
+        for student in students
+        ]
+
+    # Whether each plot is cached is only checked once, so that the rendered
+    # plots stay in step with the students they were rendered for, even when
+    # the same plot is stored in the meantime, e.g. for two identical rows
+    cached = [('plots', key) in render_cache for key in keys]
+
+    rendered = iter_student_plot_buffers(
+        [student for student, is_cached in zip(students, cached) if not is_cached],
+        class_averages,
+        column_heads,
+        processes,
+        )
+
+    for student, key, is_cached in zip(students, keys, cached):
+        plot_data = render_cache.get('plots', key) if is_cached else None
+        if plot_data is not None:
+            yield io.BytesIO(plot_data)
+            continue
+
+        if is_cached:
+            plot_buffer = next(iter_student_plot_buffers(
+                [student],
+                class_averages,
+                column_heads,
+                ))
+        else:
+            plot_buffer = next(rendered)
+        render_cache.put('plots', key, plot_buffer.getvalue())
+        yield plot_buffer
+
+def get_subject_marks(
+        subjects: str,
+        student_records: list,
+        ) -> dict:
+    """This function returns a dictionary of subject marks.
+
+    Args:
+        student_records (list): A list of student records.
+
+    Returns:
+        dict: A dictionary of subject to marks.
+    """
+    student_subject_marks = {}
+
+    for index, subject in enumerate(subjects):
+        student_subject_marks[
+            subject
+            ] = student_records[index + 3]
+
+    return student_subject_marks
+
+def add_overall_comments(
+        canvass: canvas.Canvas,
+        y_position: int,
+        subjects: list,
+        student_records: list,
+        head_teacher: str,
+        ) -> None:
+    """Add an overall comment to the canvas.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        y_position (int): The y position to start writing comments.
+        subjects (list): A list of subjects.
+        student_records (list): The student's marks.
+        head_teacher (str): Headteacher's information to be displayed on the report form.
+
+    Returns:
         None
     """
     student_name = ' '.join(student_records[1].split(' ')[:2]).title()
@@ -752,7 +1555,7 @@ def add_overall_comments(
 
     comment = generate_overall_comment(
         get_subject_marks(subjects, student_records),
-        format_mark(student_total_marks),
+        student_total_marks,
         student_name,
         )
 
@@ -764,14 +1567,6 @@ def add_overall_comments(
     #     "Overall Comment:",
     #     )
 
-    # draw rectangle
-    canvass.rect(
-        80,
-        189,
-        450,
-        -63,
-        )
-
     # start position of the text
     text_object = canvass.beginText(
         90,
@@ -788,36 +1583,19 @@ def add_overall_comments(
 
     # Split the comment by words and add them line by line
     overall_comment = "Overall Comment:"
-    words = [overall_comment] + comment.split(' ')
-
-    line = []
+    words = (overall_comment, *comment.split(' '))
 
-    for word in words:
-        # You might need to adjust this length
-        # check for your specific needs
-        if canvass.stringWidth(
-            ' '.join(line + [word]),
+    for line in wrap_words(
+            words,
+            COMMENT_WIDTH,
             "Helvetica",
             12,
-            ) < 430:
-            line.append(word)
-        else:
-            text_object.textLine(' '.join(line))
-            line = [word]
-    if line:
-        text_object.textLine(' '.join(line))
+            ):
+        text_object.textLine(line)
 
     canvass.drawText(text_object)
 
-    # draw rectangle
-    canvass.rect(
-        80,
-        121,
-        450,
-        -63,
-        )
-
-        # start position of the text
+    # start position of the text
     text_object = canvass.beginText(
         90,
         y_position + 5,
@@ -833,167 +1611,1214 @@ def add_overall_comments(
 
     # Split the comment by words and add them line by line
     overall_comment = "Headteacher's Remarks:"
-    words = [overall_comment] + head_teacher.split(' ')
-
-    line = []
+    words = (overall_comment, *head_teacher.split(' '))
 
-    for word in words:
-        # You might need to adjust this length
-        # check for your specific needs
-        if canvass.stringWidth(
-            ' '.join(line + [word]),
+    for line in wrap_words(
+            words,
+            COMMENT_WIDTH,
             "Helvetica",
             12,
-            ) < 430:
-            line.append(word)
-        else:
-            text_object.textLine(' '.join(line))
-            line = [word]
-    if line:
-        text_object.textLine(' '.join(line))
+            ):
+        text_object.textLine(line)
 
     canvass.drawText(text_object)
 
-    # draw two vertical lines
-    canvass.line(
-        50,
-        53,
-        50,
-        704,
-        )
-    canvass.line(
-        562,
-        53,
-        562,
-        704,
-        )
+def iter_student_pages(
+        class_records: list,
+        class_averages: list,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        selected: list = None,
+        ):
+    """This function prepares what is needed to draw each student's page, in order.
 
-    # draw the thinner horizontal line
-    canvass.line(
-        50,
-        53,
-        562,
-        53,
-        )
+    Args:
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        processes (int): The number of worker processes to render the plots with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots, so that only
+            the plots of the students whose data changed are rendered.
+        selected (list): The indexes of the students to prepare the pages of,
+            or None for every student; the plots of the others are neither
+            rendered nor read.
+
+    Yields:
+        tuple: The student's record, subject comments and plot buffer, the
+            plot being None when the chart is drawn on the page.
+    """
+    if chart_backend not in CHART_BACKENDS:
+        raise ValueError(f"Unknown chart backend: {chart_backend}")
 
-    # Drawing the thicker line.
-    canvass.setLineWidth(3)
-    canvass.line(
-        50,
-        50,
-        562,
-        50,
-        )
+    column_heads = list(class_records[0][0])
 
-    # get the line width back to normal
-    canvass.setLineWidth(1)
+    if class_table is None:
+        class_table = ClassTable(class_records[0])
+
+    students = list(class_table.rows())
+    if selected is None:
+        selected = range(len(students))
+    students = [students[index] for index in selected]
+
+    # Generate the subject comments for the whole class at once
+    with time_stage('class_comments'):
+        class_comments = generate_class_subject_comments(
+            np.column_stack((
+                class_table.marks[selected],
+                class_table.totals[selected],
+                )),
+            )
 
-def generate_pdf(
-        title_records: list,
-        class_records: list,
+    if chart_backend == 'matplotlib':
+        plot_buffers = iter_cached_plot_buffers(
+            students,
+            class_averages[1],
+            column_heads,
+            processes,
+            render_cache,
+            )
+    else:
+        plot_buffers = repeat(None)
+
+    for student, comments in zip(students, class_comments):
+        # The plots are rendered lazily, or by the worker processes,
+        # so this is the time spent waiting for each one
+        with time_stage('chart_render'):
+            plot_buffer = next(plot_buffers)
+
+        yield student, comments, plot_buffer
+
+        # The page has been drawn, so the plot can be let go of straight away
+        if plot_buffer is not None:
+            plot_buffer.close()
+
+def draw_student_page(
+        canvass: canvas.Canvas,
+        y_position: int,
+        student_page: tuple,
         class_averages: list,
-        output_path: str,
-        number_of_students: int,
+        class_details: tuple,
         ) -> None:
-    """This function generates a PDF file for all the students.
+    """This function draws the details, marks, comments and chart of a student.
 
     Args:
-        title_records (list): A list of tuples containing the title details.
-        class_records (list): A list of tuples containing the class marks.
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        y_position (int): The y position below the title details.
+        student_page (tuple): The student's record, subject comments and plot
+            buffer or path, as yielded by iter_student_pages.
         class_averages (list): A list of tuples containing the class average marks.
-        output_path (str): The path to the output PDF file.
-        number_of_students (int): The number of students in the class.
+        class_details (tuple): The number of students, the column heads, the
+            class table and the marks table drawn in the page frame.
 
     Returns:
         None
     """
-    (
-        school_name,
-        class_name,
-        term_name
-        ) = title_records
-
-    column_heads = list(class_records[0][0])
-
-    canvass = canvas.Canvas(
-        output_path,
-        pagesize=letter,
-        )
-
     width, height = letter
 
-    for student in class_records[0][1:-3]:
-        # Start a new page for the student
-        y_position = start_new_page(
-            canvass,
-            width,
-            height,
-            [
-                school_name,
-                class_name,
-                term_name,
-                ],
-            class_records[1],
-            )
+    student, comments, plot_buffer = student_page
+    number_of_students, column_heads, class_table, marks_table = class_details
 
-        # Change any None values to 0
-        def format_student_marks(student):
-            """This function formats student's details, replaces None with zero."""
-            for index, item in enumerate(student):
-                if item is None:
-                    student[index] = 0
-
-        student = list(student)
-
-        format_student_marks(student)
-
-        # Step 1: Generate student details first
-        # y_offset = y_position - 70
-        # # Adjust this as needed
+    # Step 1: Generate student details first
+    # y_offset = y_position - 70
+    # # Adjust this as needed
+    with time_stage('student_table'):
         y_position = generate_student_report(
             canvass,
-            y_position - 70,
+            y_position - STUDENT_DETAILS_OFFSET,
             student[:16],
             class_averages[0],
             (
                 number_of_students,
                 column_heads,
-                class_records[0][-1][0],
+                class_table.class_teacher,
             ),
+            comments,
+            marks_table,
             ) - 210
 
-        # Step 3: Add overall comment to the student
+    # Step 3: Add overall comment to the student
+    with time_stage('comments'):
         add_overall_comments(
             canvass,
             y_position - 38,
             column_heads[3:14],
             student[:15],
             # The headteacher's comment
-            class_records[0][-2][0],
+            class_table.head_teacher,
             )
 
-        # img = ImageReader(
-        #     create_student_plot_buffer(
-        #     student,
-        #     class_records[-2][3:9],
-        #     )
-        # )
+    # For example, 10% from the left edge
+    # Adjust width and height as needed
+    chart_position = (
+        (width * 0.1) + 10,
+        y_position - 24,
+        width * 0.7,
+        height * 0.235,
+        )
 
-        # y_position -= 210  # Adjust this as needed
-        # For example, 10% from the left edge
-        # Adjust width and height as needed
-        canvass.drawImage(
-            ImageReader(
-            create_student_plot_buffer(
-            student[:15],
-            class_averages[1],
-            column_heads,
+    with time_stage('chart'):
+        if plot_buffer is None:
+            draw_student_chart(
+                canvass,
+                chart_position,
+                student[:15],
+                class_averages[1],
+                column_heads,
+                )
+        else:
+            canvass.drawImage(
+                ImageReader(plot_buffer),
+                chart_position[0],
+                chart_position[1],
+                width=chart_position[2],
+                height=chart_position[3],
+                )
+
+def draw_class_report(
+        canvass: canvas.Canvas,
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        number_of_students: int,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        prefix: str = '',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        blank_first_page: bool = True,
+        ) -> None:
+    """This function draws the pages for all the students of a class.
+
+    Args:
+        canvass (canvas.Canvas): The canvas object for the PDF file.
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        number_of_students (int): The number of students in the class.
+        processes (int): The number of worker processes to render the plots with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        prefix (str): A prefix for the form names, to tell the classes apart
+            when several are in the same PDF file.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots, so that only
+            the plots of the students whose data changed are rendered.
+        blank_first_page (bool): Whether the first student's page follows a
+            blank page, as it does at the start of every PDF file.
+
+    Returns:
+        None
+    """
+    if class_table is None:
+        class_table = ClassTable(class_records[0])
+
+    width, height = letter
+
+    column_heads = list(class_records[0][0])
+    marks_table = MarksTable(column_heads[3:15], class_averages[0])
+
+    class_details = (
+        number_of_students,
+        column_heads,
+        class_table,
+        marks_table,
+        )
+
+    page_frame = register_page_frame(
+        canvass,
+        width,
+        height,
+        title_records,
+        class_records[1],
+        prefix,
+        marks_table,
+        )
+
+    for index, student_page in enumerate(iter_student_pages(
+            class_records,
+            class_averages,
+            processes,
+            chart_backend,
+            class_table,
+            render_cache,
+            )):
+        # Start a new page for the student
+        y_position = start_new_page(
+            canvass,
+            page_frame,
+            show_page=index > 0 or blank_first_page,
             )
-        ),
-            (width * 0.1) + 10,
-            y_position - 24,
-            width=width * 0.7,
-            height=height * 0.235,
+
+        draw_student_page(
+            canvass,
+            y_position,
+            student_page,
+            class_averages,
+            class_details,
             )
 
+def get_page_keys(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        number_of_students: int,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        ) -> list:
+    """This function returns the fingerprint of everything on each student's page.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        number_of_students (int): The number of students in the class.
+        chart_backend (str): Either 'matplotlib' or 'reportlab'.
+        class_table (ClassTable): The class's student records as columns.
+
+    Returns:
+        list: The key each student's page is cached by, in order.
+    """
+    # Everything on a page, other than the student's row
+    school_logo = class_records[1]
+    page_details = (
+        chart_backend,
+        list(title_records),
+        fingerprint_image(school_logo[0]) if school_logo else None,
+        class_averages,
+        number_of_students,
+        list(class_records[0][0]),
+        class_table.class_teacher,
+        class_table.head_teacher,
+        )
+
+    return [
+        fingerprint(student, page_details)
+        for student in class_table.rows()
+        ]
+
+@functools.lru_cache(maxsize=1)
+def can_split_pages() -> bool:
+    """This function checks that the PDF files ReportLab writes can be split into pages.
+
+    Returns:
+        bool: Whether a PDF file of two pages sharing a form splits into two,
+            see split_pages; False if ReportLab writes them otherwise, e.g.
+            with compressed object streams.
+    """
+    buf = io.BytesIO()
+    canvass = canvas.Canvas(
+        buf,
+        pagesize=letter,
+        )
+    canvass.beginForm('frame')
+    canvass.rect(10, 10, 100, 100)
+    canvass.endForm()
+    for _ in range(2):
+        canvass.doForm('frame')
+        canvass.showPage()
+    canvass.save()
+
+    try:
+        return len(split_pages(buf.getvalue())) == 2
+    except PdfFormatError:
+        return False
+
+def draw_page_part(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        class_details: tuple,
+        student_pages,
+        page_keys: list,
+        render_cache: RenderCache = None,
+        ) -> list:
+    """This function draws the pages of some of the students on one canvas.
+
+    The logos and the page frame are registered once for all the pages,
+    rather than encoded again for each student. The PDF file is then split
+    into a PDF file for each student, see split_pages, which is stored in
+    the render cache. If ReportLab's PDF files cannot be split, each page is
+    drawn on a canvas of its own instead, see can_split_pages.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        class_details (tuple): The number of students, the column heads, the
+            class table and the marks table, as for draw_student_page.
+        student_pages (iterable): The pages to draw, as yielded by iter_student_pages.
+        page_keys (list): The key of each page, see get_page_keys.
+        render_cache (RenderCache): The cache to store the pages in, if any.
+
+    Returns:
+        list: The contents of the PDF file of each student, in order.
+    """
+    if can_split_pages():
+        page_files = split_pages(draw_pages(
+            title_records,
+            class_records,
+            class_averages,
+            class_details,
+            student_pages,
+            ))
+    else:
+        page_files = [
+            draw_pages(
+                title_records,
+                class_records,
+                class_averages,
+                class_details,
+                [student_page],
+                )
+            for student_page in student_pages
+            ]
+
+    if render_cache is not None:
+        for page_key, pdf_data in zip(page_keys, page_files):
+            render_cache.put('pages', page_key, pdf_data)
+
+    return page_files
+
+def draw_pages(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        class_details: tuple,
+        student_pages,
+        ) -> bytes:
+    """This function draws the pages of some of the students into one PDF file.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        class_details (tuple): The number of students, the column heads, the
+            class table and the marks table, as for draw_student_page.
+        student_pages (iterable): The pages to draw, as yielded by iter_student_pages.
+
+    Returns:
+        bytes: The contents of the PDF file.
+    """
+    width, height = letter
+
+    buf = io.BytesIO()
+
+    canvass = canvas.Canvas(
+        buf,
+        pagesize=letter,
+        )
+
+    page_frame = register_page_frame(
+        canvass,
+        width,
+        height,
+        title_records,
+        class_records[1],
+        marks_table=class_details[3],
+        )
+
+    for index, student_page in enumerate(student_pages):
+        y_position = start_new_page(
+            canvass,
+            page_frame,
+            show_page=index > 0,
+            )
+
+        draw_student_page(
+            canvass,
+            y_position,
+            student_page,
+            class_averages,
+            class_details,
+            )
+
+    with time_stage('pdf_save'):
+        canvass.save()
+
+    return buf.getvalue()
+
+def draw_page_part_in_worker(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        class_details: tuple,
+        selected: list,
+        page_keys: list,
+        chart_backend: str = 'matplotlib',
+        render_cache: RenderCache = None,
+        ) -> list:
+    """This function draws a part of the pages in a worker process, see draw_page_part.
+
+    The plots of the part are rendered in the same worker process.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        class_details (tuple): See draw_page_part.
+        selected (list): The indexes of the students to draw.
+        page_keys (list): The key of each selected student's page, see get_page_keys.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+
+    Returns:
+        list: The contents of the PDF file of each selected student, in order.
+    """
+    try:
+        return draw_page_part(
+            title_records,
+            class_records,
+            class_averages,
+            class_details,
+            iter_student_pages(
+                class_records,
+                class_averages,
+                chart_backend=chart_backend,
+                class_table=class_details[2],
+                render_cache=render_cache,
+                selected=selected,
+                ),
+            page_keys,
+            render_cache,
+            )
+    finally:
+        # The metrics of the worker process are only seen once written
+        flush()
+
+def iter_drawn_pages(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        class_details: tuple,
+        selected: list,
+        page_keys: list,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        render_cache: RenderCache = None,
+        low_memory: bool = False,
+        ):
+    """This function draws the pages of some of the students, yielding each in order.
+
+    With a single process, the pages are drawn together on one canvas, see
+    draw_page_part. With more, they are split into a part for each process,
+    each drawn with its plots by a worker process, and the parts are
+    yielded in order as they are finished; only PAGE_PARTS_PER_PROCESS parts
+    per process are handed to the workers ahead of the parts being yielded.
+    In the low-memory mode, the parts are of LOW_MEMORY_PART_SIZE students,
+    each on a canvas of its own, so that no more than a few parts are held
+    at a time.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        class_details (tuple): See draw_page_part.
+        selected (list): The indexes of the students to draw.
+        page_keys (list): The key of each selected student's page, see get_page_keys.
+        processes (int): The number of worker processes to draw the pages with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+        low_memory (bool): Whether to draw the pages in parts.
+
+    Yields:
+        bytes: The contents of the PDF file of each selected student.
+    """
+    if not selected:
+        return
+
+    if low_memory:
+        part_size = LOW_MEMORY_PART_SIZE
+    else:
+        part_size = -(-len(selected) // max(processes, 1))
+    part_starts = range(0, len(selected), part_size)
+
+    if processes <= 1:
+        student_pages = iter_student_pages(
+            class_records,
+            class_averages,
+            chart_backend=chart_backend,
+            class_table=class_details[2],
+            render_cache=render_cache,
+            selected=selected,
+            )
+
+        for start in part_starts:
+            yield from draw_page_part(
+                title_records,
+                class_records,
+                class_averages,
+                class_details,
+                islice(student_pages, part_size),
+                page_keys[start:start + part_size],
+                render_cache,
+                )
+        return
+
+    max_pending = processes * PAGE_PARTS_PER_PROCESS
+
+    with ProcessPoolExecutor(max_workers=min(processes, len(part_starts))) as executor:
+        pending = deque()
+        for start in part_starts:
+            if len(pending) == max_pending:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(
+                draw_page_part_in_worker,
+                title_records,
+                class_records,
+                class_averages,
+                class_details,
+                selected[start:start + part_size],
+                page_keys[start:start + part_size],
+                chart_backend,
+                render_cache,
+                ))
+
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_student_pdfs(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        number_of_students: int,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        low_memory: bool = False,
+        ):
+    """This function generates a PDF file for each student, in order.
+
+    With a render cache, each student's PDF is keyed by the fingerprint of
+    everything on the page, see get_page_keys, and only the students whose
+    data or class averages changed since the last upload are drawn again;
+    the plots of the others are neither rendered nor read. The pages that
+    are not cached are drawn together, or in parts by worker processes, see
+    iter_drawn_pages.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        number_of_students (int): The number of students in the class.
+        processes (int): The number of worker processes to draw the pages with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+        low_memory (bool): Whether to draw the pages in parts, so that the
+            memory used does not grow with the number of students.
+
+    Yields:
+        tuple: The student's ID and name, and the contents of their PDF file.
+    """
+    if chart_backend not in CHART_BACKENDS:
+        raise ValueError(f"Unknown chart backend: {chart_backend}")
+
+    if class_table is None:
+        class_table = ClassTable(class_records[0])
+
+    column_heads = list(class_records[0][0])
+    class_details = (
+        number_of_students,
+        column_heads,
+        class_table,
+        MarksTable(column_heads[3:15], class_averages[0]),
+        )
+
+    page_keys = get_page_keys(
+        title_records,
+        class_records,
+        class_averages,
+        number_of_students,
+        chart_backend,
+        class_table,
+        )
+
+    # Whether each page is cached is only checked once, as for the plots,
+    # so that the pages drawn stay in step with their students
+    missing = [
+        index for index, page_key in enumerate(page_keys)
+        if render_cache is None or ('pages', page_key) not in render_cache
+        ]
+
+    drawn_pages = iter_drawn_pages(
+        title_records,
+        class_records,
+        class_averages,
+        class_details,
+        missing,
+        [page_keys[index] for index in missing],
+        processes,
+        chart_backend,
+        render_cache,
+        low_memory,
+        )
+
+    missing = set(missing)
+    for index, (student, page_key) in enumerate(zip(class_table.rows(), page_keys)):
+        if index in missing:
+            pdf_data = next(drawn_pages)
+        else:
+            pdf_data = render_cache.get('pages', page_key)
+
+            # The page was removed from the cache since it was checked
+            if pdf_data is None:
+                pdf_data = next(iter_drawn_pages(
+                    title_records,
+                    class_records,
+                    class_averages,
+                    class_details,
+                    [index],
+                    [page_key],
+                    chart_backend=chart_backend,
+                    render_cache=render_cache,
+                    ))
+
+        yield f"{student[0]}_{student[1]}", pdf_data
+
+@functools.lru_cache(maxsize=1)
+def get_blank_page() -> bytes:
+    """This function returns a PDF file of a single blank page.
+
+    Returns:
+        bytes: The contents of the PDF file.
+    """
+    buf = io.BytesIO()
+    canvass = canvas.Canvas(
+        buf,
+        pagesize=letter,
+        )
+    # Saving an empty canvas would leave out the page
+    canvass.showPage()
     canvass.save()
+    return buf.getvalue()
+
+def splice_class_pages(
+        concatenator: PdfConcatenator,
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        number_of_students: int,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        blank_first_page: bool = True,
+        low_memory: bool = False,
+        ) -> None:
+    """This function appends the cached PDF file of each student, drawing the missing ones.
+
+    The pages are the ones iter_student_pdfs writes for the PDF per student,
+    so that re-uploading a sheet after fixing a mark only draws the pages of
+    the students whose data or class averages changed. Those are drawn on a
+    single canvas, so the logos and the page frame are only encoded once,
+    and the fonts, the page frame and the logo every page has are only
+    written to the PDF file once, see PdfConcatenator.
+
+    Args:
+        concatenator (PdfConcatenator): The PDF file to append the pages to.
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        number_of_students (int): The number of students in the class.
+        processes (int): The number of worker processes to draw the pages with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+        blank_first_page (bool): Whether the first page of the PDF file
+            follows a blank page, as it does on a single canvas.
+        low_memory (bool): Whether to draw the missing pages in parts, see
+            iter_drawn_pages.
+
+    Returns:
+        None
+    """
+    if blank_first_page and not concatenator.page_numbers:
+        concatenator.append_data(get_blank_page())
+
+    for _, pdf_data in iter_student_pdfs(
+            title_records,
+            class_records,
+            class_averages,
+            number_of_students,
+            processes,
+            chart_backend,
+            class_table=class_table,
+            render_cache=render_cache,
+            low_memory=low_memory,
+            ):
+        concatenator.append_data(pdf_data)
+
+def draw_class_report_in_parts(
+        concatenator: PdfConcatenator,
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        number_of_students: int,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        ) -> None:
+    """This function draws the pages of a class in parts, appending each when finished.
+
+    Each part of LOW_MEMORY_PART_SIZE students is drawn on a canvas of its own
+    and saved to a temporary file, which is appended to the PDF file and
+    removed, so that ReportLab never holds more than one part in memory.
+
+    Args:
+        concatenator (PdfConcatenator): The PDF file to append the parts to.
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        number_of_students (int): The number of students in the class.
+        processes (int): The number of worker processes to render the plots with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots, so that only
+            the plots of the students whose data changed are rendered.
+
+    Returns:
+        None
+    """
+    if class_table is None:
+        class_table = ClassTable(class_records[0])
+
+    width, height = letter
+
+    column_heads = list(class_records[0][0])
+    marks_table = MarksTable(column_heads[3:15], class_averages[0])
+
+    class_details = (
+        number_of_students,
+        column_heads,
+        class_table,
+        marks_table,
+        )
+
+    student_pages = iter_student_pages(
+        class_records,
+        class_averages,
+        processes,
+        chart_backend,
+        class_table,
+        render_cache,
+        )
+
+    for _ in range(0, len(class_table), LOW_MEMORY_PART_SIZE):
+        file_descriptor, part_path = tempfile.mkstemp(
+            suffix='.pdf',
+            dir=os.path.dirname(os.path.abspath(concatenator.output_path)),
+            )
+        os.close(file_descriptor)
+
+        try:
+            canvass = canvas.Canvas(
+                part_path,
+                pagesize=letter,
+                )
+
+            page_frame = register_page_frame(
+                canvass,
+                width,
+                height,
+                title_records,
+                class_records[1],
+                marks_table=marks_table,
+                )
+
+            for index, student_page in enumerate(islice(student_pages, LOW_MEMORY_PART_SIZE)):
+                # As with a single canvas, only the first page of the PDF file
+                # follows a blank page
+                y_position = start_new_page(
+                    canvass,
+                    page_frame,
+                    show_page=index > 0 or not concatenator.page_numbers,
+                    )
+
+                draw_student_page(
+                    canvass,
+                    y_position,
+                    student_page,
+                    class_averages,
+                    class_details,
+                    )
+
+            with time_stage('pdf_save'):
+                canvass.save()
+
+            concatenator.append(part_path)
+        finally:
+            os.remove(part_path)
+
+def generate_pdf(
+        title_records: list,
+        class_records: list,
+        class_averages: list,
+        output_path: str,
+        number_of_students: int,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        class_table: ClassTable = None,
+        render_cache: RenderCache = None,
+        low_memory: bool = False,
+        blank_first_page: bool = True,
+        ) -> None:
+    """This function generates a PDF file for all the students.
+
+    In the low-memory mode, the pages are drawn in parts of LOW_MEMORY_PART_SIZE
+    students, each written out to the PDF file as soon as it is finished, and
+    each plot is let go of as soon as its page is drawn. The memory used then
+    no longer grows with the number of students: drawing the pages takes at
+    most LOW_MEMORY_CEILING_MIB of the chart backend, on top of the class's
+    records.
+
+    With a render cache, each student's page is spliced in from the cache
+    instead, and only the pages that changed are drawn, see
+    splice_class_pages; in the low-memory mode, these are drawn in parts too.
+    If a PDF file cannot be spliced, e.g. after a change to how ReportLab
+    writes them, the class is drawn directly on a single canvas instead.
+
+    Args:
+        title_records (list): A list of tuples containing the title details.
+        class_records (list): A list of tuples containing the class marks.
+        class_averages (list): A list of tuples containing the class average marks.
+        output_path (str): The path to the output PDF file.
+        number_of_students (int): The number of students in the class.
+        processes (int): The number of worker processes to draw the pages with,
+            or without a render cache, to render the plots with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        class_table (ClassTable): The class's student records as columns, built
+            from class_records if not given.
+        render_cache (RenderCache): The cache of rendered plots and pages, so
+            that only the students whose data changed are drawn.
+        low_memory (bool): Whether to draw the PDF file in parts, for very
+            large classes.
+        blank_first_page (bool): Whether the PDF file starts with a blank page;
+            it is left out of a class joined onto another, as in
+            draw_classes_in_parallel. Ignored in the low-memory mode without
+            a render cache.
+
+    Returns:
+        None
+    """
+    try:
+        if render_cache is not None:
+            with PdfConcatenator(output_path) as concatenator:
+                splice_class_pages(
+                    concatenator,
+                    title_records,
+                    class_records,
+                    class_averages,
+                    number_of_students,
+                    processes,
+                    chart_backend,
+                    class_table=class_table,
+                    render_cache=render_cache,
+                    blank_first_page=blank_first_page,
+                    low_memory=low_memory,
+                    )
+            return
+
+        if low_memory:
+            with PdfConcatenator(output_path) as concatenator:
+                draw_class_report_in_parts(
+                    concatenator,
+                    title_records,
+                    class_records,
+                    class_averages,
+                    number_of_students,
+                    processes,
+                    chart_backend,
+                    class_table=class_table,
+                    )
+            return
+    except PdfFormatError:
+        # The PDF file written so far is replaced by the one drawn below
+        pass
+
+    canvass = canvas.Canvas(
+        output_path,
+        pagesize=letter,
+        )
+
+    draw_class_report(
+        canvass,
+        title_records,
+        class_records,
+        class_averages,
+        number_of_students,
+        processes,
+        chart_backend,
+        class_table=class_table,
+        blank_first_page=blank_first_page,
+        )
+
+    with time_stage('pdf_save'):
+        canvass.save()
+
+def generate_combined_pdf(
+        classes: list,
+        output_path: str,
+        processes: int = 1,
+        chart_backend: str = 'matplotlib',
+        render_cache: RenderCache = None,
+        low_memory: bool = False,
+        ) -> None:
+    """This function generates a single PDF file for the students of several classes.
+
+    With more than one process, each class is drawn into a PDF file of its
+    own by a worker process, see draw_classes_in_parallel, and the files are
+    joined in the order of the classes. Otherwise, and in the low-memory
+    mode, where drawing several classes at once would multiply the memory
+    used, the classes are drawn one after another. With a render cache, the
+    cached pages of the students are spliced in, see splice_class_pages. If
+    a PDF file cannot be joined, the classes are drawn directly on a single
+    canvas instead, as in generate_pdf.
+
+    Args:
+        classes (list): A list of the title records, class records, class
+            averages, number of students and class table of each class, as
+            for generate_pdf.
+        output_path (str): The path to the output PDF file.
+        processes (int): The number of worker processes to draw the classes with,
+            or, when they are drawn one after another, to render the plots with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        render_cache (RenderCache): The cache of rendered plots and pages, so
+            that only the students whose data changed are drawn.
+        low_memory (bool): Whether to write the PDF file in parts, for very
+            large classes, see generate_pdf.
+
+    Returns:
+        None
+    """
+    try:
+        if processes > 1 and len(classes) > 1 and not low_memory:
+            draw_classes_in_parallel(
+                classes,
+                output_path,
+                processes,
+                chart_backend,
+                render_cache,
+                )
+            return
+
+        if render_cache is not None:
+            with PdfConcatenator(output_path) as concatenator:
+                for (
+                        title_records,
+                        class_records,
+                        class_averages,
+                        number_of_students,
+                        class_table,
+                        ) in classes:
+                    splice_class_pages(
+                        concatenator,
+                        title_records,
+                        class_records,
+                        class_averages,
+                        number_of_students,
+                        processes,
+                        chart_backend,
+                        class_table=class_table,
+                        render_cache=render_cache,
+                        low_memory=low_memory,
+                        )
+            return
+
+        if low_memory:
+            with PdfConcatenator(output_path) as concatenator:
+                for (
+                        title_records,
+                        class_records,
+                        class_averages,
+                        number_of_students,
+                        class_table,
+                        ) in classes:
+                    draw_class_report_in_parts(
+                        concatenator,
+                        title_records,
+                        class_records,
+                        class_averages,
+                        number_of_students,
+                        processes,
+                        chart_backend,
+                        class_table=class_table,
+                        )
+            return
+    except PdfFormatError:
+        # The PDF file written so far is replaced by the one drawn below
+        pass
+
+    canvass = canvas.Canvas(
+        output_path,
+        pagesize=letter,
+        )
+
+    for index, (
+            title_records,
+            class_records,
+            class_averages,
+            number_of_students,
+            class_table,
+            ) in enumerate(classes):
+        draw_class_report(
+            canvass,
+            title_records,
+            class_records,
+            class_averages,
+            number_of_students,
+            processes,
+            chart_backend,
+            prefix=f'class{index}_',
+            class_table=class_table,
+            )
+
+    with time_stage('pdf_save'):
+        canvass.save()
+
+def generate_class_part(*args, **kwargs) -> None:
+    """This function generates a class's PDF file in a worker process.
+
+    Args:
+        *args: The arguments for generate_pdf.
+        **kwargs: The keyword arguments for generate_pdf.
+
+    Returns:
+        None
+    """
+    try:
+        generate_pdf(*args, **kwargs)
+    finally:
+        # The metrics of the worker process are only seen once written
+        flush()
+
+def generate_class_parts(
+        classes: list,
+        part_paths: list,
+        processes: int,
+        chart_backend: str = 'matplotlib',
+        render_cache: RenderCache = None,
+        low_memory_students: int = None,
+        joined: bool = False,
+        ):
+    """This function generates the PDF file of each class in a worker process.
+
+    The classes are drawn in parallel, each with its plots rendered in the
+    same worker process, and the path of each class's PDF file is yielded
+    in the order of the classes, as soon as it and the classes before it
+    are finished.
+
+    Args:
+        classes (list): The details of each class, see generate_combined_pdf.
+        part_paths (list): The path to write each class's PDF file to.
+        processes (int): The number of worker processes to draw the classes with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+        low_memory_students (int): The number of students from which a class
+            is drawn in the low-memory mode, or None for never.
+        joined (bool): Whether the PDF files are to be joined into one, so
+            that only the first class's pages follow a blank page, as on a
+            single canvas.
+
+    Yields:
+        str: The path of the next class's PDF file.
+    """
+    with ProcessPoolExecutor(max_workers=min(processes, len(classes))) as executor:
+        futures = [
+            executor.submit(
+                generate_class_part,
+                title_records,
+                class_records,
+                class_averages,
+                part_path,
+                number_of_students,
+                chart_backend=chart_backend,
+                class_table=class_table,
+                render_cache=render_cache,
+                low_memory=(
+                    low_memory_students is not None
+                    and number_of_students >= low_memory_students
+                    ),
+                blank_first_page=not joined or index == 0,
+                )
+            for index, (part_path, (
+                title_records,
+                class_records,
+                class_averages,
+                number_of_students,
+                class_table,
+                )) in enumerate(zip(part_paths, classes))
+            ]
+
+        for future, part_path in zip(futures, part_paths):
+            future.result()
+            yield part_path
+
+def draw_classes_in_parallel(
+        classes: list,
+        output_path: str,
+        processes: int,
+        chart_backend: str = 'matplotlib',
+        render_cache: RenderCache = None,
+        ) -> None:
+    """This function draws each class in a worker process, and joins the PDF files.
+
+    Each class is drawn into a temporary file of its own, see
+    generate_class_parts. The files are appended to the output with
+    PdfConcatenator in the order of the classes, each as soon as it and the
+    classes before it are finished, and then removed.
+
+    Args:
+        classes (list): The details of each class, see generate_combined_pdf.
+        output_path (str): The path to the output PDF file.
+        processes (int): The number of worker processes to draw the classes with.
+        chart_backend (str): Either 'matplotlib' to embed the charts as images,
+            or 'reportlab' to draw them directly as vector graphics.
+        render_cache (RenderCache): The cache of rendered plots and pages.
+
+    Returns:
+        None
+    """
+    part_paths = []
+    for _ in classes:
+        file_descriptor, part_path = tempfile.mkstemp(
+            suffix='.pdf',
+            dir=os.path.dirname(os.path.abspath(output_path)),
+            )
+        os.close(file_descriptor)
+        part_paths.append(part_path)
+
+    try:
+        with PdfConcatenator(output_path) as concatenator:
+            for part_path in generate_class_parts(
+                    classes,
+                    part_paths,
+                    processes,
+                    chart_backend,
+                    render_cache,
+                    joined=True,
+                    ):
+                concatenator.append(part_path)
+                os.remove(part_path)
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
@@ -0,0 +1,126 @@
+"""Tests for the charts pdf_generator.py draws with ReportLab"""
+
+import io
+import unittest
+
+from reportlab.lib import colors
+from reportlab.pdfgen import canvas
+
+from pdf_generator import draw_student_chart, get_chart_ticks
+
+
+# The column heads of a class, as read from the spreadsheet
+COLUMN_HEADS = ['ID', 'Name', 'Gender'] + [f'Subject {index}' for index in range(11)] + ['Total']
+
+# The x, y, width and height the chart is drawn at
+CHART_POSITION = (50, 300, 400, 250)
+
+
+class RecordingCanvas(canvas.Canvas):
+    """A canvas that keeps the rectangles and strings drawn on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rects = []
+        self.strings = []
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self.rects.append((self._fillColorObj, (x, y, width, height)))
+        super().rect(x, y, width, height, stroke=stroke, fill=fill)
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        self.strings.append((text, (x, y)))
+        super().drawString(x, y, text, *args, **kwargs)
+
+
+def draw_chart(marks: list) -> RecordingCanvas:
+    """Draw the chart of a student with the given marks, and return the canvas."""
+    canvass = RecordingCanvas(io.BytesIO())
+    draw_student_chart(
+        canvass,
+        CHART_POSITION,
+        [1, 'amina wanjiru', 'Female'] + marks,
+        [50] * 12,
+        COLUMN_HEADS,
+        )
+    return canvass
+
+def overlaps(first: tuple, second: tuple) -> bool:
+    """Return whether two rectangles, as x, y, width and height, overlap."""
+    def span(rect):
+        x, y, width, height = rect
+        return min(x, x + width), min(y, y + height), max(x, x + width), max(y, y + height)
+
+    first_left, first_bottom, first_right, first_top = span(first)
+    second_left, second_bottom, second_right, second_top = span(second)
+    return (
+        first_left < second_right and second_left < first_right
+        and first_bottom < second_top and second_bottom < first_top
+        )
+
+
+class TestGetChartTicks(unittest.TestCase):
+    """Tests for the ticks of the y axis."""
+
+    def test_ticks(self):
+        """Test that the ticks run from zero in even steps."""
+        self.assertEqual(get_chart_ticks(105), [0, 25, 50, 75, 100])
+        self.assertEqual(get_chart_ticks(0), [0, 1])
+
+    def test_negative_ticks(self):
+        """Test that the ticks go below zero for a negative mark."""
+        self.assertEqual(get_chart_ticks(10.5, -10.5), [-10, -5, 0, 5, 10])
+
+
+class TestDrawStudentChart(unittest.TestCase):
+    """Tests for drawing a student's chart with ReportLab."""
+
+    def get_bars(self, canvass):
+        """Return the bars of the student's marks drawn on the canvas."""
+        return [rect for color, rect in canvass.rects if color == colors.gray][:12]
+
+    def test_bar_heights(self):
+        """Test that the bars are as tall as the marks, a negative one below zero."""
+        marks = [10, 20, -15, 30, 40, 50, 60, 70, 80, 90, 95, 660]
+        bars = self.get_bars(draw_chart(marks))
+
+        # The total is drawn as the average of the 11 subjects
+        heights = [height for _, _, _, height in bars]
+        scale = heights[0] / marks[0]
+        for height, mark in zip(heights, marks[:11] + [60]):
+            self.assertAlmostEqual(height, mark * scale)
+
+        # Every bar starts at zero
+        self.assertEqual(len({y for _, y, _, _ in bars}), 1)
+
+    def test_legend_clear_of_bars(self):
+        """Test that the legend is put in a corner with no bars under it."""
+        for marks in (
+                [10, 10, 10, 10, 95, 95, 95, 95, 95, 95, 95, 1089],
+                [95, 95, 95, 95, 95, 95, 95, 95, 10, 10, 10, 110],
+                ):
+            canvass = draw_chart(marks)
+            legend_box = next(rect for color, rect in canvass.rects if color == colors.white)
+
+            for bar in self.get_bars(canvass):
+                self.assertFalse(overlaps(legend_box, bar))
+
+            labels = [text for text, _ in canvass.strings]
+            self.assertEqual(labels, ["Amina's Marks", "Class Averages"])
+
+    def test_legend_boxed_over_bars(self):
+        """Test that the legend is drawn on a box when every corner has bars."""
+        canvass = draw_chart([99] * 11 + [1089])
+
+        # The box is drawn over the bars and the plot's frame,
+        # and the legend on top of it
+        fill_colors = [color for color, _ in canvass.rects]
+        self.assertEqual(fill_colors[13:], [colors.white, colors.gray])
+        legend_box = canvass.rects[13][1]
+        self.assertTrue(any(overlaps(legend_box, bar) for bar in self.get_bars(canvass)))
+        for _, position in canvass.strings:
+            self.assertTrue(overlaps(legend_box, position + (1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
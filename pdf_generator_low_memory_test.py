@@ -0,0 +1,79 @@
+"""Tests for the low-memory mode of pdf_generator.py"""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import pdf_generator
+from benchmark import read_class, run_stage, write_class_workbook
+from pdf_generator import LOW_MEMORY_CEILING_MIB, generate_pdf
+from render_cache import RenderCache
+
+
+class TestLowMemoryMode(unittest.TestCase):
+    """Tests for generating the PDF of a very large class in bounded memory."""
+
+    def generate_pdf(self, number_of_students, chart_backend, processes):
+        """Generate the PDF of a class in the low-memory mode, with a render cache as in the app, and measure it."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            file_path = os.path.join(output_dir, "class.xlsx")
+            write_class_workbook(file_path, number_of_students)
+
+            # A fresh process, so that the peak memory is only this stage's
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(
+                    run_stage,
+                    'generate_pdf_cached',
+                    file_path,
+                    {
+                        'chart_backend': chart_backend,
+                        'processes': processes,
+                        'low_memory': True,
+                        'output_dir': output_dir,
+                    },
+                    ).result()
+
+        return result['peak_memory_mib'] - result['baseline_memory_mib']
+
+    def test_peak_memory_ceiling(self):
+        """Test that the pages take no more than the documented ceiling."""
+        self.assertLess(
+            self.generate_pdf(1000, 'reportlab', 1),
+            LOW_MEMORY_CEILING_MIB['reportlab'],
+            )
+
+    def test_peak_memory_ceiling_with_workers(self):
+        """Test that the pages stay within the ceiling with the plots rendered by workers."""
+        self.assertLess(
+            self.generate_pdf(200, 'matplotlib', 2),
+            LOW_MEMORY_CEILING_MIB['matplotlib'],
+            )
+
+    def test_cached_pages_drawn_in_parts(self):
+        """Test that the pages missing from the render cache are drawn in parts."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            file_path = os.path.join(output_dir, "class.xlsx")
+            write_class_workbook(file_path, 5)
+            class_details = read_class(file_path)
+
+            with mock.patch.object(pdf_generator, 'LOW_MEMORY_PART_SIZE', 2), mock.patch(
+                    'pdf_generator.register_page_frame',
+                    wraps=pdf_generator.register_page_frame,
+                    ) as register_page_frame:
+                generate_pdf(
+                    *class_details[:3],
+                    os.path.join(output_dir, "class.pdf"),
+                    class_details[3],
+                    chart_backend='reportlab',
+                    class_table=class_details[4],
+                    render_cache=RenderCache(os.path.join(output_dir, "render_cache")),
+                    low_memory=True,
+                    )
+
+        self.assertEqual(register_page_frame.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
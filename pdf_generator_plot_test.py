@@ -0,0 +1,74 @@
+"""Tests for the plots pdf_generator.py renders with matplotlib"""
+
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from PIL import Image, ImageChops
+
+from benchmark import read_class, write_class_workbook
+from pdf_generator import (
+    PLOT_BATCH_SIZE,
+    PLOT_BATCHES_PER_PROCESS,
+    StudentPlotRenderer,
+    create_student_plot_buffer,
+    iter_student_plot_buffers,
+    )
+
+
+class TestStudentPlotRenderer(unittest.TestCase):
+    """Tests for rendering the plots of a class with a single figure."""
+
+    def test_same_as_new_figure(self):
+        """Test that each plot is the same image as one drawn on a new figure."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "class.xlsx")
+            write_class_workbook(file_path, 4)
+            _, class_records, class_averages, _, class_table = read_class(file_path)
+
+        column_heads = list(class_records[0][0])
+        renderer = StudentPlotRenderer(class_averages[1], column_heads)
+
+        for student in class_table.rows():
+            reused = Image.open(renderer.render(student[:15]))
+            new = Image.open(create_student_plot_buffer(
+                student[:15],
+                class_averages[1],
+                column_heads,
+                ))
+            self.assertIsNone(ImageChops.difference(
+                reused.convert('RGB'),
+                new.convert('RGB'),
+                ).getbbox())
+
+
+class TestIterStudentPlotBuffers(unittest.TestCase):
+    """Tests for rendering the plots of a class in worker processes."""
+
+    def test_plots_rendered_ahead_bounded(self):
+        """Test that the workers are only given a few batches ahead of the plots taken."""
+        rendered = []
+
+        def render_names(students_marks, class_averages, column_heads):
+            rendered.extend(students_marks)
+            return [io.BytesIO(marks[1].encode()) for marks in students_marks]
+
+        students = [(index, f"Student {index}") for index in range(100)]
+        max_ahead = 2 * PLOT_BATCHES_PER_PROCESS * PLOT_BATCH_SIZE
+
+        # Threads instead of processes, so that the plots rendered can be counted
+        with mock.patch('pdf_generator.ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch('pdf_generator.render_student_plots', render_names):
+            plot_buffers = iter_student_plot_buffers(students, [], [], processes=2)
+            for taken, plot_buffer in enumerate(plot_buffers, 1):
+                self.assertEqual(plot_buffer.getvalue(), f"Student {taken - 1}".encode())
+                self.assertLessEqual(len(rendered) - taken, max_ahead)
+
+        self.assertEqual(len(rendered), len(students))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""This module contains a disk cache of what has been rendered for each student."""
+
+import hashlib
+import os
+import tempfile
+
+
+# How much the rendered files may take on disk, in bytes
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Bump this whenever the layout of the report forms changes,
+# so that nothing rendered with the old layout is reused
+RENDER_VERSION = 3
+
+
+def fingerprint(*parts) -> str:
+    """This function returns a fingerprint of the data something is rendered from.
+
+    Args:
+        *parts: The data, made of plain Python values, e.g. a student's row
+            and the class averages it is compared against.
+
+    Returns:
+        str: A hex digest that changes whenever any of the data changes.
+    """
+    return hashlib.sha256(repr((RENDER_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+def fingerprint_image(image) -> str:
+    """This function returns a fingerprint of an image's pixels.
+
+    Args:
+        image (PIL.Image.Image): The image, e.g. the school logo.
+
+    Returns:
+        str: A hex digest that changes whenever the image changes.
+    """
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(repr((image.mode, image.size)).encode('utf-8'))
+    return digest.hexdigest()
+
+class RenderCache:
+    """This class stores rendered plots and pages on disk, by fingerprint.
+
+    When a teacher fixes a mark and uploads the spreadsheet again, only the
+    students whose fingerprints changed need to be rendered again. The cache
+    only holds paths, so it can be sent to worker processes.
+
+    Once the files take more than max_bytes, the ones used least recently
+    are removed by evict. Reading a file marks it as used by updating its
+    modification time. A file may be removed at any time, so it is only
+    ever read with get.
+
+    Args:
+        folder (str): The directory to store the rendered files in.
+        max_bytes (int): How much the files may take, in bytes.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def get_path(self, kind: str, key: str) -> str:
+        """This function returns the path a rendered file is stored at.
+
+        Args:
+            kind (str): The kind of file, e.g. 'plots' or 'pages'.
+            key (str): The fingerprint of the data it is rendered from.
+
+        Returns:
+            str: The path to the file.
+        """
+        return os.path.join(self.folder, kind, key[:2], key)
+
+    def __contains__(self, kind_and_key: tuple) -> bool:
+        return os.path.exists(self.get_path(*kind_and_key))
+
+    def get(self, kind: str, key: str) -> bytes:
+        """This function returns a rendered file, or None if it is not cached.
+
+        Args:
+            kind (str): The kind of file, e.g. 'plots' or 'pages'.
+            key (str): The fingerprint of the data it is rendered from.
+
+        Returns:
+            bytes: The contents of the file.
+        """
+        path = self.get_path(kind, key)
+        try:
+            with open(path, 'rb') as cached_file:
+                data = cached_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, kind: str, key: str, data: bytes) -> None:
+        """This function stores a rendered file.
+
+        The file is written under a temporary name and then renamed, so that
+        jobs running at the same time never read a partly written file.
+
+        Args:
+            kind (str): The kind of file, e.g. 'plots' or 'pages'.
+            key (str): The fingerprint of the data it is rendered from.
+            data (bytes): The contents of the file.
+
+        Returns:
+            None
+        """
+        path = self.get_path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+
+    def evict(self) -> None:
+        """This function removes the least recently used files, until the rest fit.
+
+        The whole folder is scanned, so this is called once a job is finished
+        rather than for each file stored.
+
+        Returns:
+            None
+        """
+        entries = []
+        for directory, _, file_names in os.walk(self.folder):
+            for file_name in file_names:
+                # Files still being written by other jobs are left alone
+                if file_name.endswith('.tmp'):
+                    continue
+
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            # Another job may have removed it already
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -0,0 +1,155 @@
+"""Tests for render_cache.py"""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from pdf_generator import iter_cached_plot_buffers
+from render_cache import RenderCache, fingerprint, fingerprint_image
+
+
+class TestFingerprint(unittest.TestCase):
+    """Tests for fingerprinting the data pages are rendered from."""
+
+    def test_fingerprint(self):
+        """Test that only the same data has the same fingerprint."""
+        student = [1, "John Doe", "Male", 78, 82, 90]
+        averages = [81.5, 81.25, 45]
+
+        self.assertEqual(
+            fingerprint(student, averages),
+            fingerprint(list(student), list(averages)),
+            )
+        self.assertNotEqual(
+            fingerprint(student, averages),
+            fingerprint(student[:-1] + [91], averages),
+            )
+        self.assertNotEqual(
+            fingerprint(student, averages),
+            fingerprint(student, averages[:-1] + [45.5]),
+            )
+
+    def test_fingerprint_image(self):
+        """Test that images are fingerprinted by their pixels."""
+        red = Image.new('RGB', (4, 4), 'red')
+
+        self.assertEqual(
+            fingerprint_image(red),
+            fingerprint_image(Image.new('RGB', (4, 4), 'red')),
+            )
+        self.assertNotEqual(
+            fingerprint_image(red),
+            fingerprint_image(Image.new('RGB', (4, 4), 'blue')),
+            )
+
+
+class TestRenderCache(unittest.TestCase):
+    """Tests for storing rendered files by fingerprint."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.render_cache = RenderCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """Test that a stored file is returned, and a missing one is None."""
+        key = fingerprint('student')
+
+        self.assertNotIn(('pages', key), self.render_cache)
+        self.assertIsNone(self.render_cache.get('pages', key))
+
+        self.render_cache.put('pages', key, b'%PDF-1.4')
+
+        self.assertIn(('pages', key), self.render_cache)
+        self.assertNotIn(('plots', key), self.render_cache)
+        self.assertEqual(self.render_cache.get('pages', key), b'%PDF-1.4')
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.render_cache.get_path('pages', key))),
+            [key],
+            )
+
+    def test_least_recently_used_evicted(self):
+        """Test that the files used least recently are removed once the cache is full."""
+        for name in ('first', 'second', 'third'):
+            self.render_cache.put('plots', fingerprint(name), b'x' * 100)
+        for mtime, name in enumerate(('second', 'first', 'third')):
+            os.utime(self.render_cache.get_path('plots', fingerprint(name)), (mtime, mtime))
+
+        self.render_cache.max_bytes = 250
+        self.render_cache.evict()
+
+        self.assertNotIn(('plots', fingerprint('second')), self.render_cache)
+        self.assertIn(('plots', fingerprint('first')), self.render_cache)
+        self.assertIn(('plots', fingerprint('third')), self.render_cache)
+
+
+def render_names(students, *_):
+    """Render each student's plot as their name, to tell the plots apart."""
+    for student in students:
+        yield io.BytesIO(student[1].encode('utf-8'))
+
+
+class TestIterCachedPlotBuffers(unittest.TestCase):
+    """Tests for rendering only the plots that are not cached."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.render_cache = RenderCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_plots(self, students):
+        """Return the contents of the plot yielded for each student."""
+        plots = []
+        with mock.patch('pdf_generator.iter_student_plot_buffers', render_names):
+            for plot in iter_cached_plot_buffers(
+                    students,
+                    [50] * 12,
+                    ['ID', 'Name', 'Gender'],
+                    render_cache=self.render_cache,
+                    ):
+                plots.append(plot.getvalue())
+        return plots
+
+    def test_identical_rows(self):
+        """Test that each student gets their own plot when two rows are the same."""
+        students = [
+            [1, 'Amina', 'Female', 70],
+            [1, 'Amina', 'Female', 70],
+            [2, 'Baraka', 'Male', 60],
+            ]
+
+        self.assertEqual(self.get_plots(students), [b'Amina', b'Amina', b'Baraka'])
+
+        # The second time, all the plots come from the cache
+        students.append([3, 'Chebet', 'Female', 80])
+        self.assertEqual(
+            self.get_plots(students),
+            [b'Amina', b'Amina', b'Baraka', b'Chebet'],
+            )
+
+    def test_evicted_plot_rendered(self):
+        """Test that a plot removed from the cache after being found is rendered."""
+        students = [[1, 'Amina', 'Female', 70], [2, 'Baraka', 'Male', 60]]
+        self.get_plots(students)
+
+        # Amina's plot is removed between being found and being read
+        evicted_key = fingerprint(students[0][:15], [50] * 12, ['ID', 'Name', 'Gender'])
+        get = self.render_cache.get
+
+        def get_after_eviction(kind, key):
+            return None if key == evicted_key else get(kind, key)
+
+        with mock.patch.object(self.render_cache, 'get', get_after_eviction):
+            self.assertEqual(self.get_plots(students), [b'Amina', b'Baraka'])
+
+
+if __name__ == '__main__':
+    unittest.main()
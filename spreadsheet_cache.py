@@ -0,0 +1,137 @@
+"""This module contains a disk cache of the classes read from each spreadsheet.
+
+A teacher often uploads the same workbook more than once, e.g. to preview the
+report forms and then to print them a PDF per student, and the workbook's XML
+only needs to be parsed the first time.
+"""
+
+import os
+import pickle
+import tempfile
+import zlib
+
+
+# Bump this whenever what the spreadsheet readers return changes,
+# so that nothing read by the old readers is reused
+SPREADSHEET_CACHE_VERSION = 1
+
+# Written at the start of each file, so that files of another version are not read
+FILE_HEADER = b'SPREADSHEETS %d\n' % SPREADSHEET_CACHE_VERSION
+
+# How much the cached classes may take on disk, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class SpreadsheetCache:
+    """This class stores the classes read from spreadsheets on disk, by key.
+
+    The classes are pickled, with the images as their pixels, and compressed.
+    Once the files take more than max_bytes, the ones used least recently
+    are removed. Reading a file marks it as used by updating its modification
+    time. The folder must only be writable by the app, as the files are
+    unpickled.
+
+    Args:
+        folder (str): The directory to store the files in.
+        max_bytes (int): How much the files may take, in bytes.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def get_path(self, key: str) -> str:
+        """This function returns the path the classes of a spreadsheet are stored at.
+
+        Args:
+            key (str): The fingerprint of the spreadsheet's content and how it is read.
+
+        Returns:
+            str: The path to the file.
+        """
+        return os.path.join(self.folder, key)
+
+    def get(self, key: str) -> list:
+        """This function returns the classes of a spreadsheet, or None if not cached.
+
+        Args:
+            key (str): The fingerprint of the spreadsheet's content and how it is read.
+
+        Returns:
+            list: A read_spreadsheet tuple for each class.
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as cached_file:
+                data = cached_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        if not data.startswith(FILE_HEADER):
+            return None
+
+        try:
+            return pickle.loads(zlib.decompress(data[len(FILE_HEADER):]))
+        except (zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            # A file that cannot be read is read again from the spreadsheet
+            return None
+
+    def put(self, key: str, spreadsheets: list) -> None:
+        """This function stores the classes of a spreadsheet, removing the least recently used.
+
+        The file is written under a temporary name and then renamed, so that
+        jobs running at the same time never read a partly written file.
+
+        Args:
+            key (str): The fingerprint of the spreadsheet's content and how it is read.
+            spreadsheets (list): A read_spreadsheet tuple for each class.
+
+        Returns:
+            None
+        """
+        data = FILE_HEADER + zlib.compress(
+            pickle.dumps(spreadsheets, protocol=pickle.HIGHEST_PROTOCOL),
+            1,
+            )
+
+        # A spreadsheet too large for the cache is not stored at all
+        if len(data) > self.max_bytes:
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, self.get_path(key))
+
+        self.evict()
+
+    def evict(self) -> None:
+        """This function removes the least recently used files, until the rest fit.
+
+        Returns:
+            None
+        """
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            # Another job may have removed it already
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
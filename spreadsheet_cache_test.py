@@ -0,0 +1,95 @@
+"""Tests for spreadsheet_cache.py"""
+
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from render_cache import fingerprint_image
+from spreadsheet_cache import FILE_HEADER, SpreadsheetCache
+
+
+def make_spreadsheets(logo_color='red'):
+    """Return the classes of a small spreadsheet, as read_workbook does."""
+    class_records = [
+        ("Student ID", "Student Name", "Gender", "English", "Kiswahili"),
+        (1, "Wanjiru Mwangi", "Female", 78, 82.5),
+        ("002", "Otieno Odhiambo", "Male", None, "absent"),
+        ("Averages", None, None, 78, 82.5),
+        ("Headteacher's remarks",),
+        ("Class Teacher",),
+        ]
+    return [(
+        "Sample Primary School",
+        "Grade 6",
+        "Term 1 2024",
+        [class_records, [Image.new('RGBA', (8, 6), logo_color)]],
+        2,
+        )]
+
+
+class TestSpreadsheetCache(unittest.TestCase):
+    """Tests for storing the classes read from spreadsheets by key."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spreadsheet_cache = SpreadsheetCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """Test that the stored classes are returned as read, and a missing key is None."""
+        spreadsheets = make_spreadsheets()
+
+        self.assertIsNone(self.spreadsheet_cache.get('sheet'))
+
+        self.spreadsheet_cache.put('sheet', spreadsheets)
+        cached = self.spreadsheet_cache.get('sheet')
+
+        self.assertEqual(cached[0][:3], spreadsheets[0][:3])
+        self.assertEqual(cached[0][3][0], spreadsheets[0][3][0])
+        self.assertEqual(cached[0][4], 2)
+        self.assertEqual(
+            fingerprint_image(cached[0][3][1][0]),
+            fingerprint_image(spreadsheets[0][3][1][0]),
+            )
+        self.assertEqual(os.listdir(self.temp_dir.name), ['sheet'])
+
+    def test_unreadable_file(self):
+        """Test that a file of another version, or a damaged one, is not read."""
+        self.spreadsheet_cache.put('sheet', make_spreadsheets())
+        path = self.spreadsheet_cache.get_path('sheet')
+
+        with open(path, 'r+b') as cached_file:
+            cached_file.write(b'X')
+        self.assertIsNone(self.spreadsheet_cache.get('sheet'))
+
+        with open(path, 'wb') as cached_file:
+            cached_file.write(FILE_HEADER + b'not compressed')
+        self.assertIsNone(self.spreadsheet_cache.get('sheet'))
+
+    def test_least_recently_used_evicted(self):
+        """Test that the files used least recently are removed once the cache is full."""
+        self.spreadsheet_cache.put('first', make_spreadsheets('red'))
+        file_size = os.path.getsize(self.spreadsheet_cache.get_path('first'))
+        self.spreadsheet_cache.max_bytes = file_size * 2 + file_size // 2
+
+        self.spreadsheet_cache.put('second', make_spreadsheets('green'))
+
+        # The first file is used after the second, so the second is removed
+        os.utime(self.spreadsheet_cache.get_path('first'), (1, 1))
+        os.utime(self.spreadsheet_cache.get_path('second'), (2, 2))
+        self.assertIsNotNone(self.spreadsheet_cache.get('first'))
+
+        self.spreadsheet_cache.put('third', make_spreadsheets('blue'))
+
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)),
+            ['first', 'third'],
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,39 @@
 """This module contains functions for reading spreadsheets."""
 
+import csv
 import io
+import os
+import re
 
 import openpyxl
-from openpyxl.utils import get_column_letter
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.reader.drawings import find_images
+from openpyxl.utils import column_index_from_string, get_column_letter
+# Private to openpyxl; if a release moves or changes it, the rows are read
+# with the public API instead, see SpreadsheetStream.iter_rows
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:  # pragma: no cover
+    WorkSheetParser = None  # pylint: disable=invalid-name
 
 from PIL import Image
 
 
+# The delimiters of the text files that can be read instead of a workbook
+CSV_DELIMITERS = {
+    '.csv': ',',
+    '.tsv': '\t',
+    }
+
+# The cells of a text file that are read as numbers, as a workbook would
+# store them; anything else, e.g. 'NaN', 'Infinity' or '1_000', stays text
+CSV_NUMBER_PATTERN = re.compile(r"^[+-]?\d+(\.\d+)?$")
+
+# The encodings text files are tried in; spreadsheet programs on Windows
+# export CSV files in cp1252, and latin-1 can decode any file
+CSV_ENCODINGS = ('utf-8-sig', 'cp1252', 'latin-1')
+
 def get_hidden_rows(sheet):
     """Return a set of boolean hidden row indices."""
     hidden_rows = set()
@@ -17,27 +43,403 @@ def get_hidden_rows(sheet):
     return hidden_rows
 
 def get_hidden_cols(sheet):
-    """Return a set of boolean hidden column letters."""
+    """Return a set of hidden column letters, from the column dimensions."""
+    hidden_cols = set()
+    for col_dim in sheet.column_dimensions.values():
+        if col_dim.hidden:
+            # A column dimension may cover a range of columns
+            for col_index in range(col_dim.min, col_dim.max + 1):
+                hidden_cols.add(get_column_letter(col_index))
+    return hidden_cols
+
+def is_hidden(attrs):
+    """Return whether the attributes of a parsed row or column mark it hidden."""
+    return attrs is not None and attrs.get('hidden') in ('1', 'true')
+
+def get_hidden_col_indices(column_dimensions):
+    """Return a set of hidden column indices, from parsed column attributes."""
     hidden_cols = set()
-    for col_index in range(1, sheet.max_column + 1):
-        col_letter = get_column_letter(col_index)
-        for row_index in range(1, sheet.max_row + 1):
-            cell = sheet.cell(row=row_index, column=col_index)
-            if not cell.column_letter in hidden_cols and not cell.hidden:
-                break
-        else:
-            hidden_cols.add(col_letter)
+    for attrs in column_dimensions.values():
+        if is_hidden(attrs):
+            hidden_cols.update(
+                range(int(attrs['min']), int(attrs.get('max', attrs['min'])) + 1)
+                )
     return hidden_cols
 
-def read_spreadsheet(file_path):
+def read_sheet_images(archive, worksheet_path):
+    """Return the images of a worksheet, read straight from the workbook file.
+
+    Read-only workbooks do not load any images, so these are read from the
+    drawings of the worksheet instead.
+
+    Args:
+        archive (zipfile.ZipFile): The open workbook file.
+        worksheet_path (str): The path of the worksheet within the workbook file.
+
+    Returns:
+        list: A list of PIL images.
+    """
+    rels_path = get_rels_path(worksheet_path)
+    if rels_path not in archive.namelist():
+        return []
+
+    images = []
+
+    rels = get_dependents(archive, rels_path)
+    for rel in rels.find(SpreadsheetDrawing._rel_type):
+        _, drawing_images = find_images(archive, rel.target)
+        for img_obj in drawing_images:
+            # Check if _data is callable and if so, call it to get image data
+            image_data = img_obj._data() if callable(img_obj._data) else img_obj._data
+            images.append(Image.open(io.BytesIO(image_data)))
+
+    return images
+
+class SpreadsheetStream:
+    """This class reads a spreadsheet lazily, one student record at a time.
+
+    The workbook is opened in read-only mode, so the cells are parsed as the
+    rows are read rather than all being kept in memory. Iterating over the
+    stream yields the student records; the last three rows (class averages,
+    headteacher's remarks and class teacher) are only known once the stream
+    has been read to the end, and are then found in trailer_rows.
+
+    The rows are parsed with openpyxl's private WorkSheetParser, and the
+    sheet's private attributes, so that the hidden rows and columns are
+    found in the same pass. These may change in any release, so if any of
+    them is missing, the sheet is read with the public API instead, see
+    iter_loaded_rows.
+
+    Args:
+        file_path (str): The path to the spreadsheet file.
+        sheet_name (str): The sheet to read, the active sheet if not given.
+        workbook (openpyxl.Workbook): The workbook of file_path, if it is
+            already open in read-only mode. It is then left open for the caller.
+
+    Attributes:
+        school_name (str): The name of the school.
+        class_name (str): The class name.
+        term_name (str): The term name and the year.
+        column_heads (tuple): The column heads of the student records.
+        images (list): Any images in the file.
+        trailer_rows (list): The rows after the student records.
+    """
+
+    # The rows after the student records
+    TRAILER_LENGTH = 3
+
+    # The private attributes of openpyxl the rows are parsed with
+    PRIVATE_SHEET_ATTRIBUTES = ('_get_source', '_shared_strings', '_get_row')
+    PRIVATE_WORKBOOK_ATTRIBUTES = ('epoch', '_date_formats', '_timedelta_formats')
+    PRIVATE_PARSER_ATTRIBUTES = ('parse', 'row_dimensions', 'column_dimensions')
+
+    def __init__(self, file_path, sheet_name=None, workbook=None):
+        self.file_path = file_path
+        self.owns_workbook = workbook is None
+        if workbook is None:
+            workbook = openpyxl.load_workbook(
+                file_path,
+                read_only=True,
+                data_only=True,
+                )
+
+        self.workbook = workbook
+        self.sheet = workbook[sheet_name] if sheet_name else workbook.active
+
+        # Some programs do not save the size of the sheet
+        if self.sheet.max_column is None:
+            self.sheet.reset_dimensions()
+            self.sheet.calculate_dimension(force=True)
+
+        # Extract the constant values from the beginning
+        title_rows = list(
+            self.sheet.iter_rows(
+                min_row=1,
+                max_row=3,
+                max_col=1,
+                values_only=True,
+                )
+            )
+        title_rows += [(None,)] * (3 - len(title_rows))
+
+        (
+            self.school_name,
+            self.class_name,
+            self.term_name,
+            ) = [row[0] for row in title_rows]
+
+        # Check for any logo in the spreadsheet file
+        self.images = read_sheet_images(
+            self.workbook._archive,
+            self.sheet._worksheet_path,
+            )
+
+        self.rows = self.iter_rows()
+        self.column_heads = next(self.rows, None)
+        self.trailer_rows = []
+
+    def iter_rows(self):
+        """Yield the non-empty, visible rows of the sheet, avoiding the first 3 rows."""
+        try:
+            if self.can_parse_rows():
+                rows = self.iter_parsed_rows()
+            else:
+                rows = self.iter_loaded_rows()
+
+            for row in rows:
+                if any(cell is not None for cell in row):
+                    yield row
+        finally:
+            if self.owns_workbook:
+                self.workbook.close()
+
+    def can_parse_rows(self):
+        """Return whether the private parts of openpyxl the rows are parsed with are there."""
+        return (
+            WorkSheetParser is not None
+            and all(hasattr(self.sheet, name) for name in self.PRIVATE_SHEET_ATTRIBUTES)
+            and all(hasattr(self.workbook, name) for name in self.PRIVATE_WORKBOOK_ATTRIBUTES)
+            )
+
+    def iter_parsed_rows(self):
+        """Yield the visible rows of the sheet after the first 3, parsing the worksheet directly.
+
+        The worksheet is parsed here, rather than with iter_rows, so that the
+        hidden rows and columns are known in the same single pass.
+        """
+        with self.sheet._get_source() as source:
+            try:
+                parser = WorkSheetParser(
+                    source,
+                    self.sheet._shared_strings,
+                    data_only=True,
+                    epoch=self.workbook.epoch,
+                    date_formats=self.workbook._date_formats,
+                    timedelta_formats=self.workbook._timedelta_formats,
+                    )
+            except TypeError:
+                parser = None
+
+            if parser is None or not all(
+                    hasattr(parser, name) for name in self.PRIVATE_PARSER_ATTRIBUTES
+                    ):
+                yield from self.iter_loaded_rows()
+                return
+
+            hidden_cols = None
+
+            for row_index, cells in parser.parse():
+                # The columns are described before the first row
+                if hidden_cols is None:
+                    hidden_cols = get_hidden_col_indices(parser.column_dimensions)
+
+                if row_index < 4 or is_hidden(parser.row_dimensions.get(str(row_index))):
+                    continue
+
+                row = self.sheet._get_row(
+                    cells,
+                    1,
+                    self.sheet.max_column,
+                    values_only=True,
+                    )
+
+                if hidden_cols:
+                    row = tuple(
+                        cell for col_index, cell in enumerate(row, start=1)
+                        if col_index not in hidden_cols
+                        )
+
+                yield row
+
+    def iter_loaded_rows(self):
+        """Yield the visible rows of the sheet after the first 3, with openpyxl's public API.
+
+        A read-only sheet does not tell which rows and columns are hidden, so
+        the sheet is loaded in full, as read_spreadsheet does; the memory used
+        then grows with the size of the sheet.
+        """
+        workbook = openpyxl.load_workbook(
+            self.file_path,
+            data_only=True,
+            )
+        sheet = workbook[self.sheet.title]
+
+        hidden_rows = get_hidden_rows(sheet)
+        hidden_cols = {
+            column_index_from_string(col_letter)
+            for col_letter in get_hidden_cols(sheet)
+            }
+
+        for row_index, row in enumerate(
+                sheet.iter_rows(min_row=4, values_only=True),
+                start=4,
+                ):
+            if row_index in hidden_rows:
+                continue
+
+            if hidden_cols:
+                row = tuple(
+                    cell for col_index, cell in enumerate(row, start=1)
+                    if col_index not in hidden_cols
+                    )
+
+            yield row
+
+    def __iter__(self):
+        """Yield the student records, keeping the last rows back as the trailer."""
+        lookahead = []
+
+        for row in self.rows:
+            lookahead.append(row)
+            if len(lookahead) > self.TRAILER_LENGTH:
+                yield lookahead.pop(0)
+
+        self.trailer_rows = lookahead
+
+def parse_csv_value(value):
+    """Return a CSV cell as a number where possible, like a workbook would."""
+    value = value.strip()
+
+    if not value:
+        return None
+
+    # Keep leading zeros, e.g. in student IDs such as 001
+    if len(value) > 1 and value.startswith('0') and value.isdigit():
+        return value
+
+    number_match = CSV_NUMBER_PATTERN.match(value)
+    if number_match is None:
+        return value
+    if number_match.group(1) is None:
+        return int(value)
+    return float(value)
+
+def read_csv(file_path, delimiter=','):
+    """This function reads a CSV or TSV file laid out like the spreadsheets.
+
+    The first three rows hold the school, class and term names, followed by
+    the column heads, the student records and the trailer rows, exactly as in
+    a spreadsheet. This is much faster than reading a workbook. A file that
+    is not UTF-8 is read as cp1252, as exported by Excel on Windows.
+
+    Args:
+        file_path (str): The path to the CSV or TSV file.
+        delimiter (str): The character separating the cells.
+
+    Returns:
+        tuple: The same tuple as read_spreadsheet, without any images.
+    """
+    for encoding in CSV_ENCODINGS:
+        try:
+            with open(file_path, newline='', encoding=encoding) as csv_file:
+                rows = [
+                    tuple(parse_csv_value(value) for value in row)
+                    for row in csv.reader(csv_file, delimiter=delimiter)
+                    ]
+            break
+        except UnicodeDecodeError:
+            continue
+
+    # Pad the rows to the same length, like the rows of a sheet
+    max_column = max((len(row) for row in rows), default=0)
+    rows = [row + (None,) * (max_column - len(row)) for row in rows]
+
+    title_rows = rows[:3] + [(None,)] * (3 - len(rows[:3]))
+
+    class_records = [
+        row for row in rows[3:]
+        if any(cell is not None for cell in row)
+        ]
+
+    return (
+        title_rows[0][0],
+        title_rows[1][0],
+        title_rows[2][0],
+        [
+            class_records,
+            [],
+            ],
+        max(len(class_records) - 4, 0),
+        )
+
+def read_stream(stream):
+    """This function reads a whole SpreadsheetStream into the read_spreadsheet tuple.
+
+    Every student record is kept, as the class averages and positions need
+    all of them before the first report form can be drawn. Reading the rows
+    lazily keeps the memory of openpyxl's cells down, not that of the rows.
+
+    Args:
+        stream (SpreadsheetStream): The stream to read.
+
+    Returns:
+        tuple: The same tuple as read_spreadsheet.
+    """
+    class_records = [
+        stream.column_heads,
+        *stream,
+        *stream.trailer_rows,
+        ]
+
+    return (
+        stream.school_name,
+        stream.class_name,
+        stream.term_name,
+        [
+            class_records,
+            stream.images,
+            ],
+        max(len(class_records) - 4, 0),
+        )
+
+def read_workbook(file_path):
+    """This function reads every class in a workbook, one class per sheet.
+
+    The workbook is only opened and parsed once for all of the sheets. Hidden
+    sheets and sheets without any student records are left out.
+
+    Args:
+        file_path (str): The path to the spreadsheet file.
+
+    Returns:
+        list: A read_spreadsheet tuple for each class.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in CSV_DELIMITERS:
+        return [read_spreadsheet(file_path)]
+
+    workbook = openpyxl.load_workbook(
+        file_path,
+        read_only=True,
+        data_only=True,
+        )
+
+    try:
+        classes = [
+            read_stream(SpreadsheetStream(file_path, sheet.title, workbook))
+            for sheet in workbook.worksheets
+            if sheet.sheet_state == 'visible'
+            ]
+    finally:
+        workbook.close()
+
+    return [
+        class_details for class_details in classes
+        if class_details[4] > 0
+        ]
+
+def read_spreadsheet(file_path, streaming=False):
     """This function reads a spreadsheet and returns the headers and the data.
 
     The spreadsheet is assumed to have the headers in the first row and the
     data in the subsequent rows. Users would need to ensure that the spreadsheet
-    is in this format.
+    is in this format. CSV and TSV files in the same format are also accepted.
 
     Args:
         file_path (str): The path to the spreadsheet file.
+        streaming (bool): Whether to read the rows lazily with SpreadsheetStream,
+            which keeps memory use low for large sheets. All the rows are
+            still returned together, see read_stream.
 
     Returns:
         tuple: A tuple containing the headers and the data.
@@ -47,6 +449,16 @@ def read_spreadsheet(file_path):
             class_records (list): A list of student records and any images in the file.
             number_of_students (int): The number of students in the class.
     """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in CSV_DELIMITERS:
+        return read_csv(
+            file_path,
+            CSV_DELIMITERS[extension],
+            )
+
+    if streaming:
+        return read_stream(SpreadsheetStream(file_path))
+
     # Load the workbook and get the active sheet
     workbook = openpyxl.load_workbook(
         file_path,
@@ -79,7 +491,14 @@ def read_spreadsheet(file_path):
     # Extract student records, avoiding the first 3 rows and the last row
     class_records = []
 
-    for _, row in enumerate(
+    # Hidden rows and columns, e.g. scratch columns, are left out
+    hidden_rows = get_hidden_rows(sheet)
+    hidden_cols = {
+        column_index_from_string(col_letter)
+        for col_letter in get_hidden_cols(sheet)
+        }
+
+    for row_index, row in enumerate(
         sheet.iter_rows(
             min_row=4,
             max_row=sheet.max_row,
@@ -91,16 +510,14 @@ def read_spreadsheet(file_path):
         ):
         # Check if the row is hidden;
         # if so, continue to the next iteration
-        # if row_index in hidden_rows:
-        #     continue
-
-        # visible_cells = []
-        # for col_index, cell in enumerate(row, start=1):
-        #     col_letter = get_column_letter(col_index)
-        #     if col_letter in hidden_cols:
-        #         continue
+        if row_index in hidden_rows:
+            continue
 
-            # visible_cells.append(cell)
+        if hidden_cols:
+            row = tuple(
+                cell for col_index, cell in enumerate(row, start=1)
+                if col_index not in hidden_cols
+                )
 
         if any(cell is not None for cell in row):
             class_records.append(row)
@@ -1,5 +1,7 @@
 """This module tests spreadsheet_reader.py"""
 
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, Mock
 
@@ -8,12 +10,15 @@ import openpyxl
 from spreadsheet_reader import (
     get_hidden_rows,
     get_hidden_cols,
+    parse_csv_value,
     read_spreadsheet,
+    SpreadsheetStream,
+    read_workbook,
     )
 
 # Mocked workbook and worksheet
 mock_workbook = Mock(spec=openpyxl.Workbook)
-mock_worksheet = Mock(spec=openpyxl.Worksheet)
+mock_worksheet = Mock(spec=openpyxl.worksheet.worksheet.Worksheet)
 mock_workbook.active = mock_worksheet
 
 # Mocked data for worksheet
@@ -79,10 +84,167 @@ class TestSpreadsheetFunctions(unittest.TestCase):
 
     def test_get_hidden_cols(self):
         """Test get_hidden_cols function."""
-        mock_worksheet.cell.side_effect = lambda row, column: Mock(hidden=True)
-        mock_worksheet.max_column = 3
+        mock_worksheet.column_dimensions = {
+            "A": Mock(hidden=True, min=1, max=3),
+            "D": Mock(hidden=False, min=4, max=4),
+            }
         cols = get_hidden_cols(mock_worksheet)
         self.assertEqual(cols, {"A", "B", "C"})
 
+
+def write_class_workbook(file_path, number_of_students):
+    """Write a small workbook in the expected layout for the tests."""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["School Name"])
+    sheet.append(["Class Name"])
+    sheet.append(["Term Name"])
+    sheet.append(["Student ID", "Student Name", "Gender", "English", "Total", "Position"])
+    for index in range(number_of_students):
+        sheet.append([index + 1, f"Student {index}", "Male", 50 + index, 50 + index, index + 1])
+    sheet.append([])
+    sheet.append(["Averages", None, None, 51, 51])
+    sheet.append(["Headteacher's remarks"])
+    sheet.append(["Class Teacher"])
+    workbook.save(file_path)
+
+
+class TestSpreadsheetStream(unittest.TestCase):
+    """Tests for reading spreadsheets lazily."""
+
+    def setUp(self):
+        handle, self.file_path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(handle)
+        write_class_workbook(self.file_path, 3)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def test_stream_student_records(self):
+        """Test that the student records and trailer rows are separated."""
+        stream = SpreadsheetStream(self.file_path)
+        self.assertEqual(
+            (stream.school_name, stream.class_name, stream.term_name),
+            ("School Name", "Class Name", "Term Name"),
+            )
+        self.assertEqual(stream.column_heads[:2], ("Student ID", "Student Name"))
+
+        students = list(stream)
+        self.assertEqual([student[1] for student in students], ["Student 0", "Student 1", "Student 2"])
+        self.assertEqual(
+            [row[0] for row in stream.trailer_rows],
+            ["Averages", "Headteacher's remarks", "Class Teacher"],
+            )
+
+    def test_hidden_rows_and_cols(self):
+        """Test that hidden rows and columns are left out in both modes."""
+        workbook = openpyxl.load_workbook(self.file_path)
+        sheet = workbook.active
+        sheet.insert_cols(4)
+        sheet["D4"] = "Scratch"
+        sheet["D5"] = 1000
+        sheet.column_dimensions["D"].hidden = True
+        sheet.row_dimensions[6].hidden = True
+        workbook.save(self.file_path)
+
+        for streaming in (False, True):
+            result = read_spreadsheet(self.file_path, streaming=streaming)
+            class_records = result[3][0]
+            self.assertNotIn("Scratch", class_records[0])
+            self.assertEqual(class_records[1][3], 50)
+            self.assertEqual(
+                [student[1] for student in class_records[1:-3]],
+                ["Student 0", "Student 2"],
+                )
+            self.assertEqual(result[4], 2)
+
+    def test_stream_without_private_parser(self):
+        """Test that a sheet is read the same with openpyxl's public API, if its parser is gone."""
+        workbook = openpyxl.load_workbook(self.file_path)
+        sheet = workbook.active
+        sheet.insert_cols(4)
+        sheet["D4"] = "Scratch"
+        sheet.column_dimensions["D"].hidden = True
+        sheet.row_dimensions[6].hidden = True
+        workbook.save(self.file_path)
+
+        parsed = read_spreadsheet(self.file_path, streaming=True)
+        with patch("spreadsheet_reader.WorkSheetParser", None):
+            self.assertEqual(read_spreadsheet(self.file_path, streaming=True), parsed)
+
+    def test_streaming_matches_full_read(self):
+        """Test that streaming returns the same results as a full read."""
+        self.assertEqual(
+            read_spreadsheet(self.file_path, streaming=True),
+            read_spreadsheet(self.file_path),
+            )
+
+    def test_read_workbook(self):
+        """Test that every sheet with student records is read as a class."""
+        workbook = openpyxl.load_workbook(self.file_path)
+        second_class = workbook.copy_worksheet(workbook.active)
+        second_class["A2"] = "Second Class"
+        workbook.create_sheet("Notes")["A1"] = "Not a class"
+        workbook.save(self.file_path)
+
+        classes = read_workbook(self.file_path)
+        self.assertEqual(
+            [class_details[1] for class_details in classes],
+            ["Class Name", "Second Class"],
+            )
+        self.assertEqual(classes[0][3], classes[1][3])
+
+
+class TestReadCsv(unittest.TestCase):
+    """Tests for reading CSV and TSV files."""
+
+    def setUp(self):
+        handle, self.file_path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(handle)
+        write_class_workbook(self.file_path, 3)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def write_text_file(self, extension, delimiter):
+        """Write the test workbook out as a text file with the given delimiter."""
+        text_path = self.file_path.replace(".xlsx", extension)
+        sheet = openpyxl.load_workbook(self.file_path).active
+        with open(text_path, "w", encoding="utf-8") as text_file:
+            for row in sheet.iter_rows(values_only=True):
+                text_file.write(delimiter.join("" if cell is None else str(cell) for cell in row))
+                text_file.write("\n")
+        self.addCleanup(os.remove, text_path)
+        return text_path
+
+    def test_csv_matches_workbook(self):
+        """Test that CSV and TSV files give the same results as a workbook."""
+        expected = read_spreadsheet(self.file_path)
+        for extension, delimiter in ((".csv", ","), (".tsv", "\t")):
+            self.assertEqual(
+                read_spreadsheet(self.write_text_file(extension, delimiter)),
+                expected,
+                )
+
+    def test_parse_csv_value(self):
+        """Test that only plain numbers are read as numbers."""
+        self.assertEqual(parse_csv_value(" 78 "), 78)
+        self.assertEqual(parse_csv_value("-3"), -3)
+        self.assertEqual(parse_csv_value("82.5"), 82.5)
+        self.assertEqual(parse_csv_value("001"), "001")
+        self.assertIsNone(parse_csv_value(""))
+        for value in ("NaN", "Infinity", "inf", "1_000", "1e3", "absent"):
+            self.assertEqual(parse_csv_value(value), value)
+
+    def test_cp1252_csv(self):
+        """Test that a CSV file exported in cp1252 is read rather than failing."""
+        text_path = self.write_text_file(".csv", ",")
+        with open(text_path, encoding="utf-8") as text_file:
+            text = text_file.read()
+        with open(text_path, "w", encoding="cp1252") as text_file:
+            text_file.write(text.replace("School Name", "St. Zoë’s Primary School"))
+
+        self.assertEqual(read_spreadsheet(text_path)[0], "St. Zoë’s Primary School")
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,66 @@
+"""This module contains the line wrapping of the comments on the report forms.
+
+Each word is measured once with the font's metrics, and each line is the
+width of its words and the spaces between them, rather than the whole line
+being measured again for every word added to it. The lines of each text
+are kept too, as the same text, e.g. the headteacher's remarks, is wrapped
+on every page.
+"""
+
+import functools
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+@functools.lru_cache(maxsize=8192)
+def word_width(word: str, font_name: str, font_size: float) -> float:
+    """This function returns the width of a word in a font.
+
+    Args:
+        word (str): The word, e.g. 'Excellent'.
+        font_name (str): The name of the font, e.g. 'Helvetica'.
+        font_size (float): The size of the font, in points.
+
+    Returns:
+        float: The width of the word, in points.
+    """
+    return stringWidth(word, font_name, font_size)
+
+@functools.lru_cache(maxsize=1024)
+def wrap_words(words: tuple, max_width: float, font_name: str, font_size: float) -> tuple:
+    """This function wraps words into lines narrower than a width.
+
+    A word wider than max_width on its own is put on a line of its own.
+
+    Args:
+        words (tuple): The words, e.g. ('Overall Comment:', 'Wanjiru', 'is', ...).
+            A word may contain spaces, so that it is never split across lines.
+        max_width (float): The width each line must be narrower than, in points.
+        font_name (str): The name of the font, e.g. 'Helvetica'.
+        font_size (float): The size of the font, in points.
+
+    Returns:
+        tuple: The lines, as strings.
+    """
+    space_width = word_width(' ', font_name, font_size)
+
+    lines = []
+    line = []
+    line_width = 0
+
+    for word in words:
+        width = word_width(word, font_name, font_size)
+        width_with_word = line_width + space_width + width if line else width
+
+        if width_with_word < max_width:
+            line.append(word)
+            line_width = width_with_word
+        else:
+            lines.append(' '.join(line))
+            line = [word]
+            line_width = width
+
+    if line:
+        lines.append(' '.join(line))
+
+    return tuple(lines)
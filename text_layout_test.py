@@ -0,0 +1,72 @@
+"""Tests for text_layout.py"""
+
+import unittest
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from text_layout import word_width, wrap_words
+
+
+HEADTEACHER_REMARKS = (
+    "Parents, please review this report with your child, offering guidance "
+    "and support in areas needing improvement. School reopens on 2nd May."
+    )
+
+
+def wrap_by_measuring_lines(words, max_width, font_name, font_size):
+    """Wrap words by measuring each line as it grows, as the report forms did."""
+    lines = []
+    line = []
+    for word in words:
+        if stringWidth(' '.join(line + [word]), font_name, font_size) < max_width:
+            line.append(word)
+        else:
+            lines.append(' '.join(line))
+            line = [word]
+    if line:
+        lines.append(' '.join(line))
+    return tuple(lines)
+
+
+class TestWrapWords(unittest.TestCase):
+    """Tests for wrapping the comments into lines."""
+
+    def test_same_lines_as_measuring_lines(self):
+        """Test that the lines are the ones measuring each line would give."""
+        words = ("Headteacher's Remarks:", *HEADTEACHER_REMARKS.split(' '))
+
+        for max_width in (200, 300, 430):
+            lines = wrap_words(words, max_width, "Helvetica", 12)
+
+            self.assertEqual(
+                lines,
+                wrap_by_measuring_lines(words, max_width, "Helvetica", 12),
+                )
+            for line in lines:
+                self.assertLess(stringWidth(line, "Helvetica", 12), max_width)
+
+    def test_long_word(self):
+        """Test that a word wider than the lines is put on a line of its own."""
+        words = ('Overall Comment:', 'Supercalifragilistic', 'work')
+
+        self.assertEqual(
+            wrap_words(words, 80, "Helvetica", 12),
+            wrap_by_measuring_lines(words, 80, "Helvetica", 12),
+            )
+
+    def test_cached(self):
+        """Test that the lines of a repeated text are only worked out once."""
+        words = ("Headteacher's Remarks:", *HEADTEACHER_REMARKS.split(' '))
+        wrap_words.cache_clear()
+        word_width.cache_clear()
+
+        for _ in range(3):
+            wrap_words(words, 430, "Helvetica", 12)
+
+        self.assertEqual(wrap_words.cache_info().misses, 1)
+        self.assertEqual(wrap_words.cache_info().hits, 2)
+        self.assertEqual(word_width.cache_info().misses, len(set(words)) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""This module contains the streaming of the student PDFs of a job as a ZIP file.
+
+The PDFs are sent as the job writes them, so that a teacher can start
+downloading the PDFs of a large class before all of them are generated.
+"""
+
+import os
+import time
+import zipfile
+
+
+# How long to wait for the next student's PDF when streaming a ZIP file
+STREAM_POLL_INTERVAL = 0.5
+
+# The size of the chunks the student PDFs are copied into the ZIP file in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ZipStream:
+    """This class collects what a ZipFile writes, to be sent in chunks.
+
+    It has no seek or tell methods, so that ZipFile writes the archive
+    sequentially, with the sizes of each file after its data.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        """Collect the data written by the ZipFile."""
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        """There is nothing to flush, the data is sent by pop_chunks."""
+
+    def pop_chunks(self) -> list:
+        """Return the data written since the last call, and forget it."""
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def iter_student_zip(output_dir, poll_job):
+    """This function streams the student PDFs of a job as a ZIP file.
+
+    The PDFs are added to the ZIP file as they are written by the job,
+    and each is sent in chunks, so that neither the ZIP file nor a whole
+    PDF is held in memory. The thread serving the request polls the job
+    every STREAM_POLL_INTERVAL seconds in between, so the app must be
+    served by threaded workers. The job may be run by any process.
+
+    If the job fails, its error is raised before the end of the ZIP file
+    is sent, so that the download fails rather than looking complete.
+
+    Args:
+        output_dir (str): The directory the job writes the PDFs to.
+        poll_job (callable): Returns the job's current details, with its
+            status and, once failed, its error, as returned by get_job.
+
+    Yields:
+        bytes: The next chunk of the ZIP file.
+    """
+    stream = ZipStream()
+    sent = set()
+
+    with zipfile.ZipFile(stream, 'w') as zip_file:
+        while True:
+            # Check before listing, so no PDF is missed when the job finishes
+            job = poll_job()
+            finished = job is None or job['status'] in ('done', 'failed')
+
+            pdf_names = sorted(
+                name for name in os.listdir(output_dir)
+                if name.endswith('.pdf') and name not in sent
+                ) if os.path.isdir(output_dir) else []
+
+            for pdf_name in pdf_names:
+                with open(os.path.join(output_dir, pdf_name), 'rb') as pdf_file, \
+                        zip_file.open(pdf_name, 'w') as zip_entry:
+                    while chunk := pdf_file.read(STREAM_CHUNK_SIZE):
+                        zip_entry.write(chunk)
+                        yield from stream.pop_chunks()
+                sent.add(pdf_name)
+                yield from stream.pop_chunks()
+
+            if finished:
+                break
+
+            time.sleep(STREAM_POLL_INTERVAL)
+
+        if job is None or job['status'] == 'failed':
+            raise RuntimeError(job['error'] if job is not None else 'Job not found')
+
+    # The central directory is written when the ZIP file is closed
+    yield from stream.pop_chunks()
@@ -0,0 +1,74 @@
+"""Tests for zip_stream.py"""
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+from zip_stream import iter_student_zip
+
+
+class TestIterStudentZip(unittest.TestCase):
+    """Tests for streaming the student PDFs of a job as a ZIP file."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.job = {'output_path': self.temp_dir.name, 'status': 'running'}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_pdf(self, name, data):
+        """Write a student PDF into the job's directory, as the job does."""
+        pdf_path = os.path.join(self.temp_dir.name, name)
+        with open(f"{pdf_path}.part", 'wb') as pdf_file:
+            pdf_file.write(data)
+        os.replace(f"{pdf_path}.part", pdf_path)
+
+    def test_pdfs_streamed_while_job_runs(self):
+        """Test that the PDFs written before and after the stream starts are all sent."""
+        self.write_pdf('00001_Grade 6_Wanjiru.pdf', b'%PDF first')
+        with open(os.path.join(self.temp_dir.name, '00002_Grade 6_Otieno.pdf.0123abcd.part'), 'wb') as part_file:
+            part_file.write(b'%PDF partly written')
+
+        def finish_job():
+            self.write_pdf('00002_Grade 6_Otieno.pdf', b'%PDF second')
+            self.job['status'] = 'done'
+
+        chunks = iter_student_zip(self.temp_dir.name, lambda: self.job)
+        with mock.patch('zip_stream.STREAM_POLL_INTERVAL', 0.01):
+            first_chunk = next(chunks)
+
+        thread = threading.Thread(target=finish_job)
+        thread.start()
+        with mock.patch('zip_stream.STREAM_POLL_INTERVAL', 0.01):
+            zip_data = first_chunk + b''.join(chunks)
+        thread.join()
+
+        with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_file:
+            self.assertEqual(
+                zip_file.namelist(),
+                ['00001_Grade 6_Wanjiru.pdf', '00002_Grade 6_Otieno.pdf'],
+                )
+            self.assertEqual(zip_file.read('00002_Grade 6_Otieno.pdf'), b'%PDF second')
+
+    def test_failed_job(self):
+        """Test that a failed job raises its error instead of ending the ZIP file."""
+        self.write_pdf('00001_Grade 6_Wanjiru.pdf', b'%PDF first')
+        self.job.update(status='failed', error='Bad spreadsheet')
+
+        chunks = []
+        with self.assertRaisesRegex(RuntimeError, 'Bad spreadsheet'):
+            for chunk in iter_student_zip(self.temp_dir.name, lambda: self.job):
+                chunks.append(chunk)
+
+        # Without its central directory, the ZIP file cannot be read
+        with self.assertRaises(zipfile.BadZipFile):
+            zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+
+if __name__ == '__main__':
+    unittest.main()